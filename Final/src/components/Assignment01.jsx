@@ -85,7 +85,7 @@ const FileUploadForm = () => {
 
       console.log('Query Response:', response.data);
       
-      // Expecting response in the format: [{ title: "", content: "" }]
+      // Expecting response in the format: [{ id: 0, title: "", snippet: "", score: 0 }]
       setResponseFiles(response.data || []);
       setLoading(false);
       setSubmitSuccess(true);
@@ -102,8 +102,15 @@ const FileUploadForm = () => {
     }
   };
 
-  const downloadFile = (file) => {
-    const blob = new Blob([file.content], { type: 'text/plain' });
+  // Search results only carry a snippet; the full text is fetched by document id
+  const fetchContent = async (file) => {
+    const response = await axios.get(`http://localhost:5000/api/documents/${file.id}`);
+    return response.data.content;
+  };
+
+  const downloadFile = async (file) => {
+    const content = await fetchContent(file);
+    const blob = new Blob([content], { type: 'text/plain' });
     const url = window.URL.createObjectURL(blob);
     const a = document.createElement('a');
     a.href = url;
@@ -223,6 +230,7 @@ const FileUploadForm = () => {
                 </div>
                 <div className="response-file-details">
                   <h4>{file.title || 'Untitled'}</h4>
+                  {file.snippet && <p>{file.snippet}</p>}
                   <div className="response-file-actions">
                     <button 
                       onClick={() => downloadFile(file)}
@@ -231,9 +239,9 @@ const FileUploadForm = () => {
                       Download
                     </button>
                     <button 
-                      onClick={() => {
+                      onClick={async () => {
                         // Could implement a preview modal here
-                        alert(file.content);
+                        alert(await fetchContent(file));
                       }}
                       className="preview-button"
                     >
@@ -0,0 +1,69 @@
+from collections import deque
+from typing import Iterator, List, Set, Tuple
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton matching many patterns in a single pass over a text.
+    """
+
+    def __init__(self, patterns: List[str]):
+        """
+        Build the trie, failure links and merged outputs
+
+        :param patterns: Non-empty patterns; a match reports the pattern's index in this list
+        """
+        self.patterns = patterns
+        self.goto: List[dict] = [{}]
+        self.fail: List[int] = [0]
+        self.outputs: List[Tuple[int, ...]] = [()]
+
+        for pattern_idx, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(())
+                state = next_state
+            self.outputs[state] += (pattern_idx,)
+
+        # Breadth-first so every failure target is finished before its dependents
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] += self.outputs[self.fail[next_state]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Yield (end position, pattern index) for every occurrence of every pattern
+        """
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_idx in outputs[state]:
+                yield position, pattern_idx
+
+    def distinct_matches(self, text: str, limit: int = None) -> Set[int]:
+        """
+        Indices of the patterns occurring in text, stopping early once limit distinct patterns are found
+        """
+        found = set()
+        for _, pattern_idx in self.iter_matches(text):
+            found.add(pattern_idx)
+            if limit is not None and len(found) >= limit:
+                break
+        return found
@@ -0,0 +1,96 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from nltk import word_tokenize, pos_tag
+from nltk.stem import WordNetLemmatizer
+
+FIELD = 'nouns'
+
+NOUN_TAGS = ('NN', 'NNS', 'NNP', 'NNPS')
+
+_lemmatizer = WordNetLemmatizer()
+
+
+def extract_nouns_and_entities(content: str) -> List[str]:
+    """
+    Tokenize, POS tag and lemmatize a text, keeping only nouns and proper nouns.
+    """
+    words = word_tokenize(content.lower())
+    pos_tags = pos_tag(words)
+    nouns = [word for word, pos in pos_tags if pos in NOUN_TAGS]
+    return [_lemmatizer.lemmatize(noun) for noun in nouns]
+
+
+class NounLemmaAnalyzer:
+    """
+    Index analyzer producing noun lemmas, memoized by content hash.
+
+    POS tagging dominates ingest cost, so documents whose exact content was
+    already analyzed reuse the stored lemmas instead of being tagged again.
+    Cached lemmas are interned, so the cache holds one string per distinct
+    lemma rather than one per occurrence.
+
+    Worker processes get a copy of the analyzer, so AnalysisPool looks
+    contents up in the parent's cache before dispatching (lookup) and
+    stores what the workers analyzed (store). The cache is shared by the
+    upload and ingest threads, so it is only touched under a lock.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        """
+        :param max_entries: Number of analyzed contents kept, least recently used are evicted first
+        """
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[bytes, Tuple[str, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # Locks cannot be pickled: worker processes get their own
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(content: str) -> bytes:
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+    def lookup(self, key: bytes) -> Optional[List[str]]:
+        """
+        Lemmas stored for a content hash, None when the content was not analyzed yet
+        """
+        with self._lock:
+            lemmas = self._cache.get(key)
+            if lemmas is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._cache.move_to_end(key)
+        return list(lemmas)
+
+    def store(self, key: bytes, lemmas: List[str]):
+        """
+        Remember the lemmas of a content hash, e.g. as analyzed by a worker process
+        """
+        lemmas = tuple(map(sys.intern, lemmas))
+        with self._lock:
+            self._cache[key] = lemmas
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def __call__(self, content: str) -> List[str]:
+        key = self.content_hash(content)
+        lemmas = self.lookup(key)
+        if lemmas is None:
+            lemmas = extract_nouns_and_entities(content)
+            self.store(key, lemmas)
+        return lemmas
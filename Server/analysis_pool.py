@@ -0,0 +1,159 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from segment import TokenArrays, decode_tokens, encode_tokens, merge_token_arrays, select_tokens
+
+Analyzers = Dict[str, Callable[[str], List[str]]]
+
+# Run through every analyzer when a worker starts, so lazily loaded NLTK
+# resources (stopwords, tokenizer, tagger, lemmatizer) load once per process
+WARM_UP_TEXT = "The quick brown foxes were jumping over lazy dogs in New York."
+
+_worker_analyzers: Optional[Analyzers] = None
+
+
+def analyze_contents(analyzers: Analyzers, contents: List[str]) -> Dict[str, TokenArrays]:
+    """
+    Run every field analyzer over a list of texts, encoding each field as term id arrays
+    """
+    return {
+        name: encode_tokens([analyzer(content) for content in contents])
+        for name, analyzer in analyzers.items()
+    }
+
+
+def _init_worker(analyzers: Analyzers):
+    global _worker_analyzers
+    _worker_analyzers = analyzers
+    for analyzer in analyzers.values():
+        analyzer(WARM_UP_TEXT)
+
+
+def _analyze_shard(names: Sequence[str], contents: List[str]) -> Dict[str, TokenArrays]:
+    return analyze_contents({name: _worker_analyzers[name] for name in names}, contents)
+
+
+class AnalysisPool:
+    """
+    Text analysis of document batches sharded across worker processes.
+
+    Tokenization, stopword filtering and POS tagging are pure Python and
+    hold the GIL, so batches are split into contiguous shards analyzed in a
+    ProcessPoolExecutor. Workers send back compact term id arrays against
+    a shard-local vocabulary, which are merged in document order. Small
+    batches, or a single worker, are analyzed in the calling process.
+
+    Workers hold copies of the analyzers, so memoizing analyzers (those
+    with content_hash / lookup / store, such as NounLemmaAnalyzer) are
+    consulted in this process: only their cache misses are sent out, and
+    the workers' output is stored back. Identical contents within a batch
+    are analyzed once. A pool broken by a dying worker is replaced.
+    """
+
+    def __init__(self, analyzers: Analyzers, workers: int = 1, min_shard_size: int = 32):
+        """
+        :param analyzers: Mapping of field name to analyzer, must be picklable
+        :param workers: Number of worker processes, 1 to analyze in-process
+        :param min_shard_size: Fewest documents worth sending to a worker
+        """
+        self.analyzers = analyzers
+        self.workers = max(1, workers)
+        self.min_shard_size = min_shard_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker, initargs=(self.analyzers,)
+                )
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _shards(self, contents: List[str]) -> List[List[str]]:
+        num_shards = max(1, min(self.workers, len(contents) // self.min_shard_size))
+        bounds = [len(contents) * i // num_shards for i in range(num_shards + 1)]
+        return [contents[start:end] for start, end in zip(bounds, bounds[1:]) if end > start]
+
+    def _run(self, jobs: List[Tuple[List[str], List[str]]]) -> List[Dict[str, TokenArrays]]:
+        """
+        Results of (analyzer names, contents) jobs run in the worker processes, in job order
+        """
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                futures = [executor.submit(_analyze_shard, names, contents) for names, contents in jobs]
+                return [future.result() for future in futures]
+            except BrokenProcessPool:
+                # A worker died (killed, out of memory): start a fresh pool and retry the batch once
+                self._discard_executor(executor)
+                if attempt:
+                    raise
+
+    def _analyze_in_workers(self, contents: List[str]) -> Dict[str, TokenArrays]:
+        memoized = {name: analyzer for name, analyzer in self.analyzers.items() if hasattr(analyzer, 'lookup')}
+        plain = [name for name in self.analyzers if name not in memoized]
+        jobs = [(plain, shard) for shard in self._shards(contents)] if plain else []
+        plain_jobs = len(jobs)
+
+        pending = []
+        for name, analyzer in memoized.items():
+            keys = [analyzer.content_hash(content) for content in contents]
+            token_lists = [analyzer.lookup(key) for key in keys]
+            misses = [i for i, tokens in enumerate(token_lists) if tokens is None]
+            first_job = len(jobs)
+            if misses:
+                jobs.extend(([name], shard) for shard in self._shards([contents[i] for i in misses]))
+            pending.append((name, analyzer, keys, token_lists, misses, first_job, len(jobs)))
+
+        results = self._run(jobs) if jobs else []
+        tokens = {name: merge_token_arrays([result[name] for result in results[:plain_jobs]]) for name in plain}
+        for name, analyzer, keys, token_lists, misses, first_job, end_job in pending:
+            analyzed = [terms for result in results[first_job:end_job] for terms in decode_tokens(result[name])]
+            for i, terms in zip(misses, analyzed):
+                analyzer.store(keys[i], terms)
+                token_lists[i] = terms
+            tokens[name] = encode_tokens(token_lists)
+        return {name: tokens[name] for name in self.analyzers}
+
+    def analyze(self, contents: List[str]) -> Dict[str, TokenArrays]:
+        """
+        Analyze a batch of texts in every field
+
+        :param contents: Raw document texts
+        :return: Per field, the encoded analyzer output in the order of contents
+        """
+        # Identical contents (re-uploads, boilerplate) are analyzed once
+        slots: Dict[str, int] = {}
+        order = [slots.setdefault(content, len(slots)) for content in contents]
+        unique = list(slots)
+
+        if min(self.workers, len(unique) // self.min_shard_size) <= 1:
+            tokens = analyze_contents(self.analyzers, unique)
+        else:
+            tokens = self._analyze_in_workers(unique)
+        if len(unique) < len(contents):
+            tokens = {name: select_tokens(field, order) for name, field in tokens.items()}
+        return tokens
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def default_workers() -> int:
+    """
+    Worker count from the ANALYSIS_WORKERS environment variable, defaulting to the CPU count
+    """
+    return int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
@@ -0,0 +1,173 @@
+"""
+Batch search: score many queries against the index in one pass.
+
+All queries of a batch are analyzed up front, every distinct term's
+weights are read from the index once, and the query-term matrix is
+multiplied against the term-document weights as a sparse product:
+(query, document, weight) triples are concatenated and summed with
+np.bincount, then every query's top-k is selected with a single lexsort.
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bim import DocumentSearcher
+from metrics import count, stage
+
+MODELS = ('keyword', 'tfidf', 'bm25', 'bim', 'interference', 'belief')
+
+# Queries are scored in chunks holding at most this many (query, document) pairs
+MAX_CHUNK_PAIRS = 1 << 22
+
+Hit = Tuple[int, float]
+
+
+class BatchSearcher:
+    def __init__(self, index, ranker, ir_models, max_chunk_pairs: int = MAX_CHUNK_PAIRS):
+        """
+        Batch front end over the per-query models
+
+        Term weights come from the models' own per-snapshot caches, so
+        batch scores match the single-query endpoints.
+
+        :param index: Shared CorpusIndex
+        :param ranker: DocumentRanker providing keyword / tfidf / bm25 term weights
+        :param ir_models: InformationRetrievalModels providing term beliefs
+        :param max_chunk_pairs: Bound on the triples held in memory at once
+        """
+        self.index = index
+        self.ranker = ranker
+        self.ir_models = ir_models
+        self.max_chunk_pairs = max_chunk_pairs
+
+    def _analyze(self, model: str, query: str) -> Counter:
+        if model in ('keyword', 'tfidf', 'bm25'):
+            return Counter(self.ranker.preprocess_text(query))
+        if model == 'bim':
+            # Binary matching: every distinct term counts once
+            return Counter(set(self.index.field(DocumentSearcher.FIELD).analyze(query)))
+        return Counter(self.ir_models.field.analyze(query))
+
+    def _term_weights(self, model: str, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (doc ids, per-document weight) of one term under a model
+        """
+        if model in ('keyword', 'tfidf', 'bm25'):
+            return self.ranker.term_weights(term, model)
+        if model == 'bim':
+            doc_ids = self.index.field(DocumentSearcher.FIELD).get_postings(term).doc_ids
+            return doc_ids, np.ones(len(doc_ids))
+        doc_ids, beliefs, _ = self.ir_models.term_beliefs(term)
+        # Documents without the term keep the default belief, so only the excess is summed
+        return doc_ids, beliefs - self.ir_models.DEFAULT_BELIEF
+
+    def _query_weights(self, model: str, query_counts: Counter) -> Dict[str, float]:
+        """
+        Row of the query-term matrix
+        """
+        if model == 'interference':
+            # 'sum' operator: mean of the term beliefs
+            return {term: 1.0 / len(query_counts) for term in query_counts}
+        if model == 'belief':
+            # 'wsum' operator: query term frequency times normalized idf
+            weights = {term: qtf * self.ir_models.term_beliefs(term)[2] for term, qtf in query_counts.items()}
+            if not sum(weights.values()):
+                weights = dict(query_counts)
+            total = sum(weights.values())
+            return {term: weight / total for term, weight in weights.items()}
+        if model == 'bim':
+            return dict.fromkeys(query_counts, 1.0)
+        return {term: float(qtf) for term, qtf in query_counts.items()}
+
+    def search(self, queries: List[str], model: str, top_k: Optional[int] = 10) -> List[List[Hit]]:
+        """
+        Run every query with one model
+
+        :param queries: Query strings
+        :param model: One of MODELS; interference and belief use their default operators
+        :param top_k: Hits per query, None for every matching document
+        :return: One ranked list of (doc_id, score) pairs per query, in query order
+        """
+        if model not in MODELS:
+            raise ValueError(f"Unknown model: {model}. Expected one of {', '.join(MODELS)}")
+        # Long offline batches may run alongside ingestion: score every query against one snapshot
+        with self.index.pinned():
+            return self._search(queries, model, top_k)
+
+    def _search(self, queries: List[str], model: str, top_k: Optional[int]) -> List[List[Hit]]:
+        if top_k is not None and top_k <= 0 or not len(self.index):
+            return [[] for _ in queries]
+
+        with stage('analyze'):
+            rows = [self._query_weights(model, counts) if counts else {}
+                    for counts in (self._analyze(model, query) for query in queries)]
+
+        with stage('index_lookup'):
+            term_weights = {term: self._term_weights(model, term) for row in rows for term in row}
+        count('postings_touched', sum(len(doc_ids) for doc_ids, _ in term_weights.values()))
+
+        results = []
+        start = 0
+        while start < len(rows):
+            # Grow the chunk until it would exceed the pair budget (always at least one query)
+            end, pairs = start, 0
+            while end < len(rows):
+                size = sum(len(term_weights[term][0]) for term in rows[end])
+                if end > start and pairs + size > self.max_chunk_pairs:
+                    break
+                pairs += size
+                end += 1
+            results.extend(self._search_chunk(model, rows[start:end], term_weights, top_k))
+            start = end
+        return results
+
+    def _search_chunk(self, model: str, rows: List[Dict[str, float]],
+                      term_weights: Dict[str, Tuple[np.ndarray, np.ndarray]], top_k: Optional[int]) -> List[List[Hit]]:
+        num_docs = len(self.index)
+        with stage('score'):
+            keys, values = [], []
+            for row_id, row in enumerate(rows):
+                for term, query_weight in row.items():
+                    doc_ids, weights = term_weights[term]
+                    if len(doc_ids):
+                        keys.append(doc_ids.astype(np.int64) + row_id * num_docs)
+                        values.append(weights * query_weight)
+            if not keys:
+                return [[] for _ in rows]
+
+            # Sparse query-term x term-document product: sum the weights of each (query, document) pair
+            pair_keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(values))
+            row_ids, doc_ids = np.divmod(pair_keys, num_docs)
+
+            if model == 'bim':
+                # Jaccard: |q & d| / (|q| + |d| - |q & d|)
+                query_sizes = np.array([len(row) for row in rows])
+                doc_sizes = self.index.field(DocumentSearcher.FIELD).doc_unique_terms[doc_ids]
+                unions = query_sizes[row_ids] + doc_sizes - scores
+                scores = np.divide(scores, unions, out=np.zeros(len(scores)), where=unions != 0)
+            elif model == 'interference':
+                scores = scores + self.ir_models.DEFAULT_BELIEF
+            elif model == 'belief':
+                # 'and' of the query node and the document prior node
+                scores = (scores + self.ir_models.DEFAULT_BELIEF) * self.ir_models.document_priors()[doc_ids]
+            elif model in ('tfidf', 'bm25'):
+                keep = scores > 0
+                row_ids, doc_ids, scores = row_ids[keep], doc_ids[keep], scores[keep]
+        count('documents_scored', len(scores))
+
+        with stage('top_k'):
+            # Per query: highest score first, ties in document order
+            order = np.lexsort((doc_ids, -scores, row_ids))
+            row_ids, doc_ids, scores = row_ids[order], doc_ids[order], scores[order]
+            bounds = np.searchsorted(row_ids, np.arange(len(rows) + 1))
+            if model == 'keyword':
+                scores = scores.astype(np.int64)
+            results = []
+            for row_id in range(len(rows)):
+                first, last = bounds[row_id], bounds[row_id + 1]
+                if top_k is not None:
+                    last = min(last, first + top_k)
+                results.append(list(zip(doc_ids[first:last].tolist(), scores[first:last].tolist())))
+        return results
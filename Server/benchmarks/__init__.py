@@ -0,0 +1,10 @@
+"""
+Benchmarks for the retrieval models.
+
+Run from the Server directory:
+
+    python -m benchmarks.run --sizes 1000,10000,100000 --output results.json
+
+Corpora are generated offline and deterministically by benchmarks.corpus,
+the analyzers still need the NLTK data the server itself uses.
+"""
@@ -0,0 +1,102 @@
+from typing import Iterator, List
+
+import numpy as np
+
+CONSONANTS = 'bcdfghjklmnprstvwz'
+VOWELS = 'aeiou'
+SYLLABLES = [c + v for c in CONSONANTS for v in VOWELS]
+
+
+class ZipfCorpus:
+    """
+    Deterministic synthetic corpus with a Zipfian term distribution.
+
+    Term of rank r (0 = most frequent) is drawn with probability
+    proportional to 1 / (r + 1) ** exponent. Terms are made of
+    consonant-vowel syllables, so frequent terms are short, like real
+    words, and every analyzer keeps them as alphabetic tokens.
+    """
+
+    def __init__(self, vocabulary_size: int = 50000, exponent: float = 1.1,
+                 mean_length: int = 200, seed: int = 0):
+        """
+        :param vocabulary_size: Number of distinct terms
+        :param exponent: Zipf exponent, larger values concentrate mass on the top terms
+        :param mean_length: Mean number of words per document
+        :param seed: Seed of the random generator, equal seeds give equal corpora
+        """
+        self.vocabulary_size = vocabulary_size
+        self.exponent = exponent
+        self.mean_length = mean_length
+        self.seed = seed
+        self.vocabulary = [self.word(rank) for rank in range(vocabulary_size)]
+        weights = 1.0 / np.arange(1, vocabulary_size + 1) ** exponent
+        self.probabilities = weights / weights.sum()
+
+    @staticmethod
+    def word(rank: int) -> str:
+        """
+        Spell a rank as syllables (bijective base-len(SYLLABLES) numeral)
+        """
+        syllables = []
+        rank += 1
+        while rank:
+            rank, digit = divmod(rank - 1, len(SYLLABLES))
+            syllables.append(SYLLABLES[digit])
+        return ''.join(reversed(syllables))
+
+    def documents(self, num_docs: int, batch_size: int = 1000) -> Iterator[List[dict]]:
+        """
+        Yield batches of {'title', 'content'} documents, num_docs in total
+        """
+        rng = np.random.default_rng(self.seed)
+        vocabulary = np.array(self.vocabulary, dtype=object)
+        for start in range(0, num_docs, batch_size):
+            count = min(batch_size, num_docs - start)
+            lengths = np.maximum(1, rng.poisson(self.mean_length, size=count))
+            ranks = rng.choice(self.vocabulary_size, size=int(lengths.sum()), p=self.probabilities)
+            words = vocabulary[ranks]
+            offsets = np.concatenate(([0], np.cumsum(lengths)))
+            yield [
+                {'title': f'doc{start + i:07d}.txt', 'content': ' '.join(words[offsets[i]:offsets[i + 1]])}
+                for i in range(count)
+            ]
+
+    def queries(self, num_queries: int, terms: int = 2, min_rank: int = 10, max_rank: int = 5000) -> List[str]:
+        """
+        Free-text queries of mid-frequency terms, skipping the stopword-like head of the distribution
+        """
+        rng = np.random.default_rng(self.seed + 1)
+        max_rank = min(max_rank, self.vocabulary_size)
+        return [
+            ' '.join(self.vocabulary[rank] for rank in rng.integers(min_rank, max_rank, size=terms))
+            for _ in range(num_queries)
+        ]
+
+    def boolean_queries(self, num_queries: int) -> List[str]:
+        """
+        Boolean queries mixing AND, OR and NOT over mid-frequency terms
+        """
+        templates = ['{0} and {1}', '{0} or {1}', '{0} and not {1}', '( {0} or {1} ) and {2}']
+        rng = np.random.default_rng(self.seed + 2)
+        queries = []
+        for query in self.queries(num_queries, terms=3):
+            template = templates[int(rng.integers(len(templates)))]
+            queries.append(template.format(*query.split()))
+        return queries
+
+    def pattern_queries(self, num_queries: int) -> List[str]:
+        """
+        Boolean queries with phrases, prefix terms (a term and every longer term it starts) and single-character wildcards
+        """
+        templates = ['"{0} {1}"', '"{0} {1}" or {2}', '{0}* and {1}', '{wildcard} or {1}']
+        rng = np.random.default_rng(self.seed + 3)
+        queries = []
+        for query in self.queries(num_queries, terms=3):
+            terms = query.split()
+            template = templates[int(rng.integers(len(templates)))]
+            first = terms[0]
+            position = int(rng.integers(len(first)))
+            wildcard = first[:position] + '?' + first[position + 1:]
+            queries.append(template.format(*terms, wildcard=wildcard))
+        return queries
@@ -0,0 +1,402 @@
+"""
+Benchmark every retrieval model on synthetic corpora.
+
+Each (corpus size, mode) pair runs in its own interpreter so that peak RSS
+is measured per run. Mode 'inprocess' calls the models directly, mode
+'flask' goes through the HTTP endpoints with Flask's test client.
+Results are printed (or written with --output) as one JSON document.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.corpus import ZipfCorpus
+
+MODES = ('inprocess', 'flask')
+TOP_K = 10
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """
+    Peak resident set size in MiB (ru_maxrss is KiB on Linux, bytes on macOS)
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb() -> float:
+    """
+    Resident set size right now in MiB (Linux only, None elsewhere)
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return None
+
+
+def latency_stats(latencies: List[float]) -> dict:
+    """
+    Latency percentiles in milliseconds
+    """
+    values = np.array(latencies) * 1000
+    return {
+        'queries': len(values),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+
+def time_queries(search: Callable[[str], object], queries: List[str], warmup: int = 3) -> dict:
+    for query in queries[:warmup]:
+        search(query)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+    return latency_stats(latencies)
+
+
+def time_batch(search: Callable[[List[str]], object], queries: List[str]) -> dict:
+    """
+    Throughput of one batch call over every query
+    """
+    search(queries[:3])
+    start = time.perf_counter()
+    search(queries)
+    seconds = time.perf_counter() - start
+    return {'queries': len(queries), 'seconds': seconds, 'queries_per_second': len(queries) / seconds if seconds else None}
+
+
+def inprocess_models(server) -> Dict[str, Callable[[str], object]]:
+    from bim import DocumentSearcher
+
+    # tfidf, bm25, bim and boolean go through the server's front ends, which use the shards when enabled
+    corpus, ranker, ir_models = server.corpus, server.ranker, server.ir_models
+    return {
+        'bim': lambda q: server.bim_search(q, top_k=TOP_K),
+        'non_overlapping': lambda q: DocumentSearcher.non_overlapping_lists_search(corpus, q.split()),
+        'proximal': lambda q: DocumentSearcher.proximal_node_search(corpus, q.split(), 10, TOP_K),
+        'keyword': lambda q: ranker.keyword_matching(q, top_k=TOP_K),
+        'tfidf': lambda q: server.tfidf_search(q, top_k=TOP_K),
+        'bm25': lambda q: server.bm25_search(q, top_k=TOP_K),
+        'interference': lambda q: ir_models.interference_model(q, top_k=TOP_K),
+        'belief': lambda q: ir_models.belief_network(q, top_k=TOP_K),
+        'boolean': lambda q: server.boolean_search(q),
+        'boolean_patterns': lambda q: server.boolean_search(q),
+        'title': lambda q: server.title_index.search(q.split()[0][:4], k=TOP_K),
+        'autocomplete': lambda q: server.title_index.autocomplete(q.split()[0][:3], limit=TOP_K),
+    }
+
+
+def flask_models(server) -> Dict[str, Callable[[str], object]]:
+    client = server.app.test_client()
+
+    def post(path: str, payload: Callable[[str], dict]):
+        def search(query: str):
+            response = client.post(path, json=dict(payload(query), k=TOP_K))
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)}")
+            return response.get_json()
+        return search
+
+    return {
+        'bim': post('/api/bim', lambda q: {'query': q}),
+        'non_overlapping': post('/api/non-overlapping-search', lambda q: {'query': q}),
+        'proximal': post('/api/proximal-node-search', lambda q: {'entities': q.split()}),
+        'keyword': post('/api/search/keyword', lambda q: {'query': q}),
+        'tfidf': post('/api/search/tfidf', lambda q: {'query': q}),
+        'bm25': post('/api/search/bm25', lambda q: {'query': q}),
+        'interference': post('/api/search/interference', lambda q: {'query': q}),
+        'belief': post('/api/search/belief', lambda q: {'query': q}),
+        'boolean': post('/api/search/boolean', lambda q: {'query': q}),
+        'boolean_patterns': post('/api/search/boolean', lambda q: {'query': q}),
+        'content': post('/api/documents/search/content', lambda q: {'query': q}),
+        'title': post('/api/documents/search/title', lambda q: {'query': q.split()[0][:4]}),
+    }
+
+
+def inprocess_batch(server) -> Callable[[str], Callable[[List[str]], object]]:
+    return lambda model: lambda queries: server.batch_searcher.search(queries, model, top_k=TOP_K)
+
+
+def flask_batch(server) -> Callable[[str], Callable[[List[str]], object]]:
+    client = server.app.test_client()
+
+    def batch(model: str):
+        def search(queries: List[str]):
+            response = client.post('/api/search/batch', json={'queries': queries, 'model': model, 'k': TOP_K})
+            if response.status_code != 200:
+                raise RuntimeError(f"Batch search returned {response.status_code}: {response.get_data(as_text=True)}")
+            return response.get_json()
+        return search
+    return batch
+
+
+def ingest_inprocess(server, batches) -> None:
+    for batch in batches:
+        server.corpus.add_documents(batch)
+
+
+def ingest_flask(server, batches) -> None:
+    client = server.app.test_client()
+    for batch in batches:
+        body = '\n'.join(json.dumps({'filename': doc['title'], 'content': doc['content']}) for doc in batch)
+        response = client.post('/api/documents/ingest?wait=1', data=body.encode('utf-8'),
+                               content_type='application/x-ndjson')
+        if response.status_code != 202:
+            raise RuntimeError(f"Ingest returned {response.status_code}: {response.get_data(as_text=True)}")
+
+
+def delete_inprocess(server) -> Callable[[int], object]:
+    return lambda doc_id: server.corpus.delete_documents([doc_id])
+
+
+def delete_flask(server) -> Callable[[int], object]:
+    client = server.app.test_client()
+
+    def delete(doc_id: int):
+        response = client.delete(f'/api/documents/{doc_id}')
+        if response.status_code != 200:
+            raise RuntimeError(f"Delete returned {response.status_code}: {response.get_data(as_text=True)}")
+    return delete
+
+
+def time_deletes(server, delete: Callable[[int], object], fraction: float, seed: int) -> dict:
+    """
+    Latency of single-document deletes over a random fraction of the corpus, and the merges they trigger
+    """
+    corpus = server.corpus
+    rng = np.random.default_rng(seed)
+    doc_ids = rng.choice(len(corpus), size=int(len(corpus) * fraction), replace=False).tolist()
+    if not doc_ids:
+        return {}
+    segments_before = len(corpus.segments)
+    bytes_before = sum(segment.nbytes for segment in corpus.segments)
+    merges_before = corpus.merger.stats()
+
+    latencies = []
+    for doc_id in doc_ids:
+        start = time.perf_counter()
+        delete(doc_id)
+        latencies.append(time.perf_counter() - start)
+    # Waits for a pass the background merger is running, then merges what is left
+    corpus.merger.merge()
+
+    merges = corpus.merger.stats()
+    return {
+        'deleted': len(doc_ids),
+        'latency': latency_stats(latencies),
+        'merges': merges.merges - merges_before.merges,
+        'merge_seconds': merges.seconds - merges_before.seconds,
+        'documents_dropped': merges.documents_dropped - merges_before.documents_dropped,
+        'segments_before': segments_before,
+        'segments_after': len(corpus.segments),
+        'index_bytes_before': bytes_before,
+        'index_bytes_after': sum(segment.nbytes for segment in corpus.segments),
+    }
+
+
+def postings_stats(corpus, queries: List[str]) -> dict:
+    """
+    Per field, size of the compressed postings against 32-bit doc ids and frequencies, and decode throughput
+    """
+    report = {}
+    for name, field in corpus.fields.items():
+        segments = field.segments()
+        num_postings = sum(int(segment.postings_ptr[-1]) for segment in segments)
+        nbytes = sum(segment.postings_nbytes for segment in segments)
+
+        start = time.perf_counter()
+        for segment in segments:
+            segment.all_postings()
+        full_seconds = time.perf_counter() - start
+
+        # Term at a time, as queries read them
+        decoded = 0
+        start = time.perf_counter()
+        for query in queries:
+            for term in field.analyze(query):
+                for segment in segments:
+                    term_id = segment.term_id(term)
+                    if term_id is not None:
+                        decoded += len(segment.postings(term_id)[0])
+        term_seconds = time.perf_counter() - start
+
+        report[name] = {
+            'postings': num_postings,
+            'bytes': nbytes,
+            'bits_per_posting': nbytes * 8 / num_postings if num_postings else None,
+            'compression_ratio': num_postings * 8 / nbytes if nbytes else None,
+            'decode_mpostings_per_second': num_postings / full_seconds / 1e6 if full_seconds else None,
+            'term_decode_mpostings_per_second': decoded / term_seconds / 1e6 if term_seconds else None,
+        }
+    return report
+
+
+def run_single(args) -> dict:
+    """
+    Benchmark one corpus size in one mode, in the current interpreter
+    """
+    # The server builds its corpus at import, so point it at a fresh index first
+    index_dir = tempfile.mkdtemp(prefix='ir-bench-')
+    os.environ['INDEX_DIR'] = index_dir
+    os.environ['ANALYSIS_WORKERS'] = str(args.workers)
+    os.environ['INGEST_BATCH_SIZE'] = str(args.batch_size)
+    os.environ['SEARCH_SHARDS'] = str(args.shards)
+    if not args.cache:
+        os.environ['RESULT_CACHE_ENTRIES'] = '0'
+    import server
+
+    generator = ZipfCorpus(args.vocabulary, args.exponent, args.doc_length, args.seed)
+    batches = list(generator.documents(args.size, args.batch_size))
+    corpus_bytes = sum(len(doc['content'].encode('utf-8')) for batch in batches for doc in batch)
+
+    baseline_rss = current_rss_mb()
+    start = time.perf_counter()
+    (ingest_flask if args.mode == 'flask' else ingest_inprocess)(server, batches)
+    ingest_seconds = time.perf_counter() - start
+    del batches
+    gc.collect()
+    ingest_rss = current_rss_mb()
+    index_bytes = sum(segment.nbytes for segment in server.corpus.segments)
+
+    queries = generator.queries(args.queries)
+    boolean_queries = generator.boolean_queries(args.queries)
+    postings = postings_stats(server.corpus, queries)
+    pattern_queries = generator.pattern_queries(args.queries)
+    models = (flask_models if args.mode == 'flask' else inprocess_models)(server)
+    selected = args.models.split(',') if args.models else list(models)
+
+    results = {}
+    for name in selected:
+        if name in models:
+            model_queries = {'boolean': boolean_queries, 'boolean_patterns': pattern_queries}.get(name, queries)
+            results[name] = time_queries(models[name], model_queries)
+
+    # The same queries through the batch API, for models it supports
+    from batch import MODELS as BATCH_MODELS
+    batch = (flask_batch if args.mode == 'flask' else inprocess_batch)(server)
+    batch_results = {name: time_batch(batch(name), queries) for name in selected if name in BATCH_MODELS}
+
+    # Deletes last, so every model above ran on the full corpus
+    delete = (delete_flask if args.mode == 'flask' else delete_inprocess)(server)
+    delete_results = time_deletes(server, delete, args.deletes, args.seed)
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    return {
+        'size': args.size,
+        'mode': args.mode,
+        'shards': args.shards,
+        'ingest': {
+            'documents': len(server.corpus),
+            'seconds': ingest_seconds,
+            'docs_per_second': len(server.corpus) / ingest_seconds if ingest_seconds else None,
+            'mb_per_second': corpus_bytes / (1024 * 1024) / ingest_seconds if ingest_seconds else None,
+            'segments': len(server.corpus.segments),
+        },
+        'memory': {
+            'index_bytes': index_bytes,
+            'index_bytes_per_document': index_bytes / len(server.corpus) if len(server.corpus) else None,
+            'corpus_bytes_per_document': corpus_bytes / len(server.corpus) if len(server.corpus) else None,
+            'postings': postings,
+            'rss_after_ingest_mb': ingest_rss,
+            'rss_kb_per_document': (ingest_rss - baseline_rss) * 1024 / len(server.corpus)
+            if ingest_rss is not None and baseline_rss is not None and len(server.corpus) else None,
+        },
+        'models': results,
+        'batch': batch_results,
+        'deletes': delete_results,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_children_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated corpus sizes')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma separated modes: inprocess, flask')
+    parser.add_argument('--models', default='', help='Comma separated model names, all by default')
+    parser.add_argument('--queries', type=int, default=200, help='Timed queries per model')
+    parser.add_argument('--doc-length', type=int, default=200, help='Mean words per document')
+    parser.add_argument('--vocabulary', type=int, default=50000, help='Distinct terms in the corpus')
+    parser.add_argument('--exponent', type=float, default=1.1, help='Zipf exponent of the term distribution')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documents per ingested batch')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Analysis worker processes')
+    parser.add_argument('--shards', type=int, default=0, help='Shard processes for tfidf/bm25/bim/boolean, 0 for none')
+    parser.add_argument('--deletes', type=float, default=0.1, help='Fraction of documents deleted one by one, then merged')
+    parser.add_argument('--cache', action='store_true', help='Keep the result cache enabled')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    # Internal: run one (size, mode) pair and print its result
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.size is not None:
+        print(json.dumps(run_single(args)))
+        return
+
+    passthrough = [
+        '--models', args.models, '--queries', str(args.queries), '--doc-length', str(args.doc_length),
+        '--vocabulary', str(args.vocabulary), '--exponent', str(args.exponent), '--seed', str(args.seed),
+        '--batch-size', str(args.batch_size), '--workers', str(args.workers), '--shards', str(args.shards),
+        '--deletes', str(args.deletes),
+    ] + (['--cache'] if args.cache else [])
+
+    runs = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        for mode in args.modes.split(','):
+            print(f"Benchmarking {size} documents ({mode})", file=sys.stderr)
+            completed = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.run', '--size', str(size), '--mode', mode] + passthrough,
+                capture_output=True, text=True, check=True,
+            )
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'parameters': {key: value for key, value in vars(args).items() if key not in ('size', 'mode', 'output')},
+        },
+        'runs': runs,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,24 @@
+import heapq
 import numpy as np
 import re
-from typing import List, Set, Dict
+from typing import List, Set, Dict, Tuple
 from collections import defaultdict
+from aho_corasick import AhoCorasick
+from metrics import count, stage
 
 class TextProcessor:
     """Handles text preprocessing and analysis."""
     
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """Clean every whitespace-separated word, keeping '' for words with no letters."""
+        words = text.lower().split()
+        return [re.sub(r'[^a-zA-Z\s]', '', word) for word in words]
+
     @staticmethod
     def preprocess_text(text: str) -> List[str]:
         """Clean and tokenize text."""
-        words = text.lower().split()
-        words = [re.sub(r'[^a-zA-Z\s]', '', word) for word in words]
-        return [word for word in words if word]
+        return [word for word in TextProcessor.tokenize(text) if word]
 
     @staticmethod
     def create_vocabulary(documents: List[str], stop_words: Set[str] = None) -> List[str]:
@@ -40,150 +47,221 @@ class TextProcessor:
 class DocumentSearcher:
     """Handles advanced document search operations."""
 
+    FIELD = 'terms'
+
     @classmethod
-    def binary_term_matching(cls, documents: List[dict], query: str):
-        """Perform binary term matching search."""
-        if not documents:
+    def binary_term_matching(cls, index, query: str, top_k: int = 10):
+        """
+        Perform binary term matching search.
+
+        Only documents sharing a term with the query can score, so the work
+        is proportional to the query terms' postings: |q & d| counts each
+        document's occurrences across those postings, and
+        |q | d| = |q| + |d| - |q & d| with |d| from the field's per-document
+        distinct term counts.
+
+        Args:
+            index (CorpusIndex): Shared corpus index
+            query (str): Search query
+            top_k (int): Maximum number of results to return
+
+        Returns:
+            List[Tuple[int, float]]: (doc_id, similarity) of the best matches, highest first
+        """
+        if not len(index) or top_k <= 0:
+            return []
+
+        field = index.field(cls.FIELD)
+        with stage('analyze'):
+            query_terms = set(field.analyze(query))
+        if not query_terms:
+            return []
+
+        with stage('index_lookup'):
+            # Live postings only: deleted documents never match
+            doc_parts = [field.get_postings(term).doc_ids for term in query_terms]
+            doc_ids = np.concatenate(doc_parts) if doc_parts else np.zeros(0, dtype=np.int64)
+        count('postings_touched', len(doc_ids))
+        if not len(doc_ids):
             return []
 
-        # Create vocabulary and vectors
-        documents_content = [doc['content'] for doc in documents]
-        vocabulary = TextProcessor.create_vocabulary(documents_content + [query])
-        print("Vocabulary")
-        doc_vectors = np.array([
-            TextProcessor.create_binary_vector(doc['content'], vocabulary)
-            for doc in documents
-        ])
-        query_vector = TextProcessor.create_binary_vector(query, vocabulary)
-        print("Binary Vectors Created")
-        # Calculate similarities
-        similarities = [
-            TextProcessor.calculate_jaccard_similarity(doc_vec, query_vector)
-            for doc_vec in doc_vectors
-        ]
-        print("Similarities Calculated")
-
-        # Return sorted results with similarity and document
-        results = [
-            {
-                'title': doc['title'], 
-                'content': doc['content'], 
-                'similarity': sim
-            } 
-            for doc, sim in zip(documents, similarities)
-        ]
-        print("Results")
-        return sorted(results, key=lambda x: x['similarity'], reverse=True)
+        with stage('score'):
+            candidates, intersections = np.unique(doc_ids, return_counts=True)
+            unions = len(query_terms) + field.doc_unique_terms[candidates] - intersections
+            similarities = intersections / unions
+        count('documents_scored', len(candidates))
+
+        with stage('top_k'):
+            if len(candidates) > top_k:
+                kth = np.partition(similarities, len(similarities) - top_k)[len(similarities) - top_k]
+                keep = similarities >= kth
+                candidates, similarities = candidates[keep], similarities[keep]
+            # Highest similarity first, ties in document order
+            order = np.lexsort((candidates, -similarities))[:top_k]
+
+        return [(int(doc_id), float(similarity)) for doc_id, similarity in zip(candidates[order], similarities[order])]
 
     @classmethod
-    def non_overlapping_lists_search(cls, documents: List[dict], terms: List[str]):
+    def non_overlapping_lists_search(cls, index, terms: List[str], match: str = 'substring'):
         """
         Perform non-overlapping lists search.
-        
+
+        Returns the documents that contain exactly one of the search terms.
+
         Args:
-            documents (List[dict]): List of documents to search
+            index (CorpusIndex): Shared corpus index
             terms (List[str]): List of search terms
-        
+            match (str): 'substring' to match terms anywhere in the lowercased
+                content, scanning each document once with an Aho-Corasick
+                automaton; 'token' to match indexed terms through the postings
+
         Returns:
-            List[dict]: List of non-overlapping documents
+            List[int]: Ids of the matching documents in document order
         """
-        # Create a mapping of terms to documents
-        term_to_docs = {}
-        processed_docs = {}
-
-        # Preprocess documents and create term-to-docs mapping
-        for idx, doc in enumerate(documents):
-            # Store processed document for later reference
-            processed_docs[idx] = doc['content'].lower()
-            
-            # Check for each term
-            for term in terms:
-                term_lower = term.lower()
-                if term_lower in processed_docs[idx]:
-                    if term not in term_to_docs:
-                        term_to_docs[term] = []
-                    term_to_docs[term].append(idx)
-
-        # Find non-overlapping documents
-        non_overlapping_docs = set()
-        for term, doc_list in term_to_docs.items():
-            for doc_id in doc_list:
-                # Ensure that the document is not already in the non-overlapping set
-                if doc_id not in non_overlapping_docs:
-                    # Check if this document contains only one term of interest
-                    term_count = sum(1 for other_term in terms if other_term.lower() in processed_docs[doc_id])
-                    if term_count == 1:  # Only add document if it contains exactly one term of interest
-                        non_overlapping_docs.add(doc_id)
-
-        # Convert document IDs to document details
-        results = [
-            {
-                'title': documents[doc_id]['title'],
-                'content': documents[doc_id]['content']
-            }
-            for doc_id in non_overlapping_docs
-        ]
+        distinct_terms = list(dict.fromkeys(term.lower() for term in terms if term))
+        if not distinct_terms:
+            return []
 
-        return results
+        if match == 'token':
+            field = index.field(cls.FIELD)
+            term_counts = defaultdict(int)
+            for term in set(t for term in distinct_terms for t in field.analyze(term)):
+                for doc_id in field.get_postings(term):
+                    term_counts[doc_id] += 1
+            doc_ids = sorted(doc_id for doc_id, count in term_counts.items() if count == 1)
+        elif match == 'substring':
+            automaton = AhoCorasick(distinct_terms)
+            # A second distinct match already disqualifies a document, so stop scanning there
+            doc_ids = [
+                doc_id for doc_id, doc in index.documents.items()
+                if len(automaton.distinct_matches(doc['content'].lower(), limit=2)) == 1
+            ]
+        else:
+            raise ValueError(f"Unknown match mode: {match}")
+
+        return doc_ids
+
+    @classmethod
+    def phrase_positions(cls, field, terms: List[str], doc_id: int) -> List[int]:
+        """
+        Start positions of a sequence of terms in a document, from the positional postings.
+
+        Args:
+            field (FieldIndex): Positional field index
+            terms (List[str]): Analyzed terms of the phrase, '' for words without letters (not first)
+            doc_id (int): Document to look in
+
+        Returns:
+            List[int]: Sorted positions where the phrase starts
+        """
+        starts = field.get_positions(terms[0], doc_id)
+        for offset, term in enumerate(terms[1:], start=1):
+            if not starts:
+                break
+            if not term:
+                # Placeholder of a word without letters: any token fits
+                continue
+            following = set(field.get_positions(term, doc_id))
+            starts = [pos for pos in starts if pos + offset in following]
+        return list(starts)
 
     @classmethod
-    def proximal_node_search(cls, documents: List[dict], entities: List[str], window_size: int = 50):
+    def proximal_node_search(cls, index, entities: List[str], window_size: int = 10, top_k: int = 10):
         """
         Perform proximal node search with configurable window size.
-        
+
+        Finds windows of at most window_size tokens that contain every entity.
+        Entity occurrences come from the positional index; per document they
+        are merged into one sorted stream and scanned with a sliding window,
+        so the cost is linear in the number of occurrences.
+
         Args:
-            documents (List[dict]): List of documents to search
-            entities (List[str]): List of entities to find in proximity
-            window_size (int): Maximum distance between entities
-        
+            index (CorpusIndex): Shared corpus index
+            entities (List[str]): Entities (words or phrases) to find in proximity
+            window_size (int): Maximum distance in tokens between the first and last entity
+            top_k (int): Number of closest matches to return
+
         Returns:
-            Dict[str, List[dict]]: Dictionary of proximity search results
+            List[dict]: Closest matches, smallest distance first
         """
-        results = defaultdict(list)
+        field = index.field(cls.FIELD)
 
-        # Ensure we have at least two entities for proximity search
-        if len(entities) < 2:
-            return dict(results)
+        # Analyze each entity once; duplicates and entities with no indexable terms are dropped.
+        # Words without letters stay as '' placeholders so the words around them keep their offsets.
+        names = {}
+        for entity in entities:
+            terms = list(field.analyzer(entity))
+            while terms and not terms[0]:
+                terms.pop(0)
+            while terms and not terms[-1]:
+                terms.pop()
+            terms = tuple(terms)
+            if terms and terms not in names:
+                names[terms] = entity
+        if len(names) < 2 or top_k <= 0:
+            return []
+        phrases = list(names)
 
-        for doc in documents:
-            doc_lower = doc['content'].lower()
-            doc_length = len(doc_lower)
-            
-            # Find all occurrences of each entity
-            entity_positions = {}
-            for entity in entities:
-                entity_lower = entity.lower()
-                positions = []
-                start = 0
-                while True:
-                    pos = doc_lower.find(entity_lower, start)
-                    if pos == -1:
-                        break
-                    positions.append(pos)
-                    start = pos + 1
-                if positions:
-                    entity_positions[entity] = positions
-
-            # Check for proximity between entities
-            if len(entity_positions) >= 2:
-                for i, (entity1, pos1_list) in enumerate(entity_positions.items()):
-                    for entity2, pos2_list in list(entity_positions.items())[i+1:]:
-                        for pos1 in pos1_list:
-                            for pos2 in pos2_list:
-                                if abs(pos1 - pos2) <= window_size:
-                                    start_pos = max(0, min(pos1, pos2) - 20)
-                                    end_pos = min(doc_length, max(pos1, pos2) + 20)
-                                    context = doc['content'][start_pos:end_pos]
-                                    
-                                    result_entry = {
-                                        'title': doc['filename'],
-                                        'content': doc['content'],
-                                        'context': context,
-                                        'entities_found': [entity1, entity2],
-                                        'distance': abs(pos1 - pos2)
-                                    }
-                                    
-                                    key = f"{entity1}-{entity2}"
-                                    results[key].append(result_entry)
-
-        return dict(results)
\ No newline at end of file
+        # Only documents containing every entity term can match
+        with stage('index_lookup'):
+            doc_sets = sorted(
+                (field.get_postings(term) for phrase in phrases for term in set(phrase) if term),
+                key=len
+            )
+            candidates = [doc_id for doc_id in doc_sets[0] if all(doc_id in docs for docs in doc_sets[1:])]
+        count('postings_touched', sum(len(docs) for docs in doc_sets))
+        count('documents_scored', len(candidates))
+
+        with stage('score'):
+            matches = []  # min-heap on (-distance, -doc_id, -start) keeping the top_k closest
+            for doc_id in candidates:
+                streams = []
+                for entity_idx, phrase in enumerate(phrases):
+                    positions = cls.phrase_positions(field, list(phrase), doc_id)
+                    streams.append([(pos, pos + len(phrase) - 1, entity_idx) for pos in positions])
+                if not all(streams):
+                    continue
+                occurrences = list(heapq.merge(*streams))
+
+                # Sliding window over the merged occurrences, emitting every minimal window covering all entities
+                counts = [0] * len(phrases)
+                covered = 0
+                left = 0
+                for right, (_, right_end, right_entity) in enumerate(occurrences):
+                    if counts[right_entity] == 0:
+                        covered += 1
+                    counts[right_entity] += 1
+                    if covered < len(phrases):
+                        continue
+                    while counts[occurrences[left][2]] > 1:
+                        counts[occurrences[left][2]] -= 1
+                        left += 1
+                    start = occurrences[left][0]
+                    distance = occurrences[right][0] - start
+                    if distance <= window_size:
+                        key = (-distance, -doc_id, -start)
+                        entry = (key, doc_id, start, right_end)
+                        if len(matches) < top_k:
+                            heapq.heappush(matches, entry)
+                        elif key > matches[0][0]:
+                            heapq.heapreplace(matches, entry)
+                    # Drop the leftmost occurrence and keep scanning
+                    counts[occurrences[left][2]] -= 1
+                    covered -= 1
+                    left += 1
+
+        with stage('serialize'):
+            results = []
+            for (neg_distance, _, _), doc_id, start, end in sorted(matches, reverse=True):
+                doc = index.documents[doc_id]
+                words = doc['content'].split()
+                results.append({
+                    'id': doc_id,
+                    'title': doc['title'],
+                    'context': ' '.join(words[max(0, start - 5):end + 6]),
+                    'entities_found': [names[phrase] for phrase in phrases],
+                    'distance': -neg_distance,
+                    'position': start
+                })
+
+        return results
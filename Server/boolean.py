@@ -1,93 +1,438 @@
-from typing import List, Set, Dict, Any
+import heapq
+import re
+from typing import List, Set, Dict, Any, Tuple, Union, NamedTuple, Optional
+
+import numpy as np
+
+from bim import TextProcessor
+from metrics import count, stage
+
+FIELD = 'words'
+
+# Phrase positions come from the positional field of the searcher, whose
+# analyzer keeps one token (letters only) per whitespace-separated word, so
+# its positions are those of the words in FIELD
+PHRASE_FIELD = 'terms'
+
+OPERATORS = ('and', 'or', 'not')
+
+# Most index terms a single prefix or wildcard may expand to
+MAX_EXPANSIONS = 128
+
+# Parsed query nodes are tuples: ('term', token), ('phrase', (words, terms)),
+# ('pattern', wildcard pattern), ('not', node), ('and', [nodes]) or
+# ('or', [nodes]). Before evaluation patterns are expanded into
+# ('any', [terms]) nodes.
+Node = Tuple[str, Any]
+
+# Intermediate results are dicts whose keys are doc ids in ascending order.
+# Term postings from the index already have that shape, so they are used
+# without copying and double as O(1) membership tables.
+DocSet = Dict[int, Any]
+
+
+class QuerySyntaxError(ValueError):
+    """Raised when a Boolean query cannot be parsed."""
+
+
+class QueryTooBroadError(QuerySyntaxError):
+    """Raised when a prefix or wildcard term matches more than the allowed number of terms."""
+
+
+def tokenize_document(doc: str) -> List[str]:
+    """
+    Convert document to lowercase and split it into words (the index analyzer).
+    """
+    return doc.lower().split()
 
 
 def preprocess_document(doc: str) -> Set[str]:
     """
     Convert document to lowercase and tokenize it into a set of words.
     """
-    return set(doc.lower().split())
+    return set(tokenize_document(doc))
+
+
+class Token(NamedTuple):
+    """Lexical unit of a query: kind is one of TOKEN_KINDS, text the (lowercased) source text."""
+    kind: str
+    text: str
+
+
+# '(' and ')', quoted phrases, and words: runs of anything else up to whitespace, a parenthesis or a quote
+_TOKEN_PATTERN = re.compile(r'\s*(?:([()])|"([^"]*)("?)|([^\s()"]+))')
+
+
+def tokenize_query(query: str) -> List[Token]:
+    """
+    Split a query into tokens; parentheses and quotes need no surrounding spaces.
+
+    Words are lowercased like the index; 'and', 'or' and 'not' are operators
+    in any case. Words containing '*' or '?' are wildcard patterns.
+    """
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = _TOKEN_PATTERN.match(query, position)
+        paren, phrase, closing, word = match.groups()
+        position = match.end()
+        if paren is not None:
+            tokens.append(Token('(' if paren == '(' else ')', paren))
+        elif phrase is not None:
+            if not closing:
+                raise QuerySyntaxError(f"Unterminated phrase at token {len(tokens) + 1}")
+            tokens.append(Token('phrase', phrase.lower()))
+        else:
+            word = word.lower()
+            if word in OPERATORS:
+                tokens.append(Token(word, word))
+            elif '*' in word or '?' in word:
+                tokens.append(Token('pattern', word))
+            else:
+                tokens.append(Token('term', word))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent parser for the query grammar:
+
+        or_expr  := and_expr ('or' and_expr)*
+        and_expr := not_expr (['and'] not_expr)*
+        not_expr := 'not' not_expr | '(' or_expr ')' | phrase | pattern | term
+
+    Adjacent operands without an operator are combined with AND.
+    """
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos].kind if self.pos < len(self.tokens) else None
+
+    def next(self) -> Optional[Token]:
+        token = self.tokens[self.pos] if self.pos < len(self.tokens) else None
+        self.pos += 1
+        return token
+
+    def parse(self) -> Node:
+        if not self.tokens:
+            raise QuerySyntaxError("Query is empty")
+        node = self.parse_or()
+        if self.peek() is not None:
+            if self.peek() == ')':
+                raise QuerySyntaxError(f"Unbalanced parentheses: unexpected ')' at token {self.pos + 1}")
+            raise QuerySyntaxError(f"Unexpected token '{self.tokens[self.pos].text}' at token {self.pos + 1}")
+        return node
+
+    def parse_or(self) -> Node:
+        children = [self.parse_and()]
+        while self.peek() == 'or':
+            self.next()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def parse_and(self) -> Node:
+        children = [self.parse_not()]
+        while self.peek() is not None and self.peek() not in ('or', ')'):
+            if self.peek() == 'and':
+                self.next()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def parse_not(self) -> Node:
+        token = self.next()
+        if token is None:
+            previous = self.tokens[self.pos - 2].kind if self.pos >= 2 else None
+            if previous in OPERATORS:
+                raise QuerySyntaxError(f"Operator '{previous}' is missing an operand")
+            raise QuerySyntaxError("Unexpected end of query")
+        if token.kind == 'not':
+            return ('not', self.parse_not())
+        if token.kind == '(':
+            if self.peek() == ')':
+                raise QuerySyntaxError(f"Empty parentheses at token {self.pos}")
+            node = self.parse_or()
+            if self.next() is None:
+                raise QuerySyntaxError("Unbalanced parentheses: missing ')'")
+            return node
+        if token.kind in ('and', 'or'):
+            raise QuerySyntaxError(f"Operator '{token.kind}' is missing an operand at token {self.pos}")
+        if token.kind == ')':
+            raise QuerySyntaxError(f"Unbalanced parentheses: unexpected ')' at token {self.pos}")
+        if token.kind == 'phrase':
+            words = tokenize_document(token.text)
+            if not words:
+                raise QuerySyntaxError(f"Empty phrase at token {self.pos}")
+            if len(words) == 1:
+                # A one-word phrase is that word: "dog" and dog match the same documents
+                return ('term', words[0])
+            return ('phrase', (words, phrase_terms(token.text)))
+        if token.kind == 'pattern':
+            return ('pattern', token.text)
+        return ('term', token.text)
+
+
+def phrase_terms(text: str) -> List[str]:
+    """
+    Terms of a quoted phrase as the positional field analyzes them, '' for words without letters
+    """
+    terms = TextProcessor.tokenize(text)
+    # Gaps at either end constrain nothing
+    while terms and not terms[0]:
+        terms.pop(0)
+    while terms and not terms[-1]:
+        terms.pop()
+    return terms
+
+
+def parse_query(query: str) -> Node:
+    """
+    Parse a Boolean query string into a query tree.
+    """
+    return _Parser(tokenize_query(query)).parse()
+
+
+def pattern_matcher(pattern: str) -> Tuple[str, Optional[re.Pattern]]:
+    """
+    Split a wildcard pattern into its literal prefix and a regex for whole terms ('*' any run, '?' one character)
+
+    The regex is multiline and anchored with ^ and $, so it can also scan a
+    newline-separated term list. It is None for a plain prefix pattern such as 'comput*'.
+    """
+    wildcard = min(i for i in (pattern.find('*'), pattern.find('?')) if i >= 0)
+    prefix = pattern[:wildcard]
+    if pattern[wildcard:] == '*':
+        return prefix, None
+    body = ''.join('[^\\n]*' if char == '*' else '[^\\n]' if char == '?' else re.escape(char) for char in pattern)
+    return prefix, re.compile(f'^{body}$', re.MULTILINE)
+
+
+def expand_patterns(node: Node, field, max_expansions: int) -> Node:
+    """
+    Replace every pattern node with an ('any', terms) node listing the indexed terms it matches.
+
+    Terms come from the sorted term dictionaries, scanning only the range
+    of the pattern's literal prefix. A pattern matching more than
+    max_expansions terms is rejected instead of being evaluated.
+    """
+    kind, value = node
+    if kind == 'pattern':
+        prefix, regex = pattern_matcher(value)
+        terms = field.expand(prefix, regex, limit=max_expansions)
+        if len(terms) > max_expansions:
+            raise QueryTooBroadError(
+                f"'{value}' matches more than {max_expansions} terms, make the pattern more specific"
+            )
+        return ('any', terms)
+    if kind == 'not':
+        return ('not', expand_patterns(value, field, max_expansions))
+    if kind in ('and', 'or'):
+        return (kind, [expand_patterns(child, field, max_expansions) for child in value])
+    return node
+
+
+def positive_terms(query: str, field=None, max_expansions: int = MAX_EXPANSIONS) -> List[str]:
+    """
+    Words a document matching a Boolean query may match it on, for highlighting.
+
+    These are the query's leaf terms outside any 'not', including the words of
+    phrases. Patterns are expanded over field when given and skipped otherwise,
+    as are patterns matching more than max_expansions terms. Operators and
+    pattern syntax are never returned.
+
+    Raises QuerySyntaxError for malformed queries.
+    """
+    terms = []
+
+    def collect(node: Node, negated: bool):
+        kind, value = node
+        if kind == 'not':
+            collect(value, not negated)
+        elif kind in ('and', 'or'):
+            for child in value:
+                collect(child, negated)
+        elif negated:
+            return
+        elif kind == 'term':
+            terms.append(value)
+        elif kind == 'phrase':
+            terms.extend(value[0])
+        elif kind == 'pattern' and field is not None:
+            prefix, regex = pattern_matcher(value)
+            expansions = field.expand(prefix, regex, limit=max_expansions)
+            if len(expansions) <= max_expansions:
+                terms.extend(expansions)
+
+    collect(parse_query(query), False)
+    return list(dict.fromkeys(terms))
 
 
-def boolean_and(set1: Set[int], set2: Set[int]) -> Set[int]:
+def estimate_size(node: Node, field, num_docs: int) -> int:
     """
-    Perform AND operation on two sets.
+    Upper bound on the number of documents a node matches, used to order operands.
     """
-    return set1.intersection(set2)
+    kind, value = node
+    if kind == 'term':
+        return field.df(value)
+    if kind == 'phrase':
+        return min(field.df(word) for word in value[0])
+    if kind == 'any':
+        return min(num_docs, sum(field.df(term) for term in value))
+    if kind == 'not':
+        return num_docs - estimate_size(value, field, num_docs)
+    sizes = [estimate_size(child, field, num_docs) for child in value]
+    return min(sizes) if kind == 'and' else min(num_docs, sum(sizes))
 
 
-def boolean_or(set1: Set[int], set2: Set[int]) -> Set[int]:
+def boolean_and(docs1: DocSet, docs2: DocSet) -> DocSet:
     """
-    Perform OR operation on two sets.
+    Intersect two doc sets by probing the larger with the smaller.
     """
-    return set1.union(set2)
+    if len(docs1) > len(docs2):
+        docs1, docs2 = docs2, docs1
+    return dict.fromkeys(doc_id for doc_id in docs1 if doc_id in docs2)
 
 
-def boolean_not(set1: Set[int], universe: Set[int]) -> Set[int]:
+def boolean_or(doc_sets: List[DocSet]) -> DocSet:
     """
-    Perform NOT operation relative to the universe of document indices.
+    Merge several sorted doc sets into one.
     """
-    return universe.difference(set1)
+    if len(doc_sets) == 1:
+        return doc_sets[0]
+    return dict.fromkeys(heapq.merge(*doc_sets))
 
 
-def infix_to_postfix(query_tokens: List[str]) -> List[str]:
+def boolean_not(docs1: DocSet, docs2: DocSet) -> DocSet:
     """
-    Convert an infix Boolean query to postfix notation for evaluation.
+    Remove the documents of docs2 from docs1 (AND NOT).
+    """
+    return dict.fromkeys(doc_id for doc_id in docs1 if doc_id not in docs2)
+
+
+def evaluate(node: Node, field, num_docs: int) -> Tuple[DocSet, bool]:
     """
-    precedence = {'not': 3, 'and': 2, 'or': 1}
-    output = []
-    operators = []
-    
-    for token in query_tokens:
-        if token in ['and', 'or', 'not']:
-            while (operators and operators[-1] != '(' and
-                   precedence[token] <= precedence[operators[-1]]):
-                output.append(operators.pop())
-            operators.append(token)
-        elif token == '(':
-            operators.append(token)
-        elif token == ')':
-            while operators and operators[-1] != '(':
-                output.append(operators.pop())
-            operators.pop()  # Pop '('
+    Evaluate a query tree against the field's postings.
+
+    Returns (docs, negated): when negated is True the node matches every live
+    document except docs. Keeping negation symbolic lets AND NOT run as a
+    difference and defers any complement to the root of the query.
+    """
+    kind, value = node
+    if kind == 'term':
+        postings = field.get_postings(value)
+        count('postings_touched', len(postings))
+        return postings, False
+
+    if kind == 'phrase':
+        # Every word must be present exactly as a bare term, so "a b" implies a AND b;
+        # positions then come from the words' letter-only forms in PHRASE_FIELD
+        words, terms = value
+        docs, _ = evaluate(('and', [('term', word) for word in words]), field, num_docs)
+        if not docs or sum(1 for term in terms if term) < 2:
+            return docs, False
+        doc_ids = field.corpus.field(PHRASE_FIELD).phrase_doc_ids(terms)
+        count('postings_touched', len(doc_ids))
+        candidates = np.fromiter(docs, dtype=np.int64, count=len(docs))
+        return dict.fromkeys(np.intersect1d(doc_ids, candidates, assume_unique=True).tolist()), False
+
+    if kind == 'any':
+        postings = [field.get_postings(term) for term in value]
+        count('postings_touched', sum(len(docs) for docs in postings))
+        if len(postings) == 1:
+            return postings[0], False
+        doc_parts = [docs.doc_ids for docs in postings if len(docs)]
+        if not doc_parts:
+            return {}, False
+        return dict.fromkeys(np.unique(np.concatenate(doc_parts)).tolist()), False
+
+    if kind == 'not':
+        docs, negated = evaluate(value, field, num_docs)
+        return docs, not negated
+
+    # Cheapest operands first, so AND chains shrink as early as possible
+    children = sorted(value, key=lambda child: estimate_size(child, field, num_docs))
+
+    if kind == 'and':
+        result = None
+        excluded = []
+        for child in children:
+            if result is not None and child[0] == 'term':
+                # Probe the term's skip lists with the candidates instead of decoding all its postings
+                candidates = np.fromiter(result, dtype=np.int64, count=len(result))
+                count('postings_touched', len(candidates))
+                result = dict.fromkeys(field.intersect(child[1], candidates).tolist())
+                if not result:
+                    return {}, False
+                continue
+            docs, negated = evaluate(child, field, num_docs)
+            if negated:
+                excluded.append(docs)
+                continue
+            result = docs if result is None else boolean_and(result, docs)
+            if not result:
+                return {}, False
+
+        if result is None:
+            # not a and not b == not (a or b)
+            return boolean_or(excluded), True
+        for docs in excluded:
+            result = boolean_not(result, docs)
+            if not result:
+                break
+        return result, False
+
+    included = []
+    excluded = None
+    for child in children:
+        docs, negated = evaluate(child, field, num_docs)
+        if not negated:
+            included.append(docs)
         else:
-            output.append(token)
-    
-    while operators:
-        output.append(operators.pop())
-    
-    return output
+            # not a or not b == not (a and b)
+            excluded = docs if excluded is None else boolean_and(excluded, docs)
+            if not excluded:
+                # Complement of nothing: every live document matches
+                return {}, True
+
+    if excluded is None:
+        return boolean_or(included), False
+    # a or not b == not (b and not a)
+    for docs in included:
+        excluded = boolean_not(excluded, docs)
+    return excluded, True
 
 
-def evaluate_postfix(postfix_tokens: List[str], processed_docs: List[Set[str]], universe: Set[int]) -> Set[int]:
+def process_query(query: str, index, max_expansions: int = MAX_EXPANSIONS) -> List[int]:
     """
-    Evaluate a Boolean query in postfix notation against processed documents.
+    Parse and process a Boolean query, returning matching document indices in ascending order.
+
+    Besides terms, the operators and parentheses, queries may contain quoted
+    phrases ("information retrieval") and prefix or wildcard terms (comput*,
+    wom?n), which stand for the OR of the matching index terms.
+
+    Phrase words are matched like bare terms (lowercased whitespace words,
+    punctuation included), and must also be adjacent. Adjacency is read
+    from the positional field, which strips non-letters, so "dog's bone"
+    needs the words dog's and bone and the tokens dogs and bone adjacent;
+    words without letters only hold their place.
+
+    Raises QuerySyntaxError for malformed queries, and its subclass
+    QueryTooBroadError when a pattern matches more than max_expansions terms.
     """
-    stack = []
-    
-    for token in postfix_tokens:
-        if token in ['and', 'or', 'not']:
-            if token == 'not':
-                set1 = stack.pop()
-                stack.append(boolean_not(set1, universe))
-            else:
-                set2 = stack.pop()
-                set1 = stack.pop()
-                if token == 'and':
-                    stack.append(boolean_and(set1, set2))
-                elif token == 'or':
-                    stack.append(boolean_or(set1, set2))
-        else:  # Token is a term
-            term_set = set(idx for idx, doc in enumerate(processed_docs) if token in doc)
-            stack.append(term_set)
-    
-    return stack[0]
-
-
-def process_query(query: str, processed_docs: List[Set[str]]) -> Set[int]:
-    """
-    Parse and process a Boolean query, returning matching document indices.
-    """
-    query_tokens = query.lower().split()
-    universe = set(range(len(processed_docs)))
-    postfix_tokens = infix_to_postfix(query_tokens)
-    return evaluate_postfix(postfix_tokens, processed_docs, universe)
+    with stage('parse'):
+        tree = expand_patterns(parse_query(query), index.field(FIELD), max_expansions)
+    with stage('index_lookup'):
+        docs, negated = evaluate(tree, index.field(FIELD), len(index))
+        if not negated:
+            result = list(docs)
+        else:
+            # Complement over the live-document bitmap
+            mask = np.frombuffer(index.live, dtype=np.uint8).astype(bool)
+            if docs:
+                mask[np.fromiter(docs, dtype=np.int64, count=len(docs))] = False
+            result = np.flatnonzero(mask).tolist()
+    count('documents_scored', len(result))
+    return result
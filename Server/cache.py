@@ -0,0 +1,181 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a query for cache keys: lowercased, whitespace collapsed.
+
+    Every cached model lowercases and splits its input, so the normalized
+    query always produces the same results as the original.
+    """
+    return ' '.join(query.lower().split())
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Approximate memory footprint of a cached result in bytes
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class ResultCache:
+    """
+    LRU cache of search results keyed by (endpoint, normalized query, parameters, corpus version).
+
+    Entries are bounded both in number and in estimated bytes. Results are
+    only valid for the corpus version they were computed on, so the whole
+    cache is dropped as soon as a lookup sees a newer version. Requests
+    still reading an older snapshot bypass the cache.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        """
+        :param max_entries: Number of cached results, 0 disables the cache
+        :param max_bytes: Upper bound on the estimated size of all cached results
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version: int) -> bool:
+        """
+        Move the cache to a newer corpus version, returning whether version is the cached one
+        """
+        if self._version is None or version > self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+        return version == self._version
+
+    def get_or_compute(self, endpoint: str, query: str, params: Hashable, version: int,
+                       compute: Callable[[], Any], complete: Optional[Callable[[], bool]] = None) -> Any:
+        """
+        Return the cached result for a request, computing and storing it on a miss
+
+        :param endpoint: Name of the search endpoint
+        :param query: Raw query string, normalized for the key
+        :param params: Hashable tuple of the other request parameters
+        :param version: Corpus version the result is computed against
+        :param compute: Callable producing the result
+        :param complete: Called after compute; a False result is returned but not stored, e.g.
+            because some of the data it was computed from had not reached version yet
+        """
+        if self.max_entries <= 0:
+            return compute()
+
+        key = (endpoint, normalize_query(query), params)
+        with self._lock:
+            current = self._check_version(version)
+            entry = self._entries.get(key) if current else None
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[0]
+            self.misses += 1
+
+        result = compute()
+        if complete is not None and not complete():
+            return result
+        size = estimate_size(result)
+        if size > self.max_bytes:
+            return result
+
+        with self._lock:
+            # Drop results computed while the corpus changed underneath
+            if version != self._version or key in self._entries:
+                return result
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+class BoundedCache:
+    """
+    Thread-safe LRU cache bounded by the total weight of its entries.
+
+    The caller weighs every entry (for instance by the number of postings
+    it holds), so the cache keeps many light entries or a few heavy ones.
+    An entry heavier than the whole budget is returned but not stored.
+    """
+
+    def __init__(self, max_weight: int):
+        """
+        :param max_weight: Upper bound on the summed weight of the cached entries
+        """
+        self.max_weight = max_weight
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], weigh: Callable[[Any], int]) -> Any:
+        """
+        Return the cached value for key, computing, weighing and storing it on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        value = compute()
+        weight = weigh(value)
+        if weight > self.max_weight:
+            return value
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Computed concurrently, keep the first result
+                return entry[0]
+            self._entries[key] = (value, weight)
+            self._weight += weight
+            while self._weight > self.max_weight:
+                _, (_, evicted_weight) = self._entries.popitem(last=False)
+                self._weight -= evicted_weight
+        return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def weight(self) -> int:
+        return self._weight
@@ -0,0 +1,801 @@
+import re
+import threading
+from bisect import bisect_right
+from collections import deque
+from collections.abc import Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from analysis_pool import AnalysisPool
+from merge import DEFAULT_MERGE_POLICY, MergePolicy, SegmentMerger
+from segment import EMPTY_POSTINGS, FieldSegment, PostingList, Segment, build_segment, merge_segments
+from storage import IndexDirectory
+
+Analyzer = Callable[[str], List[str]]
+
+MANIFEST_FORMAT = 2
+
+
+class Snapshot:
+    """
+    Immutable view of the corpus at one version: its segments and live-document bitmap.
+
+    Writers publish a new snapshot in a single reference assignment, so
+    readers holding a snapshot never see a half-applied batch. Statistics
+    derived from a snapshot (document lengths, norms, term weights) are
+    memoized on it and are dropped with it.
+    """
+
+    __slots__ = ('version', 'segments', 'bases', 'num_docs', 'live', 'num_live', '_memo')
+
+    def __init__(self, version: int, segments: List[Segment], live: bytes):
+        self.version = version
+        self.segments = tuple(segments)
+        self.bases = [segment.base for segment in segments]
+        self.num_docs = segments[-1].base + segments[-1].num_docs if segments else 0
+        # One byte per document, 1 while the document is live, 0 once deleted
+        self.live = live
+        self.num_live = len(live) - live.count(0)
+        self._memo: Dict[Hashable, Any] = {}
+
+    def segment_of(self, doc_id: int) -> Segment:
+        return self.segments[bisect_right(self.bases, doc_id) - 1]
+
+    def is_live(self, doc_id: int) -> bool:
+        return 0 <= doc_id < self.num_docs and self.live[doc_id] == 1
+
+    def live_mask(self) -> np.ndarray:
+        """
+        Read-only boolean view of the live bitmap, indexed by doc id
+        """
+        return self.memo('live_mask', lambda: np.frombuffer(self.live, dtype=np.bool_))
+
+    def live_ids(self) -> np.ndarray:
+        """
+        Ids of the live documents, ascending
+        """
+        return self.memo('live_ids', lambda: np.flatnonzero(self.live_mask()))
+
+    def deleted_counts(self) -> Tuple[int, ...]:
+        """
+        Number of deleted documents in each segment
+        """
+        return self.memo('deleted_counts', lambda: tuple(
+            self.live.count(0, segment.base, segment.base + segment.num_docs) for segment in self.segments
+        ))
+
+    def segment_masks(self) -> Tuple[Optional[np.ndarray], ...]:
+        """
+        Per segment, its local live mask when deleted documents still have postings in it, else None
+        """
+        def compute():
+            mask = self.live_mask()
+            # Deletes are final, so a segment whose merge dropped as many documents as are deleted holds none of them
+            return tuple(
+                mask[segment.base:segment.base + segment.num_docs] if deleted > segment.dropped else None
+                for segment, deleted in zip(self.segments, self.deleted_counts())
+            )
+        return self.memo('segment_masks', compute)
+
+    def memo(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Value computed once per snapshot; concurrent first calls may both compute, one result wins
+        """
+        value = self._memo.get(key)
+        if value is None:
+            value = self._memo.setdefault(key, compute())
+        return value
+
+
+class BlockPostings:
+    """
+    Postings of a term across the live segments, as per-block skip data plus blocks decoded on demand.
+
+    Block b covers the global doc ids up to last[b]; max_tfs[b] and
+    min_lengths[b] bound the term frequencies and document lengths inside
+    it, deleted documents included. read(b) decodes a single block and
+    drops its deleted documents, which may leave it empty.
+    """
+
+    __slots__ = ('last', 'max_tfs', 'min_lengths', '_parts', '_starts')
+
+    def __init__(self, parts: List[Tuple[FieldSegment, Optional[np.ndarray], int]]):
+        """
+        :param parts: (field segment, local live mask or None, term id) of every segment holding the term
+        """
+        self._parts = parts
+        self._starts = [0]
+        bounds = []
+        for segment, _, term_id in parts:
+            last, max_tfs, min_lengths = segment.block_bounds(term_id)
+            bounds.append((last.astype(np.int64) + segment.base, max_tfs, min_lengths))
+            self._starts.append(self._starts[-1] + len(last))
+        if bounds:
+            self.last, self.max_tfs, self.min_lengths = (np.concatenate(values) for values in zip(*bounds))
+        else:
+            self.last = self.max_tfs = self.min_lengths = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self._starts[-1]
+
+    def read(self, block: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Global doc ids and term frequencies of the live postings of one block
+        """
+        part = bisect_right(self._starts, block) - 1
+        segment, mask, term_id = self._parts[part]
+        docs, tfs = segment.block_postings(term_id, block - self._starts[part])
+        if mask is not None:
+            live = mask[docs]
+            docs, tfs = docs[live], tfs[live]
+        return docs.astype(np.int64) + segment.base, tfs
+
+
+class FieldIndex:
+    """
+    Inverted index over one analyzed view of the corpus.
+
+    The field is a view across the corpus segments: the postings of a term
+    are the concatenation of its per-segment postings, and collection
+    statistics are aggregated over segments once per corpus version.
+
+    Deleted documents are filtered out of postings, document frequencies
+    and length statistics until a merge drops them from the segments.
+
+    Analyzers may emit empty strings as placeholders: they are not indexed
+    but still advance token positions, so positions can line up with the
+    words of the raw text.
+    """
+
+    def __init__(self, corpus: 'CorpusIndex', name: str, analyzer: Analyzer, positional: bool = False):
+        """
+        Initialize a field view
+
+        :param corpus: Owning corpus index
+        :param name: Name of the field inside the segments
+        :param analyzer: Callable turning raw text into a list of terms
+        :param positional: Also record the sorted token positions of every posting
+        """
+        self.corpus = corpus
+        self.name = name
+        self.analyzer = analyzer
+        self.positional = positional
+
+    def analyze(self, text: str) -> List[str]:
+        """
+        Run the field analyzer over a piece of text (documents or queries)
+        """
+        return [term for term in self.analyzer(text) if term]
+
+    def segments(self) -> List[FieldSegment]:
+        """
+        This field in every segment, in document id order (deleted documents included)
+        """
+        return [segment.fields[self.name] for segment in self.corpus.segments]
+
+    def _live_segments(self) -> List[Tuple[FieldSegment, Optional[np.ndarray]]]:
+        """
+        (field segment, local live mask or None when nothing in it is deleted) per segment
+        """
+        snapshot = self.corpus.snapshot()
+        return snapshot.memo(('live_segments', self.name), lambda: [
+            (segment.fields[self.name], mask) for segment, mask in zip(snapshot.segments, snapshot.segment_masks())
+        ])
+
+    def get_postings(self, term: str) -> PostingList:
+        """
+        Return the postings of a term as {doc_id: term frequency}, in ascending doc id order
+        """
+        doc_parts, tf_parts = [], []
+        for segment, mask in self._live_segments():
+            term_id = segment.term_id(term)
+            if term_id is not None:
+                docs, tfs = segment.postings(term_id)
+                if mask is not None:
+                    live = mask[docs]
+                    docs, tfs = docs[live], tfs[live]
+                doc_parts.append(docs.astype(np.int64) + segment.base)
+                tf_parts.append(tfs)
+        if not doc_parts:
+            return EMPTY_POSTINGS
+        if len(doc_parts) == 1:
+            return PostingList(doc_parts[0], tf_parts[0])
+        return PostingList(np.concatenate(doc_parts), np.concatenate(tf_parts))
+
+    def get_blocks(self, term: str) -> BlockPostings:
+        """
+        The postings of a term as skip data, decoding nothing until a block is read
+        """
+        parts = []
+        for segment, mask in self._live_segments():
+            term_id = segment.term_id(term)
+            if term_id is not None:
+                parts.append((segment, mask, term_id))
+        return BlockPostings(parts)
+
+    def get_positions(self, term: str, doc_id: int) -> List[int]:
+        """
+        Sorted token positions of a term in a document (positional fields only)
+        """
+        segment = self.corpus.segment_of(doc_id).fields[self.name]
+        term_id = segment.term_id(term)
+        if term_id is None:
+            return []
+        return segment.get_positions(term_id, doc_id - segment.base)
+
+    def has_term(self, term: str) -> bool:
+        """
+        Whether any live document contains the term
+        """
+        for segment, mask in self._live_segments():
+            term_id = segment.term_id(term)
+            if term_id is not None and (mask is None or mask[segment.doc_ids(term_id)].any()):
+                return True
+        return False
+
+    def df(self, term: str) -> int:
+        """
+        Document frequency of a term over the live documents
+        """
+        df = 0
+        for segment, mask in self._live_segments():
+            term_id = segment.term_id(term)
+            if term_id is None:
+                continue
+            if mask is None:
+                df += int(segment.postings_ptr[term_id + 1] - segment.postings_ptr[term_id])
+            else:
+                df += int(mask[segment.doc_ids(term_id)].sum())
+        return df
+
+    def phrase_doc_ids(self, terms: List[str]) -> np.ndarray:
+        """
+        Ids of the live documents containing the terms at consecutive positions, in ascending order
+
+        '' in terms matches any single token. Documents holding every term
+        are found first, rarest term first; only their positions are read.
+
+        :param terms: Analyzed phrase, at least one term not ''
+        """
+        if not self.positional:
+            raise ValueError(f"Field '{self.name}' has no positions for phrase queries")
+        offsets = [offset for offset, term in enumerate(terms) if term]
+        doc_parts = []
+        for segment, mask in self._live_segments():
+            term_ids = [segment.term_id(terms[offset]) for offset in offsets]
+            if None in term_ids:
+                continue
+            # Decode the rarest term, then probe the skip lists of the others with its documents
+            by_df = sorted(set(term_ids), key=lambda term_id: segment.postings_ptr[term_id + 1] - segment.postings_ptr[term_id])
+            local_ids = segment.doc_ids(by_df[0]).astype(np.int64)
+            if mask is not None:
+                local_ids = local_ids[mask[local_ids]]
+            for term_id in by_df[1:]:
+                if not len(local_ids):
+                    break
+                local_ids = local_ids[segment.lookup(term_id, local_ids) >= 0]
+            if not len(local_ids):
+                continue
+
+            # A phrase start is a (document, position) key present for every term, shifted by its offset
+            starts = None
+            for offset, term_id in zip(offsets, term_ids):
+                docs, positions = segment.doc_positions(term_id, local_ids)
+                positions = positions.astype(np.int64)
+                valid = positions >= offset
+                keys = (docs[valid] << 32) | (positions[valid] - offset)
+                starts = keys if starts is None else np.intersect1d(starts, keys)
+                if not len(starts):
+                    break
+            if len(starts):
+                doc_parts.append(np.unique(starts >> 32) + segment.base)
+        if not doc_parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(doc_parts)
+
+    def intersect(self, term: str, doc_ids: np.ndarray) -> np.ndarray:
+        """
+        The documents of doc_ids that contain a term
+
+        Probes the skip lists of the term's postings, so blocks holding none
+        of doc_ids are never decoded.
+
+        :param doc_ids: Sorted ids of live documents
+        """
+        parts = []
+        snapshot = self.corpus.snapshot()
+        bounds = np.searchsorted(doc_ids, snapshot.bases + [snapshot.num_docs])
+        for (segment, _), first, last in zip(self._live_segments(), bounds[:-1], bounds[1:]):
+            if first == last:
+                continue
+            term_id = segment.term_id(term)
+            if term_id is not None:
+                candidates = doc_ids[first:last]
+                parts.append(candidates[segment.lookup(term_id, candidates - segment.base) >= 0])
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def expand(self, prefix: str, pattern: Optional[re.Pattern] = None, limit: Optional[int] = None) -> List[str]:
+        """
+        Sorted distinct terms starting with prefix, read from the term dictionaries
+
+        :param prefix: Literal start every term must have
+        :param pattern: Multiline pattern anchored with ^ and $ a term must also match
+        :param limit: Stop once more than limit terms are found; limit + 1 are returned then
+        """
+        terms = set()
+        for segment, _ in self._live_segments():
+            if pattern is not None and not prefix:
+                # Nothing narrows the dictionary: scan it whole
+                candidates = segment.search_terms(pattern)
+            else:
+                start, end = segment.prefix_range(prefix)
+                candidates = (segment.term(term_id) for term_id in range(start, end))
+                if pattern is not None:
+                    candidates = (term for term in candidates if pattern.fullmatch(term))
+            for term in candidates:
+                terms.add(term)
+                if limit is not None and len(terms) > limit:
+                    return sorted(terms)[:limit + 1]
+        return sorted(terms)
+
+    def vocabulary(self) -> Set[str]:
+        """
+        Every distinct term of the field, including terms that only deleted documents held until they are merged away
+        """
+        terms = set()
+        for segment in self.segments():
+            terms.update(segment.terms())
+        return terms
+
+    def _stats(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (document lengths, distinct terms per document) of the current snapshot, 0 for deleted documents
+        """
+        snapshot = self.corpus.snapshot()
+
+        def compute():
+            segments = [segment.fields[self.name] for segment in snapshot.segments]
+            if not segments:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+            doc_lengths = np.concatenate([s.doc_lengths for s in segments]).astype(np.int64)
+            doc_unique_terms = np.concatenate([np.diff(s.forward_ptr) for s in segments]).astype(np.int64)
+            if snapshot.num_live < snapshot.num_docs:
+                dead = ~snapshot.live_mask()
+                doc_lengths[dead] = 0
+                doc_unique_terms[dead] = 0
+            return doc_lengths, doc_unique_terms
+        return snapshot.memo(('field_stats', self.name), compute)
+
+    @property
+    def doc_lengths(self) -> np.ndarray:
+        return self._stats()[0]
+
+    @property
+    def doc_unique_terms(self) -> np.ndarray:
+        return self._stats()[1]
+
+    @property
+    def total_length(self) -> int:
+        return int(self.doc_lengths.sum())
+
+    @property
+    def num_docs(self) -> int:
+        """
+        Number of live documents
+        """
+        return self.corpus.num_live
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_length / self.num_docs if self.num_docs else 0.0
+
+
+class DocumentStore(Sequence):
+    """
+    Read-only sequence of {'title', 'content'} dicts, decoded from the segments on access.
+
+    Indexed by doc id, so deleted documents keep their slot: check
+    CorpusIndex.is_live, or iterate items() for the live documents only.
+    Once merged away, a deleted document has an empty title and content.
+    """
+
+    def __init__(self, corpus: 'CorpusIndex'):
+        self.corpus = corpus
+
+    def __len__(self) -> int:
+        return self.corpus.num_docs
+
+    def __getitem__(self, doc_id: int) -> dict:
+        if not 0 <= doc_id < len(self):
+            raise IndexError(f"Document id {doc_id} out of range")
+        segment = self.corpus.segment_of(doc_id)
+        return segment.document(doc_id - segment.base)
+
+    def __iter__(self):
+        for segment in self.corpus.segments:
+            for local_id in range(segment.num_docs):
+                yield segment.document(local_id)
+
+    def items(self):
+        """
+        (doc_id, document) of every live document, in document order
+        """
+        snapshot = self.corpus.snapshot()
+        for doc_id in snapshot.live_ids().tolist():
+            segment = snapshot.segment_of(doc_id)
+            yield doc_id, segment.document(doc_id - segment.base)
+
+    def title(self, doc_id: int) -> str:
+        """
+        Title of a document, without decoding its content
+        """
+        segment = self.corpus.segment_of(doc_id)
+        return segment.title(doc_id - segment.base)
+
+
+class CorpusIndex:
+    """
+    Document store plus one inverted index per analyzed field.
+
+    Every search model reads its statistics from here instead of
+    re-tokenizing the corpus on each request. Each uploaded batch becomes an
+    immutable segment; given a path, segments are written to disk and
+    memory-mapped, so a restarted server answers queries from the files
+    without analyzing any text again.
+
+    Deleting a document only clears its byte in the live bitmap, and an
+    update is a delete plus an add committed together; the document's
+    postings are skipped at read time until a background merge rewrites
+    its segment. Doc ids are never reused or renumbered.
+
+    The committed state is an immutable Snapshot swapped in atomically by
+    writers. Readers never lock: segments, version, live and num_docs come
+    from the snapshot pinned for the current context (see pin), or from the
+    latest one when nothing is pinned.
+
+    Listeners (add_listener and friends) run after a change is published,
+    outside the write lock, but one commit at a time in commit order, so
+    mirrors such as the shard processes apply segments in doc id order.
+    """
+
+    def __init__(self, analyzers: Dict[str, Analyzer], positional: Iterable[str] = (), path: Optional[str] = None,
+                 workers: int = 1, merge_policy: Optional[MergePolicy] = DEFAULT_MERGE_POLICY):
+        """
+        Initialize the corpus, opening the segments already stored under path
+
+        :param analyzers: Mapping of field name to the analyzer that produces its terms
+        :param positional: Names of the fields that also keep token positions
+        :param path: Directory of the persistent index, None to keep segments in memory
+        :param workers: Processes used to analyze large batches, 1 to analyze in-process
+        :param merge_policy: Segments merged in the background after each commit, None to never merge
+        """
+        self.positional = set(positional)
+        self.fields: Dict[str, FieldIndex] = {
+            name: FieldIndex(self, name, analyzer, positional=name in self.positional)
+            for name, analyzer in analyzers.items()
+        }
+        self.analysis = AnalysisPool(analyzers, workers)
+        self.documents = DocumentStore(self)
+        self._snapshot = Snapshot(0, [], b'')
+        self._pinned: ContextVar[Optional[Snapshot]] = ContextVar(f'corpus_snapshot_{id(self)}', default=None)
+        self._next_segment = 0
+        self._listeners: List[Callable[[Segment], None]] = []
+        self._delete_listeners: List[Callable[[List[int]], None]] = []
+        self._merge_listeners: List[Callable[[Tuple[Segment, ...], Segment], None]] = []
+        self._write_lock = threading.Lock()
+        # Listener calls of committed changes, queued under the write lock so in commit order
+        self._notifications: Deque[Tuple[List[Callable], tuple]] = deque()
+        self._listener_lock = threading.Lock()
+        self.listener_failures = 0
+        self.last_listener_error: Optional[str] = None
+        self.merger = SegmentMerger(self, merge_policy) if merge_policy is not None else None
+        self.directory = IndexDirectory(path) if path else None
+        if self.directory:
+            self._load()
+
+    def _manifest(self, snapshot: Snapshot, next_segment: int) -> dict:
+        live = snapshot.live_mask()
+        return {
+            'format': MANIFEST_FORMAT,
+            'version': snapshot.version,
+            'next_segment': next_segment,
+            'fields': sorted(self.fields),
+            'positional': sorted(self.positional),
+            'segments': [
+                {
+                    'name': segment.name,
+                    'base': segment.base,
+                    'num_docs': segment.num_docs,
+                    # Local ids of the deleted documents
+                    'deleted': np.flatnonzero(~live[segment.base:segment.base + segment.num_docs]).tolist()
+                    if deleted else [],
+                }
+                for segment, deleted in zip(snapshot.segments, snapshot.deleted_counts())
+            ],
+        }
+
+    def _load(self):
+        """
+        Memory-map the segments listed in the manifest
+        """
+        manifest = self.directory.read_manifest()
+        if manifest is None:
+            self.directory.remove_unreferenced([])
+            return
+        if manifest['format'] > MANIFEST_FORMAT:
+            raise ValueError(f"Index in {self.directory.path} has format {manifest['format']}, "
+                             f"this version reads up to {MANIFEST_FORMAT}")
+        if manifest['fields'] != sorted(self.fields) or manifest['positional'] != sorted(self.positional):
+            raise ValueError(
+                f"Index in {self.directory.path} has fields {manifest['fields']}, expected {sorted(self.fields)}"
+            )
+
+        names = [entry['name'] for entry in manifest['segments']]
+        self.directory.remove_unreferenced(names)
+        segments = [
+            Segment(entry['name'], entry['base'], *self.directory.open_segment(entry['name']))
+            for entry in manifest['segments']
+        ]
+        num_docs = segments[-1].base + segments[-1].num_docs if segments else 0
+        live = bytearray(b'\x01' * num_docs)
+        for entry in manifest['segments']:
+            for local_id in entry.get('deleted', ()):
+                live[entry['base'] + local_id] = 0
+        self._snapshot = Snapshot(manifest['version'], segments, bytes(live))
+        self._next_segment = manifest['next_segment']
+
+    def latest(self) -> Snapshot:
+        """
+        The latest committed snapshot, ignoring any pin
+        """
+        return self._snapshot
+
+    def snapshot(self) -> Snapshot:
+        """
+        The snapshot pinned for the current context, else the latest committed one
+        """
+        return self._pinned.get() or self._snapshot
+
+    def pin(self, snapshot: Snapshot = None):
+        """
+        Make every read in the current context use one snapshot (the latest by default)
+
+        :return: Token for unpin
+        """
+        return self._pinned.set(snapshot or self._snapshot)
+
+    def unpin(self, token):
+        self._pinned.reset(token)
+
+    @contextmanager
+    def pinned(self):
+        """
+        Context manager pinning the latest snapshot (or keeping an outer pin), yielding it
+
+        In-process readers running alongside writers should search inside
+        this block so every lookup sees the same version.
+        """
+        snapshot = self._pinned.get()
+        if snapshot is not None:
+            yield snapshot
+            return
+        token = self.pin()
+        try:
+            yield self._pinned.get()
+        finally:
+            self.unpin(token)
+
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        return self.snapshot().segments
+
+    @property
+    def version(self) -> int:
+        return self.snapshot().version
+
+    @property
+    def live(self) -> bytes:
+        return self.snapshot().live
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    @property
+    def num_docs(self) -> int:
+        """
+        Size of the doc id space, deleted documents included
+        """
+        return self.snapshot().num_docs
+
+    @property
+    def num_live(self) -> int:
+        """
+        Number of documents not deleted, the N of collection statistics
+        """
+        return self.snapshot().num_live
+
+    def is_live(self, doc_id: int) -> bool:
+        return self.snapshot().is_live(doc_id)
+
+    def live_ids(self) -> np.ndarray:
+        return self.snapshot().live_ids()
+
+    def field(self, name: str) -> FieldIndex:
+        """
+        Return the field index registered under name
+        """
+        return self.fields[name]
+
+    def segment_of(self, doc_id: int) -> Segment:
+        """
+        Return the segment holding a document id
+        """
+        return self.snapshot().segment_of(doc_id)
+
+    def add_listener(self, listener: Callable[[Segment], None]):
+        """
+        Register a callable invoked with every newly committed segment
+        """
+        self._listeners.append(listener)
+
+    def add_delete_listener(self, listener: Callable[[List[int]], None]):
+        """
+        Register a callable invoked with the ids of every committed batch of deletions
+        """
+        self._delete_listeners.append(listener)
+
+    def add_merge_listener(self, listener: Callable[[Tuple[Segment, ...], Segment], None]):
+        """
+        Register a callable invoked with (source segments, merged segment) after every merge
+        """
+        self._merge_listeners.append(listener)
+
+    def add_documents(self, docs: Iterable[dict], replace: Iterable[int] = ()) -> List[int]:
+        """
+        Analyze a batch of documents and commit it as a new segment
+
+        :param docs: Dictionaries with 'title' and 'content' keys
+        :param replace: Ids of documents deleted in the same commit (an update); ids not live are ignored
+        :return: Ids assigned to the new documents
+        """
+        docs = list(docs)
+        replace = list(replace)
+        if not docs:
+            self.delete_documents(replace)
+            return []
+        field_tokens = self.analysis.analyze([doc['content'] for doc in docs])
+        index_buffer, docs_buffer = build_segment(docs, field_tokens, self.positional)
+
+        with self._write_lock:
+            current = self._snapshot
+            base = current.num_docs
+            live, deleted = self._tombstone(current.live, replace)
+            name = f'seg_{self._next_segment:06d}'
+            segment = Segment(name, base, index_buffer, docs_buffer)
+            snapshot = Snapshot(current.version + 1, list(current.segments) + [segment], live + b'\x01' * len(docs))
+            if self.directory:
+                # Segment files must be durable before the manifest references them
+                self.directory.write_segment(name, index_buffer, docs_buffer)
+                self.directory.write_manifest(self._manifest(snapshot, self._next_segment + 1))
+                segment = Segment(name, base, *self.directory.open_segment(name))
+                snapshot = Snapshot(snapshot.version, list(current.segments) + [segment], snapshot.live)
+
+            # Readers see either the old or the new snapshot, never a partial one
+            self._snapshot = snapshot
+            self._next_segment += 1
+            self._notifications.append((self._listeners, (segment,)))
+            if deleted:
+                self._notifications.append((self._delete_listeners, (deleted,)))
+
+        self._committed()
+        return list(range(base, base + len(docs)))
+
+    def delete_documents(self, doc_ids: Iterable[int]) -> List[int]:
+        """
+        Delete documents by clearing their live bits; postings stay until their segment is merged
+
+        :param doc_ids: Ids to delete; ids that are out of range or already deleted are ignored
+        :return: Ids that were live and are now deleted
+        """
+        doc_ids = list(doc_ids)
+        with self._write_lock:
+            current = self._snapshot
+            live, deleted = self._tombstone(current.live, doc_ids)
+            if not deleted:
+                return []
+            snapshot = Snapshot(current.version + 1, list(current.segments), live)
+            if self.directory:
+                self.directory.write_manifest(self._manifest(snapshot, self._next_segment))
+            self._snapshot = snapshot
+            self._notifications.append((self._delete_listeners, (deleted,)))
+        self._committed()
+        return deleted
+
+    @staticmethod
+    def _tombstone(live: bytes, doc_ids: List[int]) -> Tuple[bytes, List[int]]:
+        """
+        Copy of the live bitmap with doc_ids cleared, and the sorted ids that were live
+        """
+        deleted = sorted({doc_id for doc_id in doc_ids if 0 <= doc_id < len(live) and live[doc_id]})
+        if not deleted:
+            return live, deleted
+        updated = bytearray(live)
+        for doc_id in deleted:
+            updated[doc_id] = 0
+        return bytes(updated), deleted
+
+    def _notify(self):
+        """
+        Call the listeners of every queued commit, one commit at a time and in commit order
+
+        Whichever writer holds the listener lock delivers the whole queue, so
+        a writer returns only once its own notifications went out. A failing
+        listener is counted and skipped: the commit it observes stands, and
+        later listeners and commits are still notified.
+        """
+        with self._listener_lock:
+            while self._notifications:
+                listeners, args = self._notifications.popleft()
+                for listener in listeners:
+                    try:
+                        listener(*args)
+                    except Exception as e:
+                        self.listener_failures += 1
+                        self.last_listener_error = str(e)
+
+    def _committed(self):
+        """
+        Notify listeners of the changes committed so far, and schedule a merge pass
+        """
+        self._notify()
+        if self.merger is not None:
+            self.merger.request()
+
+    def merge_segments(self, snapshot: Snapshot, first: int, last: int) -> int:
+        """
+        Rewrite snapshot.segments[first:last] as one segment without the documents deleted in snapshot
+
+        The merged segment covers the same doc ids and is committed in
+        place of its sources without changing the version: what is
+        searchable stays the same, only how it is stored changes. Documents
+        deleted after snapshot are still filtered by the live bitmap.
+
+        :return: Number of deleted documents physically dropped
+        """
+        sources = snapshot.segments[first:last]
+        masks = [snapshot.live_mask()[segment.base:segment.base + segment.num_docs] for segment in sources]
+        index_buffer, docs_buffer = merge_segments(list(sources), masks)
+
+        # Writing and syncing the merged files can take a while: reserve a name and
+        # do it without the write lock, so uploads and deletes commit meanwhile
+        with self._write_lock:
+            name = f'seg_{self._next_segment:06d}'
+            self._next_segment += 1
+        if self.directory:
+            self.directory.write_segment(name, index_buffer, docs_buffer)
+            merged = Segment(name, sources[0].base, *self.directory.open_segment(name))
+        else:
+            merged = Segment(name, sources[0].base, index_buffer, docs_buffer)
+
+        with self._write_lock:
+            current = self._snapshot
+            position = bisect_right(current.bases, sources[0].base) - 1
+            if current.segments[position:position + len(sources)] != sources:
+                if self.directory:
+                    self.directory.remove_segments([name])
+                raise RuntimeError("Segments to merge are no longer committed")
+            segments = list(current.segments)
+            segments[position:position + len(sources)] = [merged]
+            snapshot = Snapshot(current.version, segments, current.live)
+            if self.directory:
+                self.directory.write_manifest(self._manifest(snapshot, self._next_segment))
+                # Readers still holding older snapshots keep their mappings open
+                self.directory.remove_segments([segment.name for segment in sources])
+            self._snapshot = snapshot
+            self._notifications.append((self._merge_listeners, (sources, merged)))
+
+        self._notify()
+        return merged.dropped - sum(segment.dropped for segment in sources)
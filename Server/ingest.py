@@ -0,0 +1,203 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Per-document states
+QUEUED = 'queued'
+INDEXED = 'indexed'
+REJECTED = 'rejected'
+FAILED = 'failed'
+
+# Job states
+RECEIVING = 'receiving'
+INDEXING = 'indexing'
+COMPLETED = 'completed'
+
+
+def parse_document(data) -> dict:
+    """
+    Validate one uploaded item and turn it into a corpus document.
+
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    filename = data.get('filename')
+    content = data.get('content')
+    if not filename or not content:
+        raise ValueError("Missing filename or content")
+    if not isinstance(filename, str) or not isinstance(content, str):
+        raise ValueError("filename and content must be strings")
+    return {'title': filename, 'content': content}
+
+
+def parse_ndjson(lines: Iterable[bytes]) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Parse newline-delimited JSON documents one line at a time.
+
+    Yields (line number, document, None) for valid lines and
+    (line number, None, error) for invalid ones; blank lines are skipped.
+    """
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, parse_document(json.loads(line)), None
+        except (ValueError, UnicodeDecodeError) as e:
+            yield line_no, None, str(e)
+
+
+class IngestJob:
+    """
+    Status of one bulk upload, updated by the request thread and the indexing thread.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.created = time.time()
+        self.state = RECEIVING
+        self.documents: List[dict] = []
+        self._pending_batches = 0
+        self._lock = threading.Lock()
+        self._completed = threading.Event()
+
+    def add(self, line: int, title: Optional[str], state: str, error: str = None) -> dict:
+        entry = {'line': line, 'title': title, 'status': state}
+        if error:
+            entry['error'] = error
+        with self._lock:
+            self.documents.append(entry)
+        return entry
+
+    def batch_queued(self):
+        with self._lock:
+            self._pending_batches += 1
+
+    def batch_done(self, entries: List[dict], doc_ids: List[int] = None, error: str = None):
+        with self._lock:
+            for i, entry in enumerate(entries):
+                if error is None:
+                    entry['status'] = INDEXED
+                    entry['id'] = doc_ids[i]
+                else:
+                    entry['status'] = FAILED
+                    entry['error'] = error
+            self._pending_batches -= 1
+            self._update_state()
+
+    def close(self):
+        """
+        Mark the end of the upload stream
+        """
+        with self._lock:
+            self.state = INDEXING
+            self._update_state()
+
+    def _update_state(self):
+        if self.state == INDEXING and self._pending_batches == 0:
+            self.state = COMPLETED
+            self._completed.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until every document of the job is indexed or failed, returning False on timeout
+        """
+        return self._completed.wait(timeout)
+
+    def to_dict(self, include_documents: bool = True) -> dict:
+        with self._lock:
+            counts = {}
+            for entry in self.documents:
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+            status = {'job_id': self.id, 'state': self.state, 'created': self.created, 'counts': counts}
+            if include_documents:
+                status['documents'] = [dict(entry) for entry in self.documents]
+        return status
+
+
+class IngestQueue:
+    """
+    Bounded queue of document batches indexed by a background thread.
+
+    Producers block once max_pending batches are waiting, which throttles
+    uploads to the indexing rate instead of buffering them in memory. Every
+    batch is committed as one corpus segment, so searches keep answering
+    from the last committed version while later batches are indexed.
+    """
+
+    def __init__(self, corpus, batch_size: int = 256, max_pending: int = 8, max_jobs: int = 1000):
+        """
+        :param corpus: CorpusIndex the documents are added to
+        :param batch_size: Documents per committed batch
+        :param max_pending: Batches waiting for the indexer before producers block
+        :param max_jobs: Job statuses kept, oldest are forgotten first
+        """
+        self.corpus = corpus
+        self.batch_size = batch_size
+        self.max_jobs = max_jobs
+        self._queue: "queue.Queue[Tuple[IngestJob, List[dict], List[dict]]]" = queue.Queue(maxsize=max_pending)
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name='ingest-indexer', daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            job, entries, docs = self._queue.get()
+            try:
+                doc_ids = self.corpus.add_documents(docs)
+            except Exception as e:
+                job.batch_done(entries, error=f"Error indexing documents: {str(e)}")
+            else:
+                job.batch_done(entries, doc_ids)
+            finally:
+                self._queue.task_done()
+
+    def create_job(self) -> IngestJob:
+        job = IngestJob()
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestJob]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def _submit(self, job: IngestJob, entries: List[dict], docs: List[dict]):
+        job.batch_queued()
+        self._queue.put((job, entries, docs))
+
+    def ingest(self, job: IngestJob, items: Iterable[Tuple[int, Optional[dict], Optional[str]]]):
+        """
+        Feed parsed items into the queue, in batches of batch_size valid documents
+
+        :param job: Job recording the per-document status
+        :param items: (line number, document or None, error or None) as produced by parse_ndjson
+        """
+        entries, docs = [], []
+        try:
+            for line, doc, error in items:
+                if doc is None:
+                    job.add(line, None, REJECTED, error)
+                    continue
+                entries.append(job.add(line, doc['title'], QUEUED))
+                docs.append(doc)
+                if len(docs) >= self.batch_size:
+                    self._submit(job, entries, docs)
+                    entries, docs = [], []
+            if docs:
+                self._submit(job, entries, docs)
+        finally:
+            job.close()
+
+    def join(self):
+        """
+        Block until every queued batch is committed
+        """
+        self._queue.join()
@@ -1,66 +1,245 @@
-import os
-from typing import List, Dict, Tuple
-from werkzeug.utils import secure_filename
+import math
+from collections import Counter, defaultdict
+from typing import List, Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from cache import BoundedCache
+from metrics import count, stage
+
+# Query node operators of the inference network
+OPERATORS = ('and', 'or', 'not', 'sum', 'wsum', 'max')
+
+# Postings held by the term belief cache of one snapshot
+BELIEF_CACHE_POSTINGS = 1 << 21
+
+
+def combine(operator: str, beliefs: np.ndarray, weights: Optional[Sequence[float]] = None) -> np.ndarray:
+    """
+    Combine per-term belief rows into one belief per document (column).
+
+    :param operator: 'and' (product), 'or' (noisy-or), 'not' (complement of
+        the first row), 'sum' (mean), 'wsum' (weighted mean) or 'max'
+    :param beliefs: Array of shape (terms, documents) with values in [0, 1]
+    :param weights: Per-term weights, required for 'wsum'
+    """
+    if operator == 'and':
+        return beliefs.prod(axis=0)
+    if operator == 'or':
+        return 1.0 - (1.0 - beliefs).prod(axis=0)
+    if operator == 'not':
+        return 1.0 - beliefs[0]
+    if operator == 'sum':
+        return beliefs.mean(axis=0)
+    if operator == 'wsum':
+        weights = np.asarray(weights, dtype=np.float64)
+        return weights @ beliefs / weights.sum()
+    if operator == 'max':
+        return beliefs.max(axis=0)
+    raise ValueError(f"Unknown operator: {operator}. Expected one of {', '.join(OPERATORS)}")
+
+
+class BeliefStats(NamedTuple):
+    """Collection statistics and cached term beliefs of one corpus snapshot."""
+    doc_lengths: np.ndarray
+    avg_length: float
+    num_docs: int
+    priors: np.ndarray  # Belief of the document prior node, indexed by doc id
+    beliefs: BoundedCache  # term -> (doc ids, beliefs, nidf)
+
 
 class InformationRetrievalModels:
-    def __init__(self, documents: List[Tuple[str, str]] = None):
+    FIELD = 'words'
+
+    # Belief of a term node for a document that does not contain the term (InQuery's db)
+    DEFAULT_BELIEF = 0.4
+
+    # Document prior of the belief network: PRIOR_FLOOR for an empty document,
+    # rising with length towards 1 (the average document gets the midpoint)
+    PRIOR_FLOOR = 0.5
+
+    def __init__(self, index):
         """
-        Initialize the Information Retrieval Models class.
+        Initialize the Information Retrieval Models class over the shared corpus index.
+
+        Collection statistics and term beliefs are cached per corpus snapshot,
+        so keep one instance per index rather than one per request.
         """
-        self.documents = documents or []
+        self.index = index
+        self.documents = index.documents
+        self.field = index.field(self.FIELD)
         self.queries = []
         self.relevance_judgments = {}
-    
+
+    def _stats(self) -> BeliefStats:
+        """
+        Statistics of the current snapshot, computed on first use
+        """
+        def compute():
+            doc_lengths = self.field.doc_lengths
+            avg_length = self.field.avg_doc_length or 1.0
+            priors = self.PRIOR_FLOOR + (1 - self.PRIOR_FLOOR) * doc_lengths / (doc_lengths + avg_length)
+            return BeliefStats(doc_lengths, avg_length, self.field.num_docs, priors,
+                               BoundedCache(BELIEF_CACHE_POSTINGS))
+        return self.index.snapshot().memo(('beliefs', self), compute)
+
+    def term_beliefs(self, term: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        Belief of a term node for every document containing the term.
+
+        InQuery's estimate: db + (1 - db) * ntf * nidf, with
+        ntf = tf / (tf + 0.5 + 1.5 * dl / avgdl) and
+        nidf = log((N + 0.5) / df) / log(N + 1).
+
+        :return: (doc ids, beliefs, nidf)
+        """
+        stats = self._stats()
+
+        def compute():
+            postings = self.field.get_postings(term)
+            doc_ids = postings.doc_ids
+            if not len(doc_ids):
+                return doc_ids, np.zeros(0), 0.0
+            tfs = postings.tfs.astype(np.float64)
+            ntf = tfs / (tfs + 0.5 + 1.5 * stats.doc_lengths[doc_ids] / stats.avg_length)
+            nidf = math.log((stats.num_docs + 0.5) / len(doc_ids)) / math.log(stats.num_docs + 1.0)
+            return doc_ids, self.DEFAULT_BELIEF + (1 - self.DEFAULT_BELIEF) * ntf * nidf, nidf
+
+        # Weighed by postings, so the cache of a snapshot stays bounded however many terms are queried
+        return stats.beliefs.get_or_compute(term, compute, lambda cached: len(cached[0]) + 1)
+
+    def _belief_matrix(self, terms: List[str],
+                       candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, List[float]]:
+        """
+        Term-document belief matrix over the documents containing at least one query term
+
+        :param candidates: Sorted doc ids to score instead, a superset of the documents holding the terms
+        :return: (candidate doc ids, beliefs of shape (terms, candidates), nidf per term)
+        """
+        with stage('index_lookup'):
+            term_beliefs = [self.term_beliefs(term) for term in terms]
+        count('postings_touched', sum(len(doc_ids) for doc_ids, _, _ in term_beliefs))
+
+        with stage('score'):
+            if candidates is None:
+                candidates = np.unique(np.concatenate([doc_ids for doc_ids, _, _ in term_beliefs]))
+            matrix = np.full((len(terms), len(candidates)), self.DEFAULT_BELIEF)
+            for row, (doc_ids, beliefs, _) in enumerate(term_beliefs):
+                matrix[row, np.searchsorted(candidates, doc_ids)] = beliefs
+        return candidates, matrix, [nidf for _, _, nidf in term_beliefs]
+
+    def _term_overlaps(self, query: str) -> Dict[int, int]:
+        """
+        Count distinct query terms per document using the postings of each query term.
+        """
+        with stage('analyze'):
+            terms = set(self.field.analyze(query))
+        overlaps = defaultdict(int)
+        with stage('score'):
+            for term in terms:
+                postings = self.field.get_postings(term)
+                count('postings_touched', len(postings))
+                for doc_idx in postings:
+                    overlaps[doc_idx] += 1
+        count('documents_scored', len(overlaps))
+        return overlaps
+
+    @staticmethod
+    def _rank(doc_ids: np.ndarray, scores: np.ndarray, top_k: int = None) -> List[Tuple[int, float]]:
+        """
+        Order scores highest first with ties in document order, keeping the top_k when given.
+        """
+        with stage('top_k'):
+            if top_k is not None and top_k < len(scores):
+                # Keep every document tied with the k-th score, then order exactly
+                kth = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+                keep = scores >= kth
+                doc_ids, scores = doc_ids[keep], scores[keep]
+            order = np.lexsort((doc_ids, -scores))[:top_k]
+            return [(int(doc_ids[i]), float(scores[i])) for i in order]
+
     def create_relevance_judgments(self, queries: List[str]) -> Dict[str, Dict[int, float]]:
         """
         Create advanced relevance judgments for given queries.
         """
         self.queries = queries
         self.relevance_judgments = {}
-        
+
         for query in queries:
-            query_relevance = {}
-            query_terms = set(query.lower().split())
-            
-            for doc_idx, (title, content) in enumerate(self.documents):
-                doc_terms = set(content.lower().split())
-                overlap_score = len(query_terms.intersection(doc_terms))
-                query_relevance[doc_idx] = overlap_score
-            
+            overlaps = self._term_overlaps(query)
+            query_relevance = {doc_idx: overlaps.get(doc_idx, 0) for doc_idx in self.index.live_ids().tolist()}
             self.relevance_judgments[query] = query_relevance
-        
+
         return self.relevance_judgments
-    
-    def interference_model(self, query: str) -> List[Tuple[int, float]]:
+
+    def document_priors(self) -> np.ndarray:
         """
-        Compute document relevance using an Interference Model approach.
+        Belief of the belief network's document prior node for every doc id (PRIOR_FLOOR for deleted documents)
         """
-        if not self.documents or not query:
-            return []
-        
-        relevance_scores = []
-        query_terms = set(query.lower().split())
-        
-        for doc_idx, (title, content) in enumerate(self.documents):
-            doc_terms = set(content.lower().split())
-            overlap_score = len(query_terms.intersection(doc_terms))
-            relevance_scores.append((doc_idx, overlap_score))
-        
-        return sorted(relevance_scores, key=lambda x: x[1], reverse=True)
-
-    def belief_network(self, query: str) -> List[Tuple[int, float]]:
-        """
-        Enhanced Belief Network for document ranking.
+        return self._stats().priors
+
+    def _query_node(self, query: str, operator: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate the query node: term nodes for every query term, combined by the given operator.
+
+        :return: (candidate doc ids, belief of the query node for each)
         """
+        if operator not in OPERATORS:
+            raise ValueError(f"Unknown operator: {operator}. Expected one of {', '.join(OPERATORS)}")
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
         if not self.documents or not query:
-            return []
-        
-        relevance_scores = []
-        query_terms = set(query.lower().split())
-        
-        for doc_idx, (title, content) in enumerate(self.documents):
-            doc_terms = set(content.lower().split())
-            overlap_score = len(query_terms.intersection(doc_terms))
-            relevance_scores.append((doc_idx, overlap_score))
-        
-        return sorted(relevance_scores, key=lambda x: x[1], reverse=True)
\ No newline at end of file
+            return empty
+
+        with stage('analyze'):
+            query_counts = Counter(self.field.analyze(query))
+        if not query_counts:
+            return empty
+        terms = list(query_counts)
+        # A document without the term satisfies 'not' best, so every live document is a candidate
+        live = self.index.live_ids() if operator == 'not' else None
+        candidates, matrix, nidfs = self._belief_matrix(terms, live)
+        if not len(candidates):
+            return empty
+
+        weights = None
+        if operator == 'wsum':
+            # Query concept weights: query term frequency times normalized idf
+            weights = [query_counts[term] * nidf for term, nidf in zip(terms, nidfs)]
+            if not sum(weights):
+                weights = [query_counts[term] for term in terms]
+        with stage('score'):
+            scores = combine(operator, matrix, weights)
+        count('documents_scored', len(candidates))
+        return candidates, scores
+
+    def interference_model(self, query: str, top_k: int = None, operator: str = 'sum') -> List[Tuple[int, float]]:
+        """
+        Rank documents with an inference network (Turtle & Croft).
+
+        Each query term is a node whose belief for a document comes from
+        the term's tf and idf in the index; the query node combines those
+        beliefs with the given operator, and a document is ranked by the
+        query node's belief alone. Only documents sharing at least one
+        term with the query are returned, except with 'not', which is
+        evaluated over every live document.
+        """
+        candidates, scores = self._query_node(query, operator)
+        return self._rank(candidates, scores, top_k)
+
+    def belief_network(self, query: str, top_k: int = None, operator: str = 'wsum') -> List[Tuple[int, float]]:
+        """
+        Rank documents with a belief network: weighted query evidence and a document prior.
+
+        The query node is evaluated as in the inference network, by
+        default with 'wsum', so query concepts are weighted by query term
+        frequency times normalized idf and rare query terms dominate. The
+        network adds a document prior node, a belief growing with document
+        length (see PRIOR_FLOOR), and ranks by the 'and' of the query node
+        and the prior: between two documents with equal evidence, the
+        longer one, a priori more likely relevant, ranks first. Only
+        documents sharing at least one term with the query are returned,
+        except with 'not', which is evaluated over every live document.
+        """
+        candidates, scores = self._query_node(query, operator)
+        with stage('score'):
+            scores = combine('and', np.vstack([scores, self.document_priors()[candidates]]))
+        return self._rank(candidates, scores, top_k)
@@ -0,0 +1,140 @@
+"""
+Background segment merging.
+
+Deletes only clear a document's byte in the live bitmap; its postings
+stay in the immutable segment and are filtered out at read time. The
+merge policy periodically rewrites segments into fewer, cleaner ones:
+runs of adjacent segments of similar size are merged, merge_factor at a
+time, so the number of segments grows logarithmically with the corpus,
+and a segment whose share of not yet dropped deletions reaches
+deletes_ratio is rewritten to physically remove them.
+"""
+import math
+import threading
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class MergeStats(NamedTuple):
+    merges: int
+    segments_merged: int
+    documents_dropped: int
+    seconds: float
+    failures: int
+    last_error: Optional[str]
+
+
+class MergePolicy:
+    def __init__(self, merge_factor: int = 10, deletes_ratio: float = 0.2, min_level_docs: int = 1000):
+        """
+        :param merge_factor: Adjacent segments of one size level merged together
+        :param deletes_ratio: Share of deleted documents that makes a segment worth rewriting
+        :param min_level_docs: Segments with fewer live documents all share the lowest level
+        """
+        if merge_factor < 2:
+            raise ValueError("merge_factor must be at least 2")
+        self.merge_factor = merge_factor
+        self.deletes_ratio = deletes_ratio
+        self.min_level_docs = min_level_docs
+
+    def level(self, live_docs: int) -> int:
+        return int(math.log(max(live_docs, self.min_level_docs) / self.min_level_docs, self.merge_factor))
+
+    def plan(self, snapshot) -> List[Tuple[int, int]]:
+        """
+        Disjoint runs of adjacent segments to merge, as [start, end) positions in snapshot.segments
+        """
+        segments = snapshot.segments
+        deleted = snapshot.deleted_counts()
+        levels = [self.level(segment.num_docs - deleted[i]) for i, segment in enumerate(segments)]
+
+        runs = []
+        start = 0
+        while start < len(segments):
+            end = start
+            while end < len(segments) and levels[end] == levels[start]:
+                end += 1
+            for first in range(start, end - self.merge_factor + 1, self.merge_factor):
+                runs.append((first, first + self.merge_factor))
+            start = end
+
+        merged = set(i for first, last in runs for i in range(first, last))
+        for i, segment in enumerate(segments):
+            pending = deleted[i] - segment.dropped
+            if i not in merged and segment.num_docs and pending / segment.num_docs >= self.deletes_ratio:
+                runs.append((i, i + 1))
+        return sorted(runs)
+
+
+DEFAULT_MERGE_POLICY = MergePolicy()
+
+
+class SegmentMerger:
+    """
+    Applies a merge policy to a CorpusIndex from a background thread.
+
+    Writers call request() after every commit; the thread wakes up, merges
+    whatever the policy selects on the latest snapshot and commits each
+    merged segment in place of its sources. Merging runs outside the
+    index's write lock, so uploads and deletes are never blocked by it.
+    """
+
+    def __init__(self, index, policy: MergePolicy):
+        self.index = index
+        self.policy = policy
+        self._wakeup = threading.Event()
+        self._merge_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.merges = 0
+        self.segments_merged = 0
+        self.documents_dropped = 0
+        self.seconds = 0.0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def request(self):
+        """
+        Ask the background thread for a merge pass, starting it on first use
+        """
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='segment-merger', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.merge()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+
+    def merge(self) -> int:
+        """
+        Run merge passes in the calling thread until the policy selects nothing
+
+        :return: Number of merges committed
+        """
+        merges = 0
+        with self._merge_lock:
+            while True:
+                snapshot = self.index.latest()
+                runs = self.policy.plan(snapshot)
+                if not runs:
+                    return merges
+                for first, last in runs:
+                    started = time.perf_counter()
+                    dropped = self.index.merge_segments(snapshot, first, last)
+                    self.merges += 1
+                    self.segments_merged += last - first
+                    self.documents_dropped += dropped
+                    self.seconds += time.perf_counter() - started
+                    merges += 1
+
+    def stats(self) -> MergeStats:
+        return MergeStats(self.merges, self.segments_merged, self.documents_dropped, self.seconds,
+                          self.failures, self.last_error)
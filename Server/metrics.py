@@ -0,0 +1,198 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stages in pipeline order, used to order debug output
+STAGES = ('parse', 'analyze', 'index_lookup', 'score', 'top_k', 'serialize')
+
+_NULL_STAGE = nullcontext()
+_current: ContextVar[Optional['Trace']] = ContextVar('ir_trace', default=None)
+
+
+class Trace:
+    """Stage timings and counters of one request."""
+
+    __slots__ = ('endpoint', 'start', 'stages', 'counters')
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def to_dict(self) -> dict:
+        order = {name: i for i, name in enumerate(STAGES)}
+        return {
+            'total_ms': self.elapsed() * 1000,
+            'stages_ms': {
+                name: seconds * 1000
+                for name, seconds in sorted(self.stages.items(), key=lambda item: order.get(item[0], len(order)))
+            },
+            'counters': dict(self.counters),
+        }
+
+
+class _Stage:
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stages = self.trace.stages
+        stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+def stage(name: str):
+    """
+    Context manager timing a stage of the current request; a shared no-op outside traced requests
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NULL_STAGE
+    return _Stage(trace, name)
+
+
+def count(name: str, value: int = 1):
+    """
+    Add to a counter of the current request (postings_touched, documents_scored, ...)
+    """
+    trace = _current.get()
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + value
+
+
+def start_trace(endpoint: str) -> Trace:
+    trace = Trace(endpoint)
+    _current.set(trace)
+    return trace
+
+
+def end_trace() -> Optional[Trace]:
+    trace = _current.get()
+    _current.set(None)
+    return trace
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Process-wide metrics rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self, prefix: str = 'ir'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._callbacks: List[Tuple[str, str, str, Callable[[], float]]] = []
+
+    def inc(self, name: str, help_text: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, help_text: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram()
+            histogram.observe(value)
+
+    def register_callback(self, name: str, kind: str, help_text: str, read: Callable[[], float]):
+        """
+        Expose a value read from elsewhere (corpus size, cache counters) at scrape time
+
+        :param kind: Prometheus metric type, 'gauge' or 'counter'
+        """
+        self._callbacks.append((name, kind, help_text, read))
+
+    def record(self, trace: Trace, status: int):
+        """
+        Fold a finished request trace into the endpoint's histograms and counters
+        """
+        endpoint = trace.endpoint
+        self.inc('requests_total', 'Requests served', endpoint=endpoint, status=str(status))
+        self.observe('request_seconds', 'End-to-end request latency', trace.elapsed(), endpoint=endpoint)
+        for name, seconds in trace.stages.items():
+            self.observe('stage_seconds', 'Time spent per request stage', seconds, endpoint=endpoint, stage=name)
+        for name, value in trace.counters.items():
+            self.inc(f'{name}_total', f'Sum of the {name} request counter', value, endpoint=endpoint)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f'{self.prefix}_{name}'
+                lines.append(f'# HELP {metric} {self._help[name]}')
+                lines.append(f'# TYPE {metric} counter')
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{metric}{_format_labels(labels)} {_format_value(value)}')
+
+            for name, series in sorted(self._histograms.items()):
+                metric = f'{self.prefix}_{name}'
+                lines.append(f'# HELP {metric} {self._help[name]}')
+                lines.append(f'# TYPE {metric} histogram')
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, bucket_count in zip(BUCKETS + (float('inf'),), histogram.counts):
+                        cumulative += bucket_count
+                        le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                        lines.append(f'{metric}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+                    lines.append(f'{metric}_sum{_format_labels(labels)} {_format_value(histogram.sum)}')
+                    lines.append(f'{metric}_count{_format_labels(labels)} {histogram.count}')
+
+        for name, kind, help_text, read in self._callbacks:
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.append(f'{metric} {_format_value(read())}')
+        return '\n'.join(lines) + '\n'
@@ -1,22 +1,188 @@
 import os
 import math
-import nltk
+import heapq
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+import numpy as np
 from nltk import word_tokenize
-from nltk.corpus import stopwords
+from cache import BoundedCache
+from index import BlockPostings
+from metrics import count, stage
+from resources import stop_words
+from segment import POSTINGS_BLOCK
+
+# Postings held by the term statistics cache of one snapshot
+TERM_CACHE_POSTINGS = 1 << 21
+
+
+class TermPostings(NamedTuple):
+    """Score contributions of one keyword under one model to every live document holding it."""
+    idf: float
+    doc_ids: np.ndarray  # Ascending
+    scores: np.ndarray
+
+
+class TermStats:
+    """
+    Scoring data of one keyword under one model, for MaxScore.
+
+    Every block of the keyword's postings has a score bound computed from
+    its skip data: both models grow with tf and shrink with document
+    length, so no document of a block scores above one with the block's
+    largest tf and shortest length. Blocks are only decoded and scored
+    when first read, and are then kept with the cache entry.
+    """
+
+    __slots__ = ('idf', 'blocks', 'block_last', 'block_bounds', 'upper_bound', '_score', '_decoded')
+
+    def __init__(self, idf: float, blocks: BlockPostings, block_bounds: np.ndarray,
+                 score: Callable[[np.ndarray, np.ndarray], np.ndarray]):
+        """
+        :param blocks: Postings of the keyword
+        :param block_bounds: Score bound of every block
+        :param score: Scores of (doc ids, term frequencies)
+        """
+        self.idf = idf
+        self.blocks = blocks
+        self.block_last = blocks.last.tolist()
+        self.block_bounds = block_bounds.tolist()
+        self.upper_bound = max(self.block_bounds, default=0.0)
+        self._score = score
+        self._decoded: List[Optional[Tuple[List[int], List[float]]]] = [None] * len(blocks)
+
+    def block(self, block: int) -> Tuple[List[int], List[float]]:
+        """
+        Live doc ids of a block and their score contributions (empty when all are deleted)
+        """
+        decoded = self._decoded[block]
+        if decoded is None:
+            doc_ids, tfs = self.blocks.read(block)
+            decoded = self._decoded[block] = (doc_ids.tolist(), self._score(doc_ids, tfs).tolist())
+        return decoded
+
+
+class _TermCursor:
+    """
+    Position of MaxScore in the postings of one query term.
+
+    Postings are read a block of POSTINGS_BLOCK at a time: a block is only
+    decoded once the cursor stops in it, so blocks jumped over on their
+    bound are never decoded. docs is None until the current block is loaded.
+    """
+
+    __slots__ = ('weight', 'term', 'bound', 'block_last', 'block_bounds', 'num_blocks',
+                 'block', 'docs', 'scores', 'position', 'touched')
+
+    def __init__(self, weight: int, term: TermStats):
+        self.weight = weight
+        self.term = term
+        self.bound = weight * term.upper_bound
+        self.block_last = term.block_last
+        self.block_bounds = term.block_bounds
+        self.num_blocks = len(self.block_last)
+        self.block = 0
+        self.docs = self.scores = None
+        self.position = 0
+        self.touched = 0  # Postings of the blocks read
+
+    def load(self) -> bool:
+        """
+        Read the current block, returning False once the postings are exhausted
+        """
+        while self.block < self.num_blocks:
+            docs, scores = self.term.block(self.block)
+            self.touched += len(docs)
+            if docs:
+                self.docs, self.scores, self.position = docs, scores, 0
+                return True
+            self.block += 1
+        return False
+
+    def advance(self):
+        self.position += 1
+        if self.position == len(self.docs):
+            self.block += 1
+            self.docs = None
+
+    def skip_blocks(self, rest: float, threshold: float):
+        """
+        Jump over the blocks whose bound cannot lift a document over the threshold
+        """
+        weight, block_bounds = self.weight, self.block_bounds
+        while self.block < self.num_blocks and rest + weight * block_bounds[self.block] <= threshold:
+            self.block += 1
+            self.docs = None
+
+    def seek(self, doc_id: int) -> bool:
+        """
+        Move to the block whose range holds doc_id without decoding it, False past the last block
+
+        Doc ids must be sought in ascending order.
+        """
+        if self.block < self.num_blocks and doc_id <= self.block_last[self.block]:
+            return True
+        self.block = bisect_left(self.block_last, doc_id, self.block)
+        self.docs = None
+        return self.block < self.num_blocks
+
+    def score(self, doc_id: int) -> float:
+        """
+        Score contribution to doc_id once seek(doc_id) found its block, 0.0 without the term
+        """
+        if self.docs is None and not self.load():
+            return 0.0
+        self.position = bisect_left(self.docs, doc_id, self.position)
+        if self.position < len(self.docs) and self.docs[self.position] == doc_id:
+            return self.scores[self.position]
+        return 0.0
+
+
+class RankerStats(NamedTuple):
+    """Document norms and cached term statistics of one corpus snapshot."""
+    norms: Dict[str, np.ndarray]
+    avg_length: float
+    term_stats: BoundedCache
+
+
+class CollectionStatistics(NamedTuple):
+    """
+    Corpus-wide statistics overriding those of the local index.
+
+    Set on a ranker that only holds one shard of the corpus, so IDF and
+    average document length (and therefore scores) are the same as over
+    the whole corpus.
+    """
+    key: Hashable  # Identifies the corpus state these statistics describe
+    num_docs: int
+    avg_doc_length: float
+    df: Dict[str, int]  # Document frequency of (at least) the query keywords
 
-nltk.download('punkt')
-nltk.download('stopwords')
 
 class DocumentRanker:
-    def __init__(self, documents):
+    FIELD = 'keywords'
+
+    # BM25 parameters, fixed so document norms can be precomputed
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, index):
         """
-        Initialize DocumentRanker with a list of documents
+        Initialize DocumentRanker over the shared corpus index
+        
+        Collection statistics (IDF, document norms, per-term score upper
+        bounds) are computed once per corpus snapshot and reused across
+        queries, so keep one ranker per index.
         
-        :param documents: List of dictionaries with 'title' and 'content' keys
+        :param index: CorpusIndex whose 'keywords' field holds preprocess_text terms
         """
-        self.documents = documents
+        self.index = index
+        self.documents = index.documents
+        self.field = index.field(self.FIELD)
+        self.collection: Optional[CollectionStatistics] = None
     
-    def preprocess_text(self, text):
+    @staticmethod
+    def preprocess_text(text):
         """
         Preprocess text by tokenizing, converting to lowercase, 
         removing punctuation and stopwords
@@ -29,21 +195,139 @@ class DocumentRanker:
         # Convert to lowercase and remove punctuation
         tokens = [word.lower() for word in tokens if word.isalnum()]
         
-        # Remove stopwords
-        stop_words = set(stopwords.words('english'))
-        filtered_tokens = [word for word in tokens if word not in stop_words]
+        # Remove stopwords (a frozen set loaded once per process)
+        english_stop_words = stop_words()
+        filtered_tokens = [word for word in tokens if word not in english_stop_words]
         
         return filtered_tokens
     
-    def calculate_tf(self, word, document):
+    def _stats(self):
+        """
+        Document norms and term statistic cache of the current snapshot, computed on first use
+        """
+        collection = self.collection
+        key = collection.key if collection is not None else None
+
+        def compute():
+            avg_length = (collection.avg_doc_length if collection is not None else self.field.avg_doc_length) or 1.0
+            doc_lengths = self.field.doc_lengths
+            norms = {model: self._length_norms(model, doc_lengths, avg_length) for model in ('tfidf', 'bm25')}
+            return RankerStats(norms, avg_length, BoundedCache(TERM_CACHE_POSTINGS))
+
+        # Only the statistics of the latest collection key are kept per snapshot
+        by_collection = self.index.snapshot().memo(('ranker', self), dict)
+        stats = by_collection.get(key)
+        if stats is None:
+            stats = compute()
+            by_collection.clear()
+            by_collection[key] = stats
+        return stats
+
+    def _collection_counts(self, word):
+        """
+        (document frequency of word, number of documents), corpus-wide when a collection is set
+        """
+        if self.collection is not None:
+            return self.collection.df.get(word, 0), self.collection.num_docs
+        return self.field.df(word), self.index.num_live
+
+    def _idf(self, keyword, model):
+        return self.calculate_idf(keyword) if model == 'tfidf' else self.calculate_bm25_idf(keyword)
+
+    def _term_stats_for(self, keyword, model):
+        """
+        Cached per-term block statistics for a scoring model
+
+        Entries are weighed by the postings their blocks can hold once
+        decoded, so the cache of a snapshot holds a bounded number of
+        postings however many distinct keywords are queried.
+
+        :param keyword: Preprocessed query keyword
+        :param model: 'tfidf' or 'bm25'
+        :return: TermStats of the keyword
+        """
+        stats = self._stats()
+
+        def compute():
+            blocks = self.field.get_blocks(keyword)
+            idf = self._idf(keyword, model)
+            max_tfs = blocks.max_tfs.astype(np.float64)
+            bound_norms = self._length_norms(model, blocks.min_lengths, stats.avg_length)
+            return TermStats(idf, blocks, self._scores(model, idf, max_tfs, bound_norms),
+                             lambda doc_ids, tfs: self._term_scores(stats, model, idf, tfs.astype(np.float64), doc_ids))
+
+        return stats.term_stats.get_or_compute(('blocks', keyword, model), compute,
+                                               lambda term: len(term.blocks) * POSTINGS_BLOCK + 1)
+
+    def _term_postings(self, keyword, model):
+        """
+        Cached score contributions of a keyword to every live document holding it
+
+        :param keyword: Preprocessed query keyword
+        :param model: 'tfidf' or 'bm25'
+        :return: TermPostings of the keyword
+        """
+        stats = self._stats()
+
+        def compute():
+            postings = self.field.get_postings(keyword)
+            idf = self._idf(keyword, model)
+            doc_ids = postings.doc_ids
+            return TermPostings(idf, doc_ids, self._term_scores(stats, model, idf, postings.tfs.astype(np.float64), doc_ids))
+
+        return stats.term_stats.get_or_compute(('postings', keyword, model), compute,
+                                               lambda term: len(term.doc_ids) + 1)
+
+    def term_weights(self, keyword, model):
+        """
+        Score contribution of a keyword to every document containing it, as arrays
+
+        Used by batch search to build the term-document weight matrix.
+
+        :param keyword: Preprocessed query keyword
+        :param model: 'keyword' (raw tf), 'tfidf' or 'bm25'
+        :return: (sorted doc ids, weights); empty when the keyword cannot score
+        """
+        if model == 'keyword':
+            postings = self.field.get_postings(keyword)
+            return postings.doc_ids, postings.tfs.astype(np.float64)
+        term = self._term_postings(keyword, model)
+        if term.idf <= 0:
+            return term.doc_ids[:0], term.scores[:0]
+        return term.doc_ids, term.scores
+
+    def _length_norms(self, model, doc_lengths, avg_length):
+        """
+        Per-document length normalization of a model: 1 / length for tfidf, BM25's K (0 for empty documents)
+        """
+        doc_lengths = np.asarray(doc_lengths, dtype=np.float64)
+        if model == 'tfidf':
+            return np.divide(1.0, doc_lengths, out=np.zeros(len(doc_lengths)), where=doc_lengths > 0)
+        return self.K1 * (1 - self.B + self.B * doc_lengths / avg_length)
+
+    def _scores(self, model, idf, tfs, norms):
+        """
+        Contribution of occurrence counts to document scores, given the documents' length norms
+        """
+        if model == 'tfidf':
+            return tfs * norms * idf
+        return idf * tfs * (self.K1 + 1) / (tfs + norms)
+
+    def _term_scores(self, stats, model, idf, tfs, doc_ids):
+        """
+        Contribution of a keyword's occurrence counts to the scores of the documents holding them
+        """
+        return self._scores(model, idf, tfs, stats.norms[model][doc_ids])
+
+    def calculate_tf(self, word, doc_id):
         """
         Calculate Term Frequency (TF)
         
         :param word: Word to calculate TF for
-        :param document: Preprocessed document (as a string)
+        :param doc_id: Id of the document in the index
         :return: Term Frequency
         """
-        return document.split().count(word) / len(document.split())
+        return self.field.get_postings(word).get(doc_id, 0) * float(self._stats().norms['tfidf'][doc_id])
     
     def calculate_idf(self, word):
         """
@@ -53,73 +337,191 @@ class DocumentRanker:
         :return: Inverse Document Frequency
         """
         # Count documents containing the word
-        doc_count = sum(1 for doc in self.documents if word in doc['preprocessed_content'].split())
-        total_docs = len(self.documents)
+        doc_count, total_docs = self._collection_counts(word)
         
         if doc_count == 0:
             return 0
         return math.log(total_docs / doc_count)
     
-    def preprocess_documents(self):
+    def calculate_bm25_idf(self, word):
         """
-        Preprocess all documents by adding preprocessed_content
+        Calculate the (non-negative) BM25 Inverse Document Frequency
+        
+        :param word: Word to calculate IDF for
+        :return: Inverse Document Frequency
         """
-        for doc in self.documents:
-            doc['preprocessed_content'] = ' '.join(self.preprocess_text(doc['content']))
+        doc_count, total_docs = self._collection_counts(word)
+        return math.log(1 + (total_docs - doc_count + 0.5) / (doc_count + 0.5))
     
-    def keyword_matching(self, query):
+    def keyword_matching(self, query, top_k=None):
         """
         Perform keyword matching search
         
         :param query: Search query string
-        :return: Ranked list of documents
-        """
-        query_keywords = self.preprocess_text(query)
-        if 'preprocessed_content' not in self.documents[0]:
-            self.preprocess_documents()
-        # Rank documents based on keyword matches
-        rankings = []
-        for doc in self.documents:
-            doc_words = doc['preprocessed_content'].split()
-            match_count = sum(doc_words.count(keyword) for keyword in query_keywords if keyword in doc_words)
-            rankings.append((doc, match_count))
-        
-        # Sort by match count in descending order
-        rankings.sort(key=lambda x: x[1], reverse=True)
-        print("Ranking") 
-        return rankings
+        :param top_k: Number of documents to return, None for every matching document
+        :return: Ranked list of (doc_id, keyword occurrence count) pairs
+        """
+        with stage('analyze'):
+            query_keywords = self.preprocess_text(query)
+        # Sum keyword occurrences per document from the postings
+        match_counts = defaultdict(int)
+        with stage('score'):
+            for keyword in query_keywords:
+                postings = self.field.get_postings(keyword)
+                count('postings_touched', len(postings))
+                for doc_id, tf in postings.items():
+                    match_counts[doc_id] += tf
+        count('documents_scored', len(match_counts))
+        
+        # Highest count first, ties in document order
+        with stage('top_k'):
+            if top_k is None:
+                return sorted(match_counts.items(), key=lambda x: (-x[1], x[0]))
+            return heapq.nlargest(top_k, match_counts.items(), key=lambda x: (x[1], -x[0]))
     
-    def calculate_tf_idf(self, query):
+    def calculate_tf_idf(self, query, top_k=None):
         """
         Perform TF-IDF ranking search
         
         :param query: Search query string
-        :return: Ranked list of documents with TF-IDF scores
+        :param top_k: Number of documents to return, None for every matching document
+        :return: Ranked list of (doc_id, TF-IDF score) pairs
+        """
+        return self._rank(query, 'tfidf', top_k)
+    
+    def bm25(self, query, top_k=10):
+        """
+        Perform Okapi BM25 ranking search
+        
+        :param query: Search query string
+        :param top_k: Number of documents to return, None for every matching document
+        :return: Ranked list of (doc_id, BM25 score) pairs
         """
-        # Preprocess documents if not already done
-        if 'preprocessed_content' not in self.documents[0]:
-            self.preprocess_documents()
+        return self._rank(query, 'bm25', top_k)
+    
+    def _rank(self, query, model, top_k):
+        """
+        Score documents for a query, highest first, ties in document order
+        
+        With a top_k the search uses MaxScore dynamic pruning: query terms are
+        ordered by their score upper bound, and terms whose combined bounds
+        cannot lift a document above the current k-th best score are
+        "non-essential". Candidates are only drawn from essential terms'
+        postings, and non-essential terms are probed by doc id and skipped
+        as soon as the remaining bounds cannot reach the threshold.
+
+        Every block of POSTINGS_BLOCK postings also has its own score bound,
+        computed from the segments' skip data without decoding the block:
+        once a single essential term is left, its blocks whose bound cannot
+        lift a document over the threshold are jumped over, and a
+        non-essential term is not decoded for a candidate its block's bound
+        cannot lift over the threshold.
+        """
+        with stage('analyze'):
+            query_counts = Counter(self.preprocess_text(query))
+        if top_k is not None and top_k <= 0:
+            return []
         
-        query_keywords = self.preprocess_text(query)
+        if top_k is None:
+            terms = []
+            with stage('index_lookup'):
+                for keyword, weight in query_counts.items():
+                    term = self._term_postings(keyword, model)
+                    if len(term.doc_ids) and term.idf > 0:
+                        terms.append((weight, term))
+            count('postings_touched', sum(len(term.doc_ids) for _, term in terms))
+            if not terms:
+                return []
+            with stage('score'):
+                # Contributions are summed per document in query term order
+                doc_ids = np.concatenate([term.doc_ids for _, term in terms])
+                contributions = np.concatenate([weight * term.scores for weight, term in terms])
+                candidates, slots = np.unique(doc_ids, return_inverse=True)
+                scores = np.bincount(slots, weights=contributions)
+            count('documents_scored', len(candidates))
+            with stage('top_k'):
+                order = np.lexsort((candidates, -scores))
+            return [(doc_id, score) for doc_id, score in zip(candidates[order].tolist(), scores[order].tolist())
+                    if score > 0]
         
-        # Calculate TF-IDF scores
-        scores = {}
-        for doc in self.documents:
-            doc_words = doc['preprocessed_content'].split()
-            tf_idf_score = 0
-            for keyword in query_keywords:
-                # Only calculate for keywords present in document
-                if keyword in doc_words:
-                    tf = self.calculate_tf(keyword, doc['preprocessed_content'])
-                    idf = self.calculate_idf(keyword)
-                    tf_idf_score += tf * idf
+        terms = []
+        with stage('index_lookup'):
+            for keyword, weight in query_counts.items():
+                term = self._term_stats_for(keyword, model)
+                if len(term.blocks) and term.idf > 0:
+                    terms.append((weight, term))
+        if not terms:
+            return []
+        
+        with stage('score'):
+            cursors = sorted((_TermCursor(weight, term) for weight, term in terms), key=lambda cursor: cursor.bound)
+            # cumulative[i] = sum of the upper bounds of terms 0..i
+            cumulative = []
+            total = 0.0
+            for cursor in cursors:
+                total += cursor.bound
+                cumulative.append(total)
+        
+            scored = 0
+            heap = []  # min-heap of (score, -doc_id) holding the current top-k
+            threshold = 0.0
+            first_essential = 0
+            while True:
+                while first_essential < len(cursors) and cumulative[first_essential] <= threshold:
+                    first_essential += 1
+                if first_essential == len(cursors):
+                    break
+                # Bound of the non-essential terms together
+                rest = cumulative[first_essential - 1] if first_essential else 0.0
+            
+                if first_essential == len(cursors) - 1:
+                    # A single essential term: jump over its blocks that cannot reach the threshold
+                    cursors[first_essential].skip_blocks(rest, threshold)
+            
+                # Next candidate: smallest current doc id over the essential terms
+                doc_id = None
+                for i in range(first_essential, len(cursors)):
+                    cursor = cursors[i]
+                    if cursor.docs is not None or cursor.load():
+                        current = cursor.docs[cursor.position]
+                        if doc_id is None or current < doc_id:
+                            doc_id = current
+                if doc_id is None:
+                    break
+            
+                scored += 1
+                score = 0.0
+                for i in range(first_essential, len(cursors)):
+                    cursor = cursors[i]
+                    if cursor.docs is not None and cursor.docs[cursor.position] == doc_id:
+                        score += cursor.weight * cursor.scores[cursor.position]
+                        cursor.advance()
+            
+                # Probe non-essential terms, highest bound first, while they can still matter
+                for i in range(first_essential - 1, -1, -1):
+                    if score + cumulative[i] <= threshold:
+                        break
+                    cursor = cursors[i]
+                    if not cursor.seek(doc_id):
+                        continue
+                    # The bound of the block holding doc_id is tighter than the term's
+                    below = cumulative[i - 1] if i else 0.0
+                    if score + cursor.weight * cursor.block_bounds[cursor.block] + below <= threshold:
+                        break
+                    contribution = cursor.score(doc_id)
+                    if contribution:
+                        score += cursor.weight * contribution
             
-            # Only add if score is non-zero
-            if tf_idf_score > 0:
-                scores[doc['title']] = tf_idf_score
+                if len(heap) < top_k:
+                    heapq.heappush(heap, (score, -doc_id))
+                elif score > threshold:
+                    heapq.heapreplace(heap, (score, -doc_id))
+                if len(heap) == top_k:
+                    threshold = heap[0][0]
         
-        # Sort scores in descending order
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        count('postings_touched', sum(cursor.touched for cursor in cursors))
+        count('documents_scored', scored)
         
-        # Return documents in sorted order
-        return [doc for doc, _ in sorted_scores]
\ No newline at end of file
+        with stage('top_k'):
+            ranked = sorted(((score, -neg_doc_id) for score, neg_doc_id in heap), key=lambda x: (-x[0], x[1]))
+        return [(doc_id, score) for score, doc_id in ranked if score > 0]
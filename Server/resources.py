@@ -0,0 +1,111 @@
+"""
+NLTK resources used by the analyzers, checked and loaded without network access.
+
+Nothing is downloaded at import or startup. Install the data once on a
+machine with network access (or copy an nltk_data directory onto
+NLTK_DATA for air-gapped nodes):
+
+    python resources.py download
+"""
+import sys
+import time
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import nltk
+
+# Resource name -> nltk.data paths accepted for it, newest NLTK layout first
+REQUIRED: Dict[str, Tuple[str, ...]] = {
+    'punkt': ('tokenizers/punkt_tab/english/', 'tokenizers/punkt'),
+    'stopwords': ('corpora/stopwords',),
+    'wordnet': ('corpora/wordnet',),
+    'tagger': ('taggers/averaged_perceptron_tagger_eng/', 'taggers/averaged_perceptron_tagger'),
+}
+
+# Packages to fetch with `python resources.py download`
+PACKAGES = ('punkt', 'punkt_tab', 'stopwords', 'wordnet', 'averaged_perceptron_tagger',
+            'averaged_perceptron_tagger_eng')
+
+
+def locate(name: str) -> Optional[str]:
+    """
+    Local path of a required resource, or None when it is not installed (never touches the network)
+    """
+    for path in REQUIRED[name]:
+        try:
+            return str(nltk.data.find(path))
+        except LookupError:
+            continue
+    return None
+
+
+def check() -> Dict[str, Optional[str]]:
+    """
+    Locate every required resource
+    """
+    return {name: locate(name) for name in REQUIRED}
+
+
+@lru_cache(maxsize=1)
+def stop_words() -> FrozenSet[str]:
+    """
+    English stopwords, read from the corpus once per process
+    """
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+
+def _load_punkt():
+    from nltk import word_tokenize
+    word_tokenize("Warm up the tokenizer.")
+
+
+def _load_tagger():
+    from nltk import pos_tag
+    pos_tag(['warm', 'up'])
+
+
+def _load_wordnet():
+    from nltk.corpus import wordnet
+    from nltk.stem import WordNetLemmatizer
+    wordnet.get_version()
+    WordNetLemmatizer().lemmatize('resources')
+
+
+LOADERS = {
+    'punkt': _load_punkt,
+    'stopwords': stop_words,
+    'wordnet': _load_wordnet,
+    'tagger': _load_tagger,
+}
+
+
+def warm_up() -> List[dict]:
+    """
+    Load every resource now instead of on the first request that needs it
+
+    :return: One entry per resource with its path, status and load time
+    """
+    report = []
+    for name, load in LOADERS.items():
+        entry = {'resource': name, 'path': locate(name)}
+        if entry['path'] is None:
+            entry.update(status='missing', seconds=0.0)
+        else:
+            start = time.perf_counter()
+            try:
+                load()
+                entry['status'] = 'loaded'
+            except LookupError as e:
+                entry.update(status='error', error=str(e).strip().splitlines()[0])
+            entry['seconds'] = time.perf_counter() - start
+        report.append(entry)
+    return report
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['download']:
+        for package in PACKAGES:
+            nltk.download(package)
+    for name, path in check().items():
+        print(f"{name:10} {path or 'MISSING'}")
@@ -0,0 +1,107 @@
+import heapq
+from typing import Iterable, List, Optional, Tuple
+
+from metrics import stage
+
+DEFAULT_K = 10
+MAX_K = 1000
+SNIPPET_WORDS = 30
+SNIPPET_FIELD = 'terms'  # Positional field whose positions count raw content words
+
+Hit = Tuple[int, Optional[float]]
+
+
+def get_page(data: dict) -> Tuple[int, int]:
+    """
+    Read the k / offset pagination parameters of a search request.
+
+    Raises ValueError for values that are not non-negative integers.
+    """
+    try:
+        k = int(data.get('k', DEFAULT_K))
+        offset = int(data.get('offset', 0))
+    except (TypeError, ValueError):
+        raise ValueError("k and offset must be integers")
+    if k < 0 or offset < 0:
+        raise ValueError("k and offset must not be negative")
+    return min(k, MAX_K), offset
+
+
+def select_top(scored: Iterable[Hit], k: int, offset: int = 0) -> List[Hit]:
+    """
+    Page of the best (doc_id, score) pairs, highest score first and ties in document order.
+
+    Uses a bounded heap, so only offset + k pairs are ever kept sorted.
+    """
+    best = heapq.nlargest(offset + k, scored, key=lambda hit: (hit[1], -hit[0]))
+    return best[offset:]
+
+
+def select_page(doc_ids: Iterable[int], k: int, offset: int = 0) -> List[Hit]:
+    """
+    Page of unscored matches, kept in the order given.
+    """
+    page = []
+    for position, doc_id in enumerate(doc_ids):
+        if position >= offset + k:
+            break
+        if position >= offset:
+            page.append((doc_id, None))
+    return page
+
+
+def make_snippet(index, field_name: str, doc_id: int, query: str, words: int = SNIPPET_WORDS) -> str:
+    """
+    Excerpt of a document centered on its densest cluster of query terms.
+
+    Query term positions come from the positional field, whose positions
+    count the whitespace-separated words of the raw content.
+    """
+    field = index.field(field_name)
+    positions = sorted(
+        position
+        for term in set(field.analyze(query or ''))
+        for position in field.get_positions(term, doc_id)
+    )
+
+    # Window of `words` words holding the most query term occurrences
+    best_span, best_count, left = (0, 0), 0, 0
+    for right, position in enumerate(positions):
+        while position - positions[left] >= words:
+            left += 1
+        if right - left + 1 > best_count:
+            best_count = right - left + 1
+            best_span = (positions[left], position)
+
+    content_words = index.documents[doc_id]['content'].split()
+    # Center the window on the matched span
+    start = max(0, (best_span[0] + best_span[1]) // 2 - words // 2) if best_count else 0
+    end = min(len(content_words), start + words)
+    start = max(0, end - words)
+
+    snippet = ' '.join(content_words[start:end])
+    if start > 0:
+        snippet = '... ' + snippet
+    if end < len(content_words):
+        snippet += ' ...'
+    return snippet
+
+
+def format_hits(index, hits: List[Hit], query: str = None, field_name: str = SNIPPET_FIELD) -> List[dict]:
+    """
+    Serialize a page of hits without document bodies.
+
+    Full content is available through /api/documents/<id>.
+    """
+    results = []
+    with stage('serialize'):
+        for doc_id, score in hits:
+            hit = {
+                'id': doc_id,
+                'title': index.documents.title(doc_id),
+                'snippet': make_snippet(index, field_name, doc_id, query)
+            }
+            if score is not None:
+                hit['score'] = score
+            results.append(hit)
+    return results
@@ -0,0 +1,819 @@
+import json
+import re
+import struct
+from collections.abc import Mapping
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b'IRSEG001'
+ALIGNMENT = 8
+
+# Unsigned types tried, smallest first, when storing index arrays
+COMPACT_DTYPES = (np.uint8, np.uint16, np.uint32)
+
+# Postings are compressed in blocks of this many entries
+POSTINGS_BLOCK = 128
+
+# Bytes written per bit-packed value (a 32-bit value starting at any bit of its first byte)
+PACK_WINDOW = 5
+# Zero bytes closing every packed stream, so the 8-byte window of any value stays inside it
+PACK_PADDING = 8
+
+
+def pack_arrays(arrays: Dict[str, np.ndarray], meta: dict = None) -> bytes:
+    """
+    Serialize named NumPy arrays into one buffer.
+
+    Layout: magic, little-endian uint64 header length, JSON header describing
+    every array (dtype, byte offset, length), then the raw array data, each
+    array aligned to 8 bytes so it can be viewed in place without copying.
+    """
+    layout = {}
+    offset = 0
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        layout[name] = [values.dtype.str, offset, len(values)]
+        offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps({'meta': meta or {}, 'arrays': layout}).encode('utf-8')
+    header += b' ' * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+
+    parts = [MAGIC, struct.pack('<Q', len(header)), header]
+    for name, values in arrays.items():
+        data = np.ascontiguousarray(values).tobytes()
+        parts.append(data)
+        parts.append(b'\0' * (-len(data) % ALIGNMENT))
+    return b''.join(parts)
+
+
+def unpack_arrays(buffer) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """
+    Read a buffer written by pack_arrays, returning (meta, arrays).
+
+    Arrays are read-only views into the buffer (bytes or mmap), nothing is copied.
+    """
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not an index segment file")
+    (header_length,) = struct.unpack_from('<Q', buffer, len(MAGIC))
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(buffer[start:start + header_length]).decode('utf-8'))
+    data_start = start + header_length
+
+    arrays = {}
+    for name, (dtype, offset, count) in header['arrays'].items():
+        arrays[name] = np.frombuffer(buffer, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+    return header['meta'], arrays
+
+
+def compact(values: np.ndarray) -> np.ndarray:
+    """
+    Store non-negative integers in the smallest unsigned dtype that holds them.
+
+    Segment-local doc ids, term ids, frequencies and positions are small, so
+    most arrays fit in one or two bytes per entry. Readers get the dtype from
+    the segment header, and widen before adding global offsets.
+    """
+    maximum = int(values.max()) if len(values) else 0
+    for dtype in COMPACT_DTYPES:
+        if maximum <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+def _offsets(lengths) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _bit_lengths(values: np.ndarray) -> np.ndarray:
+    """
+    Bits needed to store each non-negative integer below 2 ** 53 (0 for 0)
+    """
+    # frexp's exponent of a positive integer is its bit length
+    return np.frexp(values.astype(np.float64))[1].astype(np.int64)
+
+
+def _write_bits(values: np.ndarray, bits: np.ndarray, size: int) -> np.ndarray:
+    """
+    Pack integers below 2 ** 32 at the given bit positions into size bytes, followed by PACK_PADDING zero bytes
+
+    The bit ranges of the values must not overlap.
+    """
+    shifted = values.astype(np.uint64) << (bits & 7).astype(np.uint64)
+    byte = bits >> 3
+    total = size + PACK_PADDING
+    packed = np.zeros(total, dtype=np.float64)
+    for i in range(PACK_WINDOW):
+        # Values occupy disjoint bits, so adding their bytes ORs them
+        part = ((shifted >> np.uint64(8 * i)) & np.uint64(0xff)).astype(np.float64)
+        packed += np.bincount(byte + i, weights=part, minlength=total)[:total]
+    return packed.astype(np.uint8)
+
+
+def _byte_windows(packed: np.ndarray) -> np.ndarray:
+    """
+    Overlapping little-endian uint64 view of a packed stream: element i holds bytes i .. i + 7
+    """
+    return np.ndarray((len(packed) - PACK_PADDING + 1,), dtype='<u8', buffer=packed, strides=(1,))
+
+
+def _read_bits(windows: np.ndarray, bits, widths) -> np.ndarray:
+    """
+    Integers of the given bit widths starting at the given bit positions of a packed stream
+    """
+    masks = (np.uint64(1) << np.asarray(widths, dtype=np.uint64)) - np.uint64(1)
+    return ((windows[bits >> 3] >> np.asarray(bits & 7, dtype=np.uint64)) & masks).astype(np.int64)
+
+
+def encode_postings(postings_ptr: np.ndarray, docs: np.ndarray, tfs: np.ndarray,
+                    doc_lengths: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Compress the postings of a field into bit-packed blocks of POSTINGS_BLOCK entries.
+
+    Doc ids are stored as gaps to the previous posting of the term (the
+    first posting of a term as its doc id), term frequencies as tf - 1,
+    which is 0 for most postings. A block holds its gaps, then its
+    frequencies, each at the bit width of the block's largest value, and
+    starts on a byte boundary. block_last, the last doc id of every block,
+    doubles as a skip list: lookups only decode the blocks whose range can
+    hold the doc ids they probe. block_max_tf and block_min_length, the
+    largest term frequency and shortest document of every block, bound any
+    score that grows with tf and shrinks with document length, so rankers
+    can skip blocks without decoding them.
+
+    :param postings_ptr: Per term, the range of its postings in docs and tfs
+    :param doc_lengths: Length of every document of the segment
+    """
+    postings_ptr = postings_ptr.astype(np.int64)
+    docs, tfs = docs.astype(np.int64), tfs.astype(np.int64)
+    df = np.diff(postings_ptr)
+    block_ptr = _offsets(-(-df // POSTINGS_BLOCK))
+    num_blocks = int(block_ptr[-1])
+    block_term = np.repeat(np.arange(len(df)), np.diff(block_ptr))
+    block_start = postings_ptr[:-1][block_term] + (np.arange(num_blocks) - block_ptr[:-1][block_term]) * POSTINGS_BLOCK
+    block_end = np.minimum(block_start + POSTINGS_BLOCK, postings_ptr[1:][block_term])
+    counts = block_end - block_start
+
+    gaps = docs.copy()
+    gaps[1:] -= docs[:-1]
+    term_starts = postings_ptr[:-1][df > 0]
+    gaps[term_starts] = docs[term_starts]
+    tfs = tfs - 1
+
+    doc_widths = np.zeros(num_blocks, dtype=np.int64)
+    tf_widths = np.zeros(num_blocks, dtype=np.int64)
+    block_max_tf = np.zeros(num_blocks, dtype=np.int64)
+    block_min_length = np.zeros(num_blocks, dtype=np.int64)
+    if num_blocks:
+        doc_widths = np.maximum.reduceat(_bit_lengths(gaps), block_start)
+        tf_widths = np.maximum.reduceat(_bit_lengths(tfs), block_start)
+        block_max_tf = np.maximum.reduceat(tfs, block_start) + 1
+        block_min_length = np.minimum.reduceat(np.asarray(doc_lengths, dtype=np.int64)[docs], block_start)
+    block_offsets = _offsets((counts * (doc_widths + tf_widths) + 7) // 8)
+
+    value_block = np.repeat(np.arange(num_blocks), counts)
+    rank = np.arange(len(docs)) - block_start[value_block]
+    doc_bits = block_offsets[:-1][value_block] * 8 + rank * doc_widths[value_block]
+    tf_bits = (block_offsets[:-1] * 8 + counts * doc_widths)[value_block] + rank * tf_widths[value_block]
+    return {
+        'block_ptr': block_ptr,
+        'block_last': docs[block_end - 1],
+        'block_max_tf': block_max_tf,
+        'block_min_length': block_min_length,
+        'block_offsets': block_offsets,
+        'doc_widths': doc_widths,
+        'tf_widths': tf_widths,
+        'postings_bytes': _write_bits(np.concatenate((gaps, tfs)), np.concatenate((doc_bits, tf_bits)),
+                                      int(block_offsets[-1])),
+    }
+
+
+def _encode_strings(values: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenate strings as UTF-8, returning (offsets, bytes)
+    """
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = compact(_offsets([len(value) for value in encoded]))
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+class TokenArrays(NamedTuple):
+    """
+    Analyzer output of a batch of documents as term ids.
+
+    vocabulary is sorted, ids holds one entry per token (-1 for position
+    placeholders) and document i owns ids[offsets[i]:offsets[i + 1]].
+    """
+    vocabulary: List[str]
+    ids: np.ndarray
+    offsets: np.ndarray
+
+
+def encode_tokens(token_lists: List[List[str]]) -> TokenArrays:
+    """
+    Encode analyzed documents against a batch-local sorted vocabulary
+    """
+    vocabulary = sorted({term for tokens in token_lists for term in tokens if term})
+    term_ids = {term: term_id for term_id, term in enumerate(vocabulary)}
+    term_ids[''] = -1
+    ids = np.fromiter(
+        (term_ids[term] for tokens in token_lists for term in tokens),
+        dtype=np.int32, count=sum(len(tokens) for tokens in token_lists)
+    )
+    return TokenArrays(vocabulary, ids, _offsets([len(tokens) for tokens in token_lists]))
+
+
+def merge_token_arrays(parts: List[TokenArrays]) -> TokenArrays:
+    """
+    Concatenate consecutive batches, remapping their ids onto the merged vocabulary
+    """
+    if len(parts) == 1:
+        return parts[0]
+    vocabulary = sorted(set().union(*(part.vocabulary for part in parts)))
+    term_ids = {term: term_id for term_id, term in enumerate(vocabulary)}
+    ids, offsets, base = [], [np.zeros(1, dtype=np.int64)], 0
+    for part in parts:
+        # The trailing -1 maps placeholders (id -1) onto themselves
+        remap = np.array([term_ids[term] for term in part.vocabulary] + [-1], dtype=np.int32)
+        ids.append(remap[part.ids])
+        offsets.append(part.offsets[1:] + base)
+        base += part.offsets[-1]
+    return TokenArrays(vocabulary, np.concatenate(ids), np.concatenate(offsets))
+
+
+def select_tokens(tokens: TokenArrays, indices: List[int]) -> TokenArrays:
+    """
+    The documents at the given indices, in that order (repeats allowed), with unused terms dropped
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    lengths = np.diff(tokens.offsets)[indices]
+    ids = _gather_ranges(tokens.ids, tokens.offsets[:-1][indices], lengths)
+    used = np.zeros(len(tokens.vocabulary) + 1, dtype=bool)
+    used[ids] = True
+    used = used[:-1]
+    vocabulary = tokens.vocabulary
+    if not used.all():
+        # The trailing -1 maps placeholders (id -1) onto themselves
+        remap = np.append(np.cumsum(used) - 1, -1).astype(np.int32)
+        vocabulary = [term for term, keep in zip(vocabulary, used.tolist()) if keep]
+        ids = remap[ids]
+    return TokenArrays(vocabulary, ids, _offsets(lengths))
+
+
+def decode_tokens(tokens: TokenArrays) -> List[List[str]]:
+    """
+    Term lists of every document, '' for position placeholders
+    """
+    vocabulary = tokens.vocabulary + ['']  # id -1 picks the trailing ''
+    terms = [vocabulary[term_id] for term_id in tokens.ids.tolist()]
+    offsets = tokens.offsets.tolist()
+    return [terms[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def build_field(tokens: TokenArrays, positional: bool) -> Dict[str, np.ndarray]:
+    """
+    Build the arrays of one field for a batch of analyzed documents.
+
+    Placeholder tokens (id -1) are not indexed but still advance positions.
+    """
+    vocabulary, ids, offsets = tokens
+    num_docs = len(offsets) - 1
+    num_terms = len(vocabulary)
+
+    token_docs = np.repeat(np.arange(num_docs, dtype=np.int64), np.diff(offsets))
+    token_positions = np.arange(len(ids), dtype=np.int64) - offsets[:-1][token_docs]
+    valid = ids >= 0
+    terms, docs, positions = ids[valid].astype(np.int64), token_docs[valid], token_positions[valid]
+
+    # Tokens are already in (document, position) order, a stable sort groups them by term
+    order = np.argsort(terms, kind='stable')
+    terms, docs, positions = terms[order], docs[order], positions[order]
+
+    # One posting per distinct (term, document) run
+    keys = terms * max(num_docs, 1) + docs
+    boundaries = np.ones(len(keys), dtype=bool)
+    boundaries[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(boundaries)
+    postings_terms, postings_docs = terms[starts], docs[starts]
+    postings_tfs = np.diff(np.append(starts, len(keys)))
+
+    postings_ptr = _offsets(np.bincount(postings_terms, minlength=num_terms))
+    doc_lengths = np.bincount(docs, minlength=num_docs)
+
+    # Forward index: distinct term ids of every document
+    forward_order = np.lexsort((postings_terms, postings_docs))
+
+    term_offsets, term_bytes = _encode_strings(vocabulary)
+    arrays = {
+        'term_offsets': term_offsets,
+        'term_bytes': term_bytes,
+        'postings_ptr': postings_ptr,
+        **encode_postings(postings_ptr, postings_docs, postings_tfs, doc_lengths),
+        'doc_lengths': doc_lengths,
+        'forward_ptr': _offsets(np.bincount(postings_docs, minlength=num_docs)),
+        'forward_ids': postings_terms[forward_order],
+    }
+    if positional:
+        arrays['positions_ptr'] = _offsets(postings_tfs)
+        arrays['positions'] = positions
+    return {name: values if name == 'term_bytes' else compact(values) for name, values in arrays.items()}
+
+
+def build_segment(docs: List[dict], field_tokens: Dict[str, TokenArrays],
+                  positional: Iterable[str]) -> Tuple[bytes, bytes]:
+    """
+    Serialize a batch of documents into an index segment and a document store buffer
+
+    :param docs: Documents with 'title' and 'content'
+    :param field_tokens: Per field, the encoded analyzer output of the batch
+    :param positional: Names of the fields that keep positions
+    :return: (index buffer, document store buffer)
+    """
+    positional = set(positional)
+    arrays = {}
+    for name, tokens in field_tokens.items():
+        for array_name, values in build_field(tokens, name in positional).items():
+            arrays[f'{name}.{array_name}'] = values
+    index_buffer = pack_arrays(arrays, {'num_docs': len(docs), 'fields': sorted(field_tokens)})
+    return index_buffer, _build_docs(docs)
+
+
+def _build_docs(docs: List[dict]) -> bytes:
+    """
+    Serialize the document store of a segment
+    """
+    title_offsets, title_bytes = _encode_strings(doc['title'] for doc in docs)
+    content_offsets, content_bytes = _encode_strings(doc['content'] for doc in docs)
+    return pack_arrays({
+        'title_offsets': title_offsets,
+        'title_bytes': title_bytes,
+        'content_offsets': content_offsets,
+        'content_bytes': content_bytes,
+    }, {'num_docs': len(docs)})
+
+
+def _gather_ranges(values: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Concatenate values[start:start + length] for every (start, length) pair
+    """
+    total = int(lengths.sum())
+    if not total:
+        return values[:0]
+    # Index of each output entry: its range start plus its rank inside the range
+    range_offsets = _offsets(lengths)[:-1]
+    return values[np.repeat(starts - range_offsets, lengths) + np.arange(total)]
+
+
+def merge_field(parts: List[Tuple['FieldSegment', np.ndarray, int]]) -> Dict[str, np.ndarray]:
+    """
+    Build the arrays of one field for consecutive segments merged into one, without re-analyzing text.
+
+    Postings of deleted documents are dropped (their document lengths
+    become 0), and terms left without postings leave the dictionary.
+
+    :param parts: (field segment, local live mask, first local id inside the merged segment) per segment
+    """
+    positional = parts[0][0].positions is not None
+    vocabularies, postings = [], []
+    for segment, live, doc_offset in parts:
+        ptr = segment.postings_ptr.astype(np.int64)
+        terms = np.repeat(np.arange(segment.num_terms, dtype=np.int64), np.diff(ptr))
+        docs, tfs = segment.all_postings()
+        keep = live[docs]
+        all_terms = segment.terms()
+        vocabularies.append([all_terms[term_id] for term_id in np.unique(terms[keep]).tolist()])
+        postings.append((segment, all_terms, terms, docs[keep], tfs[keep], keep, doc_offset))
+
+    vocabulary = sorted(set().union(*vocabularies))
+    term_ids = {term: term_id for term_id, term in enumerate(vocabulary)}
+    num_docs = sum(len(live) for _, live, _ in parts)
+
+    term_parts, doc_parts, tf_parts, position_parts, length_parts, position_base = [], [], [], [], [], 0
+    for (segment, all_terms, terms, docs, tfs, keep, doc_offset), (_, live, _) in zip(postings, parts):
+        # Terms without a live posting map to -1 and are never looked up
+        remap = np.array([term_ids.get(term, -1) for term in all_terms] + [-1], dtype=np.int64)
+        term_parts.append(remap[terms[keep]])
+        doc_parts.append(docs + doc_offset)
+        tf_parts.append(tfs)
+        length_parts.append(np.where(live, segment.doc_lengths, 0))
+        if positional:
+            starts = segment.positions_ptr[:-1].astype(np.int64)[keep] + position_base
+            position_parts.append((segment.positions.astype(np.int64), starts))
+            position_base += len(segment.positions)
+
+    terms = np.concatenate(term_parts)
+    docs = np.concatenate(doc_parts)
+    tfs = np.concatenate(tf_parts)
+    # Every part is in (term, document) order and later parts hold later documents,
+    # so a stable sort on the merged term ids restores (term, document) order
+    order = np.argsort(terms, kind='stable')
+    terms, docs, tfs = terms[order], docs[order], tfs[order]
+    forward_order = np.lexsort((terms, docs))
+    postings_ptr = _offsets(np.bincount(terms, minlength=len(vocabulary)))
+    doc_lengths = np.concatenate(length_parts)
+
+    term_offsets, term_bytes = _encode_strings(vocabulary)
+    arrays = {
+        'term_offsets': term_offsets,
+        'term_bytes': term_bytes,
+        'postings_ptr': postings_ptr,
+        **encode_postings(postings_ptr, docs, tfs, doc_lengths),
+        'doc_lengths': doc_lengths,
+        'forward_ptr': _offsets(np.bincount(docs, minlength=num_docs)),
+        'forward_ids': terms[forward_order],
+    }
+    if positional:
+        positions = np.concatenate([values for values, _ in position_parts])
+        starts = np.concatenate([starts for _, starts in position_parts])[order]
+        arrays['positions_ptr'] = _offsets(tfs)
+        arrays['positions'] = _gather_ranges(positions, starts, tfs)
+    return {name: values if name == 'term_bytes' else compact(values) for name, values in arrays.items()}
+
+
+def merge_segments(segments: List['Segment'], live_masks: List[np.ndarray]) -> Tuple[bytes, bytes]:
+    """
+    Serialize consecutive segments as one, physically dropping deleted documents
+
+    Deleted documents keep their ids (the merged segment covers the same id
+    range) but lose their postings, title and content.
+
+    :param segments: Adjacent segments, in document id order
+    :param live_masks: Per segment, True for every local document still live
+    :return: (index buffer, document store buffer)
+    """
+    doc_offsets = _offsets([segment.num_docs for segment in segments])
+    field_names = sorted(segments[0].fields)
+    arrays = {}
+    for name in field_names:
+        parts = [(segment.fields[name], live, int(doc_offset))
+                 for segment, live, doc_offset in zip(segments, live_masks, doc_offsets)]
+        for array_name, values in merge_field(parts).items():
+            arrays[f'{name}.{array_name}'] = values
+    dropped = sum(int(len(live) - live.sum()) for live in live_masks)
+    index_buffer = pack_arrays(arrays, {'num_docs': int(doc_offsets[-1]), 'fields': field_names, 'dropped': dropped})
+
+    empty = {'title': '', 'content': ''}
+    docs = [segment.document(local_id) if live[local_id] else empty
+            for segment, live in zip(segments, live_masks) for local_id in range(segment.num_docs)]
+    return index_buffer, _build_docs(docs)
+
+
+class PostingList(Mapping):
+    """
+    Read-only {doc_id: tf} mapping backed by sorted NumPy arrays.
+
+    Iteration yields doc ids in ascending order; lookups build a hash table
+    on first use.
+    """
+
+    __slots__ = ('doc_ids', 'tfs', '_lookup')
+
+    def __init__(self, doc_ids: np.ndarray, tfs: np.ndarray):
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self._lookup = None
+
+    def _table(self) -> dict:
+        if self._lookup is None:
+            self._lookup = dict(zip(self.doc_ids.tolist(), self.tfs.tolist()))
+        return self._lookup
+
+    def __getitem__(self, doc_id: int) -> int:
+        return self._table()[doc_id]
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._table()
+
+    def get(self, doc_id, default=None):
+        return self._table().get(doc_id, default)
+
+    def __iter__(self):
+        return iter(self.doc_ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def items(self):
+        return zip(self.doc_ids.tolist(), self.tfs.tolist())
+
+
+EMPTY_POSTINGS = PostingList(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32))
+
+
+class FieldSegment:
+    """
+    Read-only view of one field inside a segment.
+
+    Postings are decoded from their bit-packed blocks on every read.
+    Segments written before postings were compressed keep plain
+    postings_docs / postings_tfs arrays, which are read as they are, and
+    segments written before blocks carried score bounds derive them from
+    the postings (see block_bounds).
+    """
+
+    def __init__(self, base: int, arrays: Dict[str, np.ndarray]):
+        self.base = base
+        self.term_offsets = arrays['term_offsets']
+        self.term_bytes = arrays['term_bytes']
+        self.postings_ptr = arrays['postings_ptr']
+        self.postings_docs = arrays.get('postings_docs')
+        self.postings_tfs = arrays.get('postings_tfs')
+        self.block_ptr = arrays.get('block_ptr')
+        self.block_last = arrays.get('block_last')
+        self.block_max_tf = arrays.get('block_max_tf')
+        self.block_min_length = arrays.get('block_min_length')
+        self.block_offsets = arrays.get('block_offsets')
+        self.doc_widths = arrays.get('doc_widths')
+        self.tf_widths = arrays.get('tf_widths')
+        self.postings_bytes = arrays.get('postings_bytes')
+        self._windows = _byte_windows(self.postings_bytes) if self.postings_bytes is not None else None
+        self.doc_lengths = arrays['doc_lengths']
+        self.forward_ptr = arrays['forward_ptr']
+        self.forward_ids = arrays['forward_ids']
+        self.positions_ptr = arrays.get('positions_ptr')
+        self.positions = arrays.get('positions')
+        self.num_terms = len(self.term_offsets) - 1
+        self._term_text: Optional[str] = None
+
+    @property
+    def compressed(self) -> bool:
+        return self.postings_docs is None
+
+    @property
+    def postings_nbytes(self) -> int:
+        """
+        Bytes taken by the postings (doc ids, frequencies and skip data, not positions)
+        """
+        if not self.compressed:
+            return self.postings_docs.nbytes + self.postings_tfs.nbytes
+        return sum(values.nbytes for values in (self.block_ptr, self.block_last, self.block_max_tf,
+                                                 self.block_min_length, self.block_offsets, self.doc_widths,
+                                                 self.tf_widths, self.postings_bytes) if values is not None)
+
+    def term(self, term_id: int) -> str:
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.term_bytes[start:end].tobytes().decode('utf-8')
+
+    def terms(self) -> List[str]:
+        """
+        The segment's term dictionary, in sorted order
+        """
+        blob = self.term_bytes.tobytes()
+        offsets = self.term_offsets.tolist()
+        return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(self.num_terms)]
+
+    def search_terms(self, pattern: re.Pattern) -> List[str]:
+        """
+        Terms matching a multiline pattern anchored with ^ and $, in sorted order
+
+        The dictionary is decoded once into newline-separated text, so a scan
+        that cannot be narrowed to a prefix runs inside the regex engine.
+        """
+        if self._term_text is None:
+            self._term_text = '\n'.join(self.terms())
+        return pattern.findall(self._term_text)
+
+    def _lower_bound(self, key: bytes) -> int:
+        """
+        Id of the first term whose UTF-8 bytes are not less than key
+        """
+        offsets, blob = self.term_offsets, self.term_bytes
+        low, high = 0, self.num_terms
+        while low < high:
+            mid = (low + high) // 2
+            if blob[offsets[mid]:offsets[mid + 1]].tobytes() < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def term_id(self, term: str) -> Optional[int]:
+        """
+        Binary search of the sorted term dictionary
+        """
+        key = term.encode('utf-8')
+        low = self._lower_bound(key)
+        if low < self.num_terms and self.term_bytes[self.term_offsets[low]:self.term_offsets[low + 1]].tobytes() == key:
+            return low
+        return None
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """
+        Term ids [start, end) of the terms starting with prefix
+
+        UTF-8 byte order is code point order, and no UTF-8 sequence contains
+        the byte 0xff, so every extension of the prefix sorts below prefix + 0xff.
+        """
+        if not prefix:
+            return 0, self.num_terms
+        key = prefix.encode('utf-8')
+        return self._lower_bound(key), self._lower_bound(key + b'\xff')
+
+    def _decode_block(self, block: int, count: int, base: int,
+                      with_tfs: bool = True) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Doc ids (and term frequencies) of a single block; most terms fit in one
+        """
+        doc_width = int(self.doc_widths[block])
+        bits = int(self.block_offsets[block]) * 8
+        docs = np.cumsum(_read_bits(self._windows, bits + doc_width * np.arange(count), doc_width))
+        if base:
+            docs += base
+        if not with_tfs:
+            return docs, None
+        tf_width = int(self.tf_widths[block])
+        if not tf_width:
+            return docs, np.ones(count, dtype=np.int64)
+        bits += count * doc_width
+        return docs, _read_bits(self._windows, bits + tf_width * np.arange(count), tf_width) + 1
+
+    def _decode(self, blocks: np.ndarray, counts: np.ndarray, bases: np.ndarray,
+                with_tfs: bool = True) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Doc ids (and term frequencies) of some blocks, in block order
+
+        :param bases: Per block, the doc id its first gap is relative to
+        """
+        if len(blocks) == 1:
+            return self._decode_block(int(blocks[0]), int(counts[0]), int(bases[0]), with_tfs)
+        value_block = np.repeat(np.arange(len(blocks)), counts)
+        block_starts = _offsets(counts)[:-1]
+        rank = np.arange(len(value_block)) - block_starts[value_block]
+        doc_widths = self.doc_widths[blocks].astype(np.int64)
+        block_bits = self.block_offsets[blocks].astype(np.int64) * 8
+        gaps = _read_bits(self._windows, block_bits[value_block] + rank * doc_widths[value_block],
+                          doc_widths[value_block])
+        # Prefix sums restarted at every block, each block continuing from its base
+        sums = np.cumsum(gaps)
+        docs = sums + np.repeat(bases - (sums[block_starts] - gaps[block_starts]), counts)
+        if not with_tfs:
+            return docs, None
+        tf_widths = self.tf_widths[blocks].astype(np.int64)
+        tf_bits = (block_bits + counts * doc_widths)[value_block] + rank * tf_widths[value_block]
+        return docs, _read_bits(self._windows, tf_bits, tf_widths[value_block]) + 1
+
+    def _term_blocks(self, term_id: int, ranks: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (block indices, posting counts, delta bases) of a term's blocks, every block or those at the given ranks
+        """
+        first, end = int(self.block_ptr[term_id]), int(self.block_ptr[term_id + 1])
+        if ranks is None:
+            ranks = np.arange(end - first)
+        blocks = first + ranks
+        df = int(self.postings_ptr[term_id + 1] - self.postings_ptr[term_id])
+        counts = np.minimum(POSTINGS_BLOCK, df - ranks * POSTINGS_BLOCK)
+        bases = np.where(ranks > 0, self.block_last[np.maximum(blocks - 1, 0)].astype(np.int64), 0)
+        return blocks, counts, bases
+
+    def postings(self, term_id: int, with_tfs: bool = True) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Segment-local doc ids and term frequencies of a term (None unless with_tfs)
+        """
+        start, end = int(self.postings_ptr[term_id]), int(self.postings_ptr[term_id + 1])
+        if not self.compressed:
+            return self.postings_docs[start:end], self.postings_tfs[start:end] if with_tfs else None
+        if end - start <= POSTINGS_BLOCK:
+            return self._decode_block(int(self.block_ptr[term_id]), end - start, 0, with_tfs)
+        return self._decode(*self._term_blocks(term_id), with_tfs=with_tfs)
+
+    def block_bounds(self, term_id: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (last local doc id, largest tf, shortest document length) of each block of a term's postings
+
+        Read from the skip data when the segment stores it, otherwise
+        derived from the decoded postings.
+        """
+        if self.block_max_tf is not None:
+            first, end = int(self.block_ptr[term_id]), int(self.block_ptr[term_id + 1])
+            return self.block_last[first:end], self.block_max_tf[first:end], self.block_min_length[first:end]
+        docs, tfs = self.postings(term_id)
+        starts = np.arange(0, len(docs), POSTINGS_BLOCK)
+        ends = np.minimum(starts + POSTINGS_BLOCK, len(docs))
+        return docs[ends - 1], np.maximum.reduceat(tfs, starts), np.minimum.reduceat(self.doc_lengths[docs], starts)
+
+    def block_postings(self, term_id: int, rank: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Segment-local doc ids and term frequencies of the rank-th block of a term's postings
+        """
+        start = int(self.postings_ptr[term_id]) + rank * POSTINGS_BLOCK
+        end = min(start + POSTINGS_BLOCK, int(self.postings_ptr[term_id + 1]))
+        if not self.compressed:
+            return self.postings_docs[start:end], self.postings_tfs[start:end]
+        block = int(self.block_ptr[term_id]) + rank
+        base = int(self.block_last[block - 1]) if rank else 0
+        return self._decode_block(block, end - start, base)
+
+    def doc_ids(self, term_id: int) -> np.ndarray:
+        """
+        Segment-local doc ids of a term, without decoding its frequencies
+        """
+        return self.postings(term_id, with_tfs=False)[0]
+
+    def all_postings(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Doc ids and term frequencies of every posting, term by term, decoded in one pass
+        """
+        if not self.compressed:
+            return self.postings_docs.astype(np.int64), self.postings_tfs.astype(np.int64)
+        num_blocks = len(self.block_last)
+        blocks = np.arange(num_blocks)
+        df = np.diff(self.postings_ptr.astype(np.int64))
+        block_term = np.repeat(np.arange(self.num_terms), np.diff(self.block_ptr.astype(np.int64)))
+        ranks = blocks - self.block_ptr[:-1].astype(np.int64)[block_term]
+        counts = np.minimum(POSTINGS_BLOCK, df[block_term] - ranks * POSTINGS_BLOCK)
+        bases = np.where(ranks > 0, self.block_last[np.maximum(blocks - 1, 0)].astype(np.int64), 0)
+        return self._decode(blocks, counts, bases)
+
+    def lookup(self, term_id: int, local_ids: np.ndarray) -> np.ndarray:
+        """
+        Posting number of a term in each of some documents, -1 where the document lacks the term
+
+        Only the blocks whose doc id range can hold one of local_ids are decoded.
+
+        :param local_ids: Sorted segment-local doc ids
+        """
+        start = int(self.postings_ptr[term_id])
+        if not self.compressed:
+            docs = self.postings_docs[start:int(self.postings_ptr[term_id + 1])]
+            found = np.searchsorted(docs, local_ids)
+            postings = start + found
+        else:
+            first, end = int(self.block_ptr[term_id]), int(self.block_ptr[term_id + 1])
+            # Skip list: the block of a doc id is the first one ending at or after it
+            id_ranks = np.searchsorted(self.block_last[first:end], local_ids)
+            ranks = np.unique(id_ranks[id_ranks < end - first])
+            blocks, counts, bases = self._term_blocks(term_id, ranks)
+            docs, _ = self._decode(blocks, counts, bases, with_tfs=False)
+            found = np.searchsorted(docs, local_ids)
+            # A decoded entry is posting start + rank * POSTINGS_BLOCK + its index inside the block
+            entry_block = np.repeat(np.arange(len(ranks)), counts)
+            entry_postings = start + ranks[entry_block] * POSTINGS_BLOCK + np.arange(len(docs)) \
+                - _offsets(counts)[:-1][entry_block]
+            postings = np.append(entry_postings, -1)[found]
+        hit = found < len(docs)
+        hit[hit] = docs[found[hit]] == local_ids[hit]
+        return np.where(hit, postings, -1)
+
+    def get_positions(self, term_id: int, local_id: int) -> List[int]:
+        posting = int(self.lookup(term_id, np.array([local_id], dtype=np.int64))[0])
+        if posting < 0:
+            return []
+        return self.positions[self.positions_ptr[posting]:self.positions_ptr[posting + 1]].tolist()
+
+    def doc_positions(self, term_id: int, local_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Token positions of a term in several documents that all contain it
+
+        :param local_ids: Sorted segment-local ids, each in the term's postings
+        :return: (local id of every occurrence, its position), grouped by document
+        """
+        postings = self.lookup(term_id, local_ids)
+        starts = self.positions_ptr[postings].astype(np.int64)
+        lengths = self.positions_ptr[postings + 1].astype(np.int64) - starts
+        return np.repeat(local_ids, lengths), _gather_ranges(self.positions, starts, lengths)
+
+
+class Segment:
+    """Immutable batch of indexed documents with ids base .. base + num_docs - 1."""
+
+    def __init__(self, name: str, base: int, index_buffer, docs_buffer):
+        """
+        :param name: Segment file name stem (or an in-memory label)
+        :param base: Global id of the first document
+        :param index_buffer: Buffer produced by build_segment (bytes or mmap)
+        :param docs_buffer: Document store buffer produced by build_segment
+        """
+        self.name = name
+        self.base = base
+        meta, arrays = unpack_arrays(index_buffer)
+        self.num_docs = meta['num_docs']
+        # Deleted documents whose postings and text a merge already removed
+        self.dropped = meta.get('dropped', 0)
+        self.fields: Dict[str, FieldSegment] = {}
+        for field_name in meta['fields']:
+            prefix = field_name + '.'
+            self.fields[field_name] = FieldSegment(base, {
+                key[len(prefix):]: values for key, values in arrays.items() if key.startswith(prefix)
+            })
+        _, self._docs = unpack_arrays(docs_buffer)
+        # Keep the buffers (possibly mmaps) alive as long as the views
+        self._buffers = (index_buffer, docs_buffer)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the index and document store buffers
+        """
+        return sum(len(buffer) for buffer in self._buffers)
+
+    def _string(self, kind: str, local_id: int) -> str:
+        offsets = self._docs[kind + '_offsets']
+        return self._docs[kind + '_bytes'][offsets[local_id]:offsets[local_id + 1]].tobytes().decode('utf-8')
+
+    def title(self, local_id: int) -> str:
+        return self._string('title', local_id)
+
+    def document(self, local_id: int) -> dict:
+        return {'title': self.title(local_id), 'content': self._string('content', local_id)}
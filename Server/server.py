@@ -1,126 +1,433 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS  # Import CORS
-from collections import defaultdict, Counter
-from nltk import word_tokenize, pos_tag
-from nltk.corpus import stopwords, wordnet
-from nltk.stem import WordNetLemmatizer
+from collections import defaultdict
+from nltk import word_tokenize
+import json
 import math
-from bim import DocumentSearcher
+import os
+import time
+from bim import DocumentSearcher, TextProcessor
 from ranker import DocumentRanker
 from ir_helper import InformationRetrievalModels
-from boolean import preprocess_document, process_query
+from batch import BatchSearcher
+from shards import ShardedIndex, ShardsUnavailable
+from title_index import TitleIndex
+from boolean import tokenize_document, process_query, positive_terms, QuerySyntaxError, FIELD as BOOLEAN_FIELD
+from index import CorpusIndex
+from analysis_pool import default_workers
+from analysis import NounLemmaAnalyzer, FIELD as NOUN_FIELD
+from synonyms import SynonymExpander
+from results import MAX_K, get_page, select_top, select_page, format_hits
+from ingest import IngestQueue, parse_ndjson
+from cache import ResultCache
+import resources
+import metrics
+from metrics import count, stage
 
 app = Flask(__name__)
 cors = CORS(app)  # Enable CORS for all routes
 
-documents = []  # In-memory storage for documents
+# Directory of the persistent index; uploads survive restarts and are memory-mapped on startup
+INDEX_DIR = os.environ.get('INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index_data'))
+
+# What was loaded at startup and how long each part took, served by /api/startup
+startup_report = {'phases': [], 'resources': resources.check()}
+
+
+def _record_phase(name: str, start: float, **details):
+    startup_report['phases'].append(dict(phase=name, seconds=time.perf_counter() - start, **details))
+
+
+_opened = time.perf_counter()
+# Shared corpus index, updated incrementally on every upload
+corpus = CorpusIndex({
+    BOOLEAN_FIELD: tokenize_document,
+    DocumentSearcher.FIELD: TextProcessor.tokenize,
+    DocumentRanker.FIELD: DocumentRanker.preprocess_text,
+    NOUN_FIELD: NounLemmaAnalyzer(),
+}, positional=[DocumentSearcher.FIELD], path=INDEX_DIR, workers=default_workers())
+documents = corpus.documents  # Decoded from the segment document stores on access
+_record_phase('open_index', _opened, documents=len(corpus), segments=len(corpus.segments))
+ranker = DocumentRanker(index=corpus)  # Caches collection statistics per corpus version
+ir_models = InformationRetrievalModels(index=corpus)  # Inference / belief networks, term beliefs cached per version
+batch_searcher = BatchSearcher(corpus, ranker, ir_models)  # Many queries scored in one sparse product
+MAX_BATCH_QUERIES = int(os.environ.get('MAX_BATCH_QUERIES', 10000))
+synonym_expander = SynonymExpander()  # Query expansion bounded to the indexed noun vocabulary
+corpus.add_listener(lambda segment: synonym_expander.add_vocabulary(segment.fields[NOUN_FIELD].terms()))
+_started = time.perf_counter()
+title_index = TitleIndex(corpus)  # Character n-grams of every title, for title search and autocomplete
+corpus.add_listener(title_index.add_segment)
+corpus.add_merge_listener(title_index.replace_segments)
+_record_phase('title_index', _started, documents=len(corpus))
+result_cache = ResultCache(  # Repeated tfidf / bim / boolean queries, invalidated by corpus version
+    max_entries=int(os.environ.get('RESULT_CACHE_ENTRIES', 1024)),
+    max_bytes=int(os.environ.get('RESULT_CACHE_BYTES', 64 * 1024 * 1024)),
+)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'  # Per-request stage timers and counters
+registry = metrics.Registry()
+registry.register_callback('corpus_documents', 'gauge', 'Indexed documents', lambda: len(corpus))
+registry.register_callback('corpus_live_documents', 'gauge', 'Indexed documents not deleted', lambda: corpus.num_live)
+registry.register_callback('corpus_segments', 'gauge', 'Committed index segments', lambda: len(corpus.segments))
+registry.register_callback('corpus_version', 'gauge', 'Corpus version', lambda: corpus.version)
+registry.register_callback('corpus_listener_failures_total', 'counter', 'Failed commit listener calls',
+                           lambda: corpus.listener_failures)
+if corpus.merger is not None:
+    registry.register_callback('segment_merges_total', 'counter', 'Segment merges committed',
+                               lambda: corpus.merger.merges)
+    registry.register_callback('segment_merge_documents_dropped_total', 'counter',
+                               'Deleted documents physically removed by merges', lambda: corpus.merger.documents_dropped)
+    registry.register_callback('segment_merge_failures_total', 'counter', 'Failed segment merges',
+                               lambda: corpus.merger.failures)
+for _name in ('hits', 'misses', 'evictions', 'invalidations'):
+    registry.register_callback(f'result_cache_{_name}_total', 'counter', f'Result cache {_name}',
+                               lambda name=_name: result_cache.stats()[name])
+registry.register_callback('result_cache_bytes', 'gauge', 'Estimated size of cached results',
+                           lambda: result_cache.stats()['bytes'])
+ingest_queue = IngestQueue(corpus, batch_size=int(os.environ.get('INGEST_BATCH_SIZE', 256)))  # Background indexer for bulk uploads
+
+# SEARCH_SHARDS=N serves tfidf, bm25, bim and boolean queries from N shard processes (0 keeps them in-process)
+SEARCH_SHARDS = int(os.environ.get('SEARCH_SHARDS', 0))
+# Seconds a query waits for the shards to apply its snapshot before falling back to the in-process models
+SHARD_SYNC_WAIT = float(os.environ.get('SHARD_SYNC_WAIT', 0.5))
+shards = None
+if SEARCH_SHARDS > 0:
+    _started = time.perf_counter()
+    shards = ShardedIndex(SEARCH_SHARDS)
+    shards.mirror(corpus)  # Every committed batch and deletion is mirrored to the shards
+    registry.register_callback('search_shard_rebuilds_total', 'counter', 'Shard restarts after a failed sync',
+                               lambda: shards.rebuilds)
+    _record_phase('start_shards', _started, shards=SEARCH_SHARDS, documents=len(shards))
+
+
+def sharded(search):
+    """
+    Run search(version) on the shards once they hold the snapshot of this request, None when they cannot answer
+
+    The shards apply a commit after it is published, so a request may
+    see a version they have not applied yet (or have failed to): its
+    results would miss documents, so the caller falls back instead.
+    """
+    if shards is None:
+        return None
+    version = corpus.version
+    if shards.wait_for(version, SHARD_SYNC_WAIT):
+        try:
+            return search(version)
+        except ShardsUnavailable:
+            pass
+    count('shard_fallbacks')
+    return None
+
+
+def cacheable(version: int):
+    """
+    Completeness check for result_cache: with shards, only results computed while they held version are stored
+    """
+    return lambda: shards is None or shards.holds(version)
+
+
+def tfidf_search(query: str, top_k: int):
+    hits = sharded(lambda version: shards.calculate_tf_idf(query, top_k=top_k, version=version))
+    return hits if hits is not None else ranker.calculate_tf_idf(query, top_k=top_k)
+
+
+def bm25_search(query: str, top_k: int):
+    hits = sharded(lambda version: shards.bm25(query, top_k=top_k, version=version))
+    return hits if hits is not None else ranker.bm25(query, top_k=top_k)
+
+
+def bim_search(query: str, top_k: int):
+    hits = sharded(lambda version: shards.binary_term_matching(query, top_k=top_k, version=version))
+    return hits if hits is not None else DocumentSearcher.binary_term_matching(index=corpus, query=query, top_k=top_k)
+
+
+def boolean_search(query: str):
+    doc_ids = sharded(lambda version: shards.process_query(query, version=version))
+    return doc_ids if doc_ids is not None else process_query(query, corpus)
+
+
+def debug_requested() -> bool:
+    return request.args.get('debug', '0') not in ('', '0', 'false') or request.headers.get('X-Debug-Timing') == '1'
+
+
+@app.before_request
+def pin_corpus_snapshot():
+    # Every read of this request sees one corpus version, even while uploads commit new segments
+    g.snapshot_token = corpus.pin()
+
+
+@app.teardown_request
+def unpin_corpus_snapshot(exc):
+    token = g.pop('snapshot_token', None)
+    if token is not None:
+        corpus.unpin(token)
+
+
+@app.before_request
+def start_request_trace():
+    if METRICS_ENABLED or debug_requested():
+        metrics.start_trace(request.endpoint or 'unknown')
+
+
+@app.after_request
+def record_request_trace(response):
+    trace = metrics.end_trace()
+    if trace is None:
+        return response
+    if METRICS_ENABLED:
+        registry.record(trace, response.status_code)
+    if debug_requested():
+        timing = trace.to_dict()
+        response.headers['Server-Timing'] = ', '.join(
+            f'{name};dur={ms:.3f}' for name, ms in timing['stages_ms'].items()
+        )
+        if response.is_json:
+            # Lists of hits are wrapped so the timing block can sit next to them
+            body = response.get_json()
+            if not isinstance(body, dict):
+                body = {'results': body}
+            body['debug'] = timing
+            response.set_data(json.dumps(body))
+    return response
+
+
+@app.teardown_request
+def clear_request_trace(exc):
+    metrics.end_trace()
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Request, stage and index metrics in the Prometheus text format
+    """
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.errorhandler(ValueError)
+def invalid_parameter(e):
+    return jsonify({"error": str(e)}), 400
+
+
+def warm_up():
+    """
+    Load the NLTK resources and precompute the synonym table before serving queries
+    """
+    for entry in resources.warm_up():
+        startup_report['phases'].append(dict(entry, phase=f"load_{entry.pop('resource')}"))
+    started = time.perf_counter()
+    try:
+        synonym_expander.warm_up(corpus.field(NOUN_FIELD).vocabulary())
+        _record_phase('synonym_table', started, status='loaded')
+    except LookupError:
+        # Without WordNet, synonyms fall back to on-demand lookups
+        _record_phase('synonym_table', started, status='missing')
+
+
+@app.route('/api/startup', methods=['GET'])
+def startup_status():
+    """
+    Resources found at startup and the time spent in each startup phase
+    """
+    return jsonify(startup_report), 200
+
 
 @app.route('/api/documents/upload', methods=['POST'])
 def upload_documents():
-    data = request.get_json()  # Get the JSON data from the request
-    uploaded_docs = []
+    """
+    Index a batch of {"filename", "content"} files.
+
+    With "replace": true, live documents with the same title as an uploaded
+    file are deleted in the same commit, so re-uploading a file updates it
+    instead of adding a duplicate.
+    """
+    data = request.get_json(silent=True)  # Get the JSON data from the request
     # Check if data was received
     if not data:
         return jsonify({"error": "No data received"}), 400
 
+    batch = []
     for item in data['files']:  # Adjust to access 'files' from the received payload
-        try:
-            filename = item.get('filename')
-            content = item.get('content')
-            if not filename or not content:
-                return jsonify({"error": "Missing filename or content in the uploaded data"}), 400
-
-            doc = {
-                "title": filename,
-                "content": content
-            }
-            documents.append(doc)
-            uploaded_docs.append(doc['title'])
-        except Exception as e:
-            return jsonify({"error": f"Error processing file {filename}: {str(e)}"}), 500
+        filename = item.get('filename')
+        content = item.get('content')
+        if not filename or not content:
+            return jsonify({"error": "Missing filename or content in the uploaded data"}), 400
+
+        batch.append({
+            "title": filename,
+            "content": content
+        })
+
+    replaced = []
+    if data.get('replace'):
+        replaced = sorted({doc_id for doc in batch for doc_id in title_index.find(doc['title'])})
+
+    try:
+        # Index the whole batch once it is known to be valid
+        corpus.add_documents(batch, replace=replaced)
+        uploaded_docs = [doc['title'] for doc in batch]
+    except Exception as e:
+        return jsonify({"error": f"Error indexing documents: {str(e)}"}), 500
 
     return jsonify({
         "message": f"Successfully uploaded {len(uploaded_docs)} documents",
-        "uploaded_documents": uploaded_docs
+        "uploaded_documents": uploaded_docs,
+        "replaced_documents": replaced
     }), 201
 
+@app.route('/api/documents/<int:doc_id>', methods=['PUT'])
+def update_document(doc_id):
+    """
+    Replace a document with {"content", "filename"} (the title is kept when filename is omitted).
+
+    The new version gets a new id, returned as "id"; the old one is deleted in the same commit.
+    """
+    data = request.get_json(silent=True) or {}
+    content = data.get('content')
+    if not content:
+        return jsonify({"error": "Missing content"}), 400
+    if not corpus.is_live(doc_id):
+        return jsonify({"error": "Document not found"}), 404
+
+    title = data.get('filename') or documents.title(doc_id)
+    try:
+        (new_id,) = corpus.add_documents([{'title': title, 'content': content}], replace=[doc_id])
+    except Exception as e:
+        return jsonify({"error": f"Error indexing documents: {str(e)}"}), 500
+    return jsonify({"id": new_id, "replaced": doc_id, "title": title}), 200
+
+@app.route('/api/documents/<int:doc_id>', methods=['DELETE'])
+def delete_document(doc_id):
+    """
+    Delete one document; its postings are dropped by the next merge of its segment
+    """
+    if not corpus.delete_documents([doc_id]):
+        return jsonify({"error": "Document not found"}), 404
+    return jsonify({"message": "Document deleted", "deleted": [doc_id]}), 200
+
+@app.route('/api/documents/delete', methods=['POST'])
+def delete_documents():
+    """
+    Delete many documents in one commit: {"ids": [...]}
+    """
+    data = request.get_json(silent=True) or {}
+    doc_ids = data.get('ids')
+    if not isinstance(doc_ids, list) or not all(isinstance(doc_id, int) for doc_id in doc_ids):
+        return jsonify({"error": "ids must be a list of document ids"}), 400
+    deleted = corpus.delete_documents(doc_ids)
+    not_found = sorted(set(doc_ids) - set(deleted))
+    return jsonify({"deleted": deleted, "not_found": not_found}), 200
+
+
+@app.route('/api/documents/ingest', methods=['POST'])
+def ingest_documents():
+    """
+    Stream newline-delimited JSON documents into the background indexer.
+
+    Each line is a {"filename", "content"} object. Lines are parsed as they
+    arrive (plain or chunked transfer encoding), invalid lines are rejected
+    individually, and valid documents are committed in batches while
+    searches keep running against the last committed index. Pass wait=1 to
+    return only once the whole job is indexed.
+    """
+    job = ingest_queue.create_job()
+    ingest_queue.ingest(job, parse_ndjson(request.stream))
+    if request.args.get('wait', '0') not in ('', '0', 'false'):
+        job.wait()
+    status = job.to_dict(include_documents=False)
+    status['status_url'] = f"/api/documents/ingest/{job.id}"
+    return jsonify(status), 202
+
+@app.route('/api/documents/ingest/<job_id>', methods=['GET'])
+def ingest_status(job_id):
+    """
+    Progress and per-document status of a bulk ingest job
+    """
+    job = ingest_queue.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Ingest job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    Result cache counters, for sizing the cache
+    """
+    return jsonify(result_cache.stats()), 200
 
 @app.route('/documents/list', methods=['GET'])
 def list_documents():
-    return jsonify(documents), 200
+    k, offset = get_page(request.args)
+    listing = [{'id': doc_id, 'title': documents.title(doc_id)} for doc_id in corpus.live_ids()[offset:offset + k].tolist()]
+    return jsonify(listing), 200
+
+@app.route('/api/documents/<int:doc_id>', methods=['GET'])
+def get_document(doc_id):
+    """
+    Fetch the full content of one document
+    """
+    if not corpus.is_live(doc_id):
+        return jsonify({"error": "Document not found"}), 404
+    doc = documents[doc_id]
+    return jsonify({'id': doc_id, 'title': doc['title'], 'content': doc['content']}), 200
 
 @app.route('/api/documents/search/title', methods=['POST'])
 def search_by_title():
-    query = request.args.get('query', '').lower()
-    results = [doc for doc in documents if query in doc['title'].lower()]
-    return jsonify(results), 200
+    """
+    Titles containing the query (mode 'substring'), starting with it ('prefix')
+    or with a word starting with it ('word'), in document order
+    """
+    data = request.get_json(silent=True) or {}
+    query = data.get('query', '')
+    k, offset = get_page(data)
+    matches = title_index.search(query, mode=data.get('mode', 'substring'), k=k, offset=offset)
+    return jsonify(format_hits(corpus, [(doc_id, None) for doc_id in matches])), 200
+
+@app.route('/api/documents/autocomplete', methods=['GET'])
+def autocomplete_titles():
+    """
+    Ranked title suggestions for the search box: ?q=<typed text>&limit=<n>
+    """
+    prefix = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', 10)), MAX_K)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    suggestions = title_index.autocomplete(prefix, limit=limit)
+    return jsonify([{'id': doc_id, 'title': title} for doc_id, title in suggestions]), 200
 
 @app.route('/api/documents/search/content', methods=['POST'])
 def search_by_content():
-    query = request.json.get('query', '').lower()
-
-    def get_synonyms(word):
-        synonyms = set()
-        for syn in wordnet.synsets(word):
-            for lemma in syn.lemmas():
-                synonyms.add(lemma.name().lower())
-        return list(synonyms)
-
-    def expand_query_with_synonyms(query_tokens):
-        expanded_query = set(query_tokens)
-        for word in query_tokens:
-            expanded_query.update(get_synonyms(word))
-        return list(expanded_query)
-
-    def extract_nouns_and_entities(content):
-        words = word_tokenize(content.lower())
-        pos_tags = pos_tag(words)
-        nouns = [word for word, pos in pos_tags if pos in ('NN', 'NNS', 'NNP', 'NNPS')]
-        lemmatizer = WordNetLemmatizer()
-        lemmatized_nouns = [lemmatizer.lemmatize(noun) for noun in nouns]
-        return lemmatized_nouns
-
-    def calculate_tf(doc_words):
-        tf = {}
-        total_words = len(doc_words)
-        word_counts = Counter(doc_words)
-        for word, count in word_counts.items():
-            tf[word] = count / total_words
-        return tf
-
-    def calculate_idf(documents):
-        idf = {}
-        total_docs = len(documents)
-        word_doc_counts = defaultdict(int)
-        for doc_words in documents:
-            unique_words = set(doc_words)
-            for word in unique_words:
-                word_doc_counts[word] += 1
-        for word, doc_count in word_doc_counts.items():
-            idf[word] = math.log(total_docs / (1 + doc_count))
-        return idf
-
-    def calculate_tfidf(doc_words, tf, idf):
-        tfidf = {}
-        for word in doc_words:
-            if word in idf:
-                tfidf[word] = tf[word] * idf[word]
-        return tfidf
-
-    query_tokens = word_tokenize(query)
-    expanded_query = expand_query_with_synonyms(query_tokens)
-
-    matching_docs = []
-    for doc in documents:
-        doc_words = extract_nouns_and_entities(doc['content'])
-        tf = calculate_tf(doc_words)
-        idf = calculate_idf([doc_words])
-        tfidf = calculate_tfidf(doc_words, tf, idf)
-
-        if any(word in tfidf for word in expanded_query):
-            matching_docs.append(doc)
-
-    return jsonify(matching_docs), 200
+    data = request.get_json(silent=True) or {}
+    query = data.get('query', '').lower()
+    k, offset = get_page(data)
+
+    with stage('analyze'):
+        query_tokens = word_tokenize(query)
+        field = corpus.field(NOUN_FIELD)
+        expanded_query = synonym_expander.expand(query_tokens, field)
+
+    # Noun lemmas were extracted at upload time; score matches with corpus-wide TF-IDF
+    total_docs = corpus.num_live
+    doc_lengths = field.doc_lengths
+    scores = defaultdict(float)
+    with stage('score'):
+        for word in expanded_query:
+            postings = field.get_postings(word)
+            count('postings_touched', len(postings))
+            if not postings:
+                continue
+            idf = math.log(total_docs / len(postings))
+            if idf <= 0:
+                # In every live document: no evidence, and no zero-score hits
+                continue
+            for doc_id, tf in postings.items():
+                scores[doc_id] += tf / doc_lengths[doc_id] * idf
+    count('documents_scored', len(scores))
+
+    with stage('top_k'):
+        hits = select_top(scores.items(), k, offset)
+    return jsonify(format_hits(corpus, hits, ' '.join(expanded_query))), 200
 
 
 @app.route('/api/bim', methods=['POST'])
@@ -128,10 +435,11 @@ def search_documents():
     """
     Handle document search
     """
+    # Get request data
+    data = request.get_json(silent=True) or {}
+    k, offset = get_page(data)
     
     try:
-        # Get request data
-        data = request.get_json()
         query = data.get('query', '')
         
         if not query:
@@ -139,11 +447,14 @@ def search_documents():
         
         if not documents:
             return jsonify({"error": "No documents uploaded"}), 400
-        print(documents)
-        # Perform binary term matching search
-        results = DocumentSearcher.binary_term_matching(documents=documents, query=query)
         
-        return jsonify(results), 200
+        # Perform binary term matching search
+        def search():
+            hits = bim_search(query, top_k=offset + k)[offset:]
+            return format_hits(corpus, hits, query)
+
+        return jsonify(result_cache.get_or_compute('bim', query, (k, offset), corpus.version, search,
+                                                   cacheable(corpus.version))), 200
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -153,23 +464,27 @@ def non_overlapping_search():
     """
     Handle non-overlapping lists search
     """
-    global documents
+    # Get request data
+    data = request.get_json(silent=True) or {}
+    k, offset = get_page(data)
     
     try:
-        # Get request data
-        data = request.get_json()
         terms = data.get('query', '')
+        match = data.get('match', 'substring')
         
         if not terms:
             return jsonify({"error": "No search terms provided"}), 400
         
+        if match not in ('substring', 'token'):
+            return jsonify({"error": "match must be 'substring' or 'token'"}), 400
+        
         if not documents:
             return jsonify({"error": "No documents uploaded"}), 400
         
         # Perform non-overlapping lists search
-        results = DocumentSearcher.non_overlapping_lists_search(documents=documents, terms=terms.split(' '))
+        doc_ids = DocumentSearcher.non_overlapping_lists_search(index=corpus, terms=terms.split(' '), match=match)
         
-        return jsonify(results), 200
+        return jsonify(format_hits(corpus, select_page(doc_ids, k, offset), terms)), 200
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -179,22 +494,22 @@ def proximal_node_search():
     """
     Handle proximal node search
     """
-    global uploaded_files
+    # Get request data
+    data = request.get_json(silent=True) or {}
+    k, offset = get_page(data)
     
     try:
-        # Get request data
-        data = request.get_json()
         entities = data.get('entities', [])
-        window_size = data.get('window_size', 50)
+        window_size = int(data.get('window_size', 10))
         
         if not entities:
             return jsonify({"error": "No entities provided"}), 400
         
-        if not uploaded_files:
+        if not documents:
             return jsonify({"error": "No documents uploaded"}), 400
         
-        # Perform proximal node search
-        results = DocumentSearcher.proximal_node_search(uploaded_files, entities, window_size)
+        # Perform proximal node search; each match carries its own context snippet
+        results = DocumentSearcher.proximal_node_search(corpus, entities, window_size, offset + k)[offset:]
         
         return jsonify(results), 200
     
@@ -206,30 +521,17 @@ def keyword_matching():
     """
     Endpoint for keyword matching search
     """
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     query = data.get('query')
-    print(query)
+    k, offset = get_page(data)
     
     if not query:
         return jsonify({"error": "No search query provided"}), 400
     
     try:
-        print("Document Ranker Enter")
-        # Initialize DocumentRanker
-        ranker = DocumentRanker(documents=documents)
-        print("Keyword Matching Start")
         # Perform keyword matching
-        rankings = ranker.keyword_matching(query)
-        print()
-        # Prepare response
-        results = [
-            {
-                'title': doc['title'], 
-                'content': doc['content']
-            } for doc, _ in rankings
-        ]
-        print("Result")
-        return jsonify(results)
+        hits = ranker.keyword_matching(query, top_k=offset + k)[offset:]
+        return jsonify(format_hits(corpus, hits, query))
     
     except Exception as e:
         return jsonify({"error": f"Search failed: {str(e)}"}), 500
@@ -239,28 +541,41 @@ def tf_idf_ranking():
     """
     Endpoint for TF-IDF ranking search
     """
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     query = data.get('query')
+    k, offset = get_page(data)
     
     if not query:
         return jsonify({"error": "No search query provided"}), 400
     
     try:
-        # Initialize DocumentRanker
-        ranker = DocumentRanker(documents=documents)
-        
-        # Perform TF-IDF ranking
-        rankings = ranker.calculate_tf_idf(query)
-        
-        # Prepare response
-        results = [
-            {
-                'title': doc['title'], 
-                'content': doc['content']
-            } for doc in documents if doc['title'] in rankings
-        ]
-        
-        return jsonify(results)
+        # Perform TF-IDF ranking with top-k pruning
+        def search():
+            hits = tfidf_search(query, top_k=offset + k)[offset:]
+            return format_hits(corpus, hits, query)
+
+        return jsonify(result_cache.get_or_compute('tfidf', query, (k, offset), corpus.version, search,
+                                                   cacheable(corpus.version)))
+    
+    except Exception as e:
+        return jsonify({"error": f"Search failed: {str(e)}"}), 500
+
+@app.route('/api/search/bm25', methods=['POST'])
+def bm25_ranking():
+    """
+    Endpoint for Okapi BM25 ranking search
+    """
+    data = request.get_json(silent=True) or {}
+    query = data.get('query')
+    k, offset = get_page(data)
+    
+    if not query:
+        return jsonify({"error": "No search query provided"}), 400
+    
+    try:
+        # Perform BM25 ranking with top-k pruning
+        hits = bm25_search(query, top_k=offset + k)[offset:]
+        return jsonify(format_hits(corpus, hits, query))
     
     except Exception as e:
         return jsonify({"error": f"Search failed: {str(e)}"}), 500
@@ -269,61 +584,105 @@ def tf_idf_ranking():
 def search_interference():
     """
     Endpoint to perform interference model search.
+
+    Ranks by the query node of the inference network: term beliefs
+    combined with 'operator' (default 'sum').
     """
     if not documents:
         return jsonify({"error": "No documents available"}), 400
 
-    query = request.json.get('query')
+    data = request.get_json(silent=True) or {}
+    query = data.get('query')
     if not query:
         return jsonify({"error": "No query provided"}), 400
+    k, offset = get_page(data)
+    operator = data.get('operator', 'sum')
 
-    # Initialize IR model
-    ir_model = InformationRetrievalModels([(doc['title'], doc['content']) for doc in documents])
-    ir_model.create_relevance_judgments([query])
-
-    results = ir_model.interference_model(query)
-    response = [{"title": documents[idx]['title'], "content": documents[idx]['content'], "score": score} for idx, score in results if score > 0]
-
-    return jsonify(response), 200
+    hits = ir_models.interference_model(query, top_k=offset + k, operator=operator)[offset:]
+    return jsonify(format_hits(corpus, hits, query)), 200
 
 @app.route('/api/search/belief', methods=['POST'])
 def search_belief():
     """
     Endpoint to perform belief network search.
+
+    Ranks by the query node ('operator', default 'wsum': terms weighted by
+    query frequency times idf) and'ed with a document length prior.
     """
     if not documents:
         return jsonify({"error": "No documents available"}), 400
     
-    query = request.json.get('query')
+    data = request.get_json(silent=True) or {}
+    query = data.get('query')
     if not query:
         return jsonify({"error": "No query provided"}), 400
+    k, offset = get_page(data)
+    operator = data.get('operator', 'wsum')
     
-    # Initialize IR model
-    ir_model = InformationRetrievalModels([(doc['title'], doc['content']) for doc in documents])
-    ir_model.create_relevance_judgments([query])
-    
-    results = ir_model.belief_network(query)
-    response = [{"title": documents[idx]['title'], "content": documents[idx]['content'], "score": score} for idx, score in results if score > 0]
-    
-    return jsonify(response), 200
+    hits = ir_models.belief_network(query, top_k=offset + k, operator=operator)[offset:]
+    return jsonify(format_hits(corpus, hits, query)), 200
+
+@app.route('/api/search/batch', methods=['POST'])
+def batch_search():
+    """
+    Endpoint to run many queries with one model in a single request.
+
+    Body: {"queries": [...], "model": "bm25", "k": 10, "offset": 0, "snippets": false}.
+    Hits carry id, title and score; snippets are only built when asked for.
+    """
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    model = data.get('model', 'bm25')
+    k, offset = get_page(data)
+
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return jsonify({"error": "queries must be a list of strings"}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}), 400
+
+    ranked = batch_searcher.search(queries, model, top_k=offset + k)
+    results = []
+    with stage('serialize'):
+        for query, hits in zip(queries, ranked):
+            hits = hits[offset:]
+            if data.get('snippets'):
+                formatted = format_hits(corpus, hits, query)
+            else:
+                formatted = [{'id': doc_id, 'title': documents.title(doc_id), 'score': score} for doc_id, score in hits]
+            results.append({'query': query, 'hits': formatted})
+    return jsonify({'model': model, 'results': results}), 200
 
 @app.route('/api/search/boolean', methods=['POST'])
 def process_query_endpoint():
+    data = request.get_json(silent=True) or {}
+    k, offset = get_page(data)
     try:
-        data = request.get_json()
         query = data.get('query', '')
         
         if not query:
             return jsonify({"error": "Query is required"}), 400
         
-        processed_docs = [preprocess_document(doc['content']) for doc in documents]
-        # Process the query and retrieve matching document indices
-        result_set = process_query(query, processed_docs)
-        matching_docs = [{'title': documents[idx]['title'], 'content': documents[idx]['content']} for idx in result_set]
-        
-        return jsonify(matching_docs), 200
+        # Process the query against the shared index and retrieve matching document indices
+        def search():
+            result_ids = boolean_search(query)
+            # Highlight the words documents match on, not operators or pattern syntax
+            highlight = ' '.join(positive_terms(query, corpus.field(BOOLEAN_FIELD)))
+            return format_hits(corpus, select_page(result_ids, k, offset), highlight)
+
+        return jsonify(result_cache.get_or_compute('boolean', query, (k, offset), corpus.version, search,
+                                                   cacheable(corpus.version))), 200
+    except QuerySyntaxError as e:
+        return jsonify({"error": f"Invalid query: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
+    missing = [name for name, path in startup_report['resources'].items() if path is None]
+    if missing:
+        app.logger.warning("Missing NLTK data: %s (install with `python resources.py download`)", ', '.join(missing))
+    # WARMUP=0 defers every resource to the first request that needs it
+    if os.environ.get('WARMUP', os.environ.get('SYNONYM_WARMUP', '1')) == '1':
+        warm_up()
+    for phase in startup_report['phases']:
+        app.logger.warning("startup %-20s %8.1f ms", phase['phase'], phase['seconds'] * 1000)
     app.run(debug=True)
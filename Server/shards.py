@@ -0,0 +1,396 @@
+"""
+Scatter-gather search over a corpus hash-partitioned across worker processes.
+
+Each shard is a process owning a CorpusIndex of its documents (the fields
+used by TF-IDF/BM25, BIM and Boolean search) and the global id of every
+local document. The coordinator fans a query out to all shards and
+merges their top-k lists by (score, global doc id).
+
+TF-IDF and BM25 take two round trips under one lock: the shards first
+report their document count, total keyword length and the document
+frequencies of the query keywords, then score with the summed
+statistics, so IDF and average document length are those of the whole
+corpus and scores match an unsharded DocumentRanker.
+
+A coordinator following a CorpusIndex (mirror) records the corpus
+version the shards hold. Queries may name the version they are pinned
+to and raise ShardsUnavailable unless the shards hold exactly that
+version, so callers fall back to the unsharded models rather than
+serve results missing documents.
+"""
+import heapq
+import itertools
+import multiprocessing
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from bim import DocumentSearcher, TextProcessor
+from boolean import FIELD as BOOLEAN_FIELD, process_query, tokenize_document
+from index import CorpusIndex
+from metrics import stage
+from ranker import CollectionStatistics, DocumentRanker
+
+SHARD_ANALYZERS = {
+    DocumentRanker.FIELD: DocumentRanker.preprocess_text,
+    DocumentSearcher.FIELD: TextProcessor.tokenize,
+    BOOLEAN_FIELD: tokenize_document,
+}
+
+Hit = Tuple[int, float]
+
+
+class ShardsUnavailable(RuntimeError):
+    """Raised when the shards do not hold the corpus version a query is pinned to, or have failed."""
+
+
+def shard_of(doc_id: int, num_shards: int) -> int:
+    """
+    Shard owning a global document id (Fibonacci hashing, so runs of consecutive ids spread evenly)
+    """
+    return ((doc_id * 0x9E3779B1) & 0xFFFFFFFF) * num_shards >> 32
+
+
+class Shard:
+    """One partition of the corpus; lives in its worker process."""
+
+    def __init__(self):
+        self.corpus = CorpusIndex(SHARD_ANALYZERS, positional=[DocumentSearcher.FIELD])
+        self.ranker = DocumentRanker(self.corpus)
+        # Global id of every local document, ascending
+        self.global_ids = np.zeros(0, dtype=np.int64)
+
+    def add(self, docs: List[dict], doc_ids: List[int]) -> int:
+        if docs:
+            self.corpus.add_documents(docs)
+            self.global_ids = np.concatenate([self.global_ids, np.asarray(doc_ids, dtype=np.int64)])
+        return len(docs)
+
+    def delete(self, doc_ids: List[int]) -> int:
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        local_ids = np.searchsorted(self.global_ids, doc_ids)
+        owned = local_ids < len(self.global_ids)
+        owned[owned] = self.global_ids[local_ids[owned]] == doc_ids[owned]
+        return len(self.corpus.delete_documents(local_ids[owned].tolist()))
+
+    def stats(self, keywords: List[str]) -> Tuple[int, int, int, dict]:
+        field = self.corpus.field(DocumentRanker.FIELD)
+        return self.corpus.version, field.num_docs, field.total_length, {word: field.df(word) for word in keywords}
+
+    def rank(self, query: str, model: str, top_k: Optional[int], collection: CollectionStatistics) -> List[Hit]:
+        self.ranker.collection = collection
+        try:
+            if model == 'tfidf':
+                hits = self.ranker.calculate_tf_idf(query, top_k=top_k)
+            else:
+                hits = self.ranker.bm25(query, top_k=top_k)
+        finally:
+            self.ranker.collection = None
+        return self._globalize(hits)
+
+    def bim(self, query: str, top_k: int) -> List[Hit]:
+        return self._globalize(DocumentSearcher.binary_term_matching(self.corpus, query, top_k=top_k))
+
+    def boolean(self, query: str) -> List[int]:
+        return self.global_ids[np.asarray(process_query(query, self.corpus), dtype=np.int64)].tolist()
+
+    def _globalize(self, hits: List[Hit]) -> List[Hit]:
+        global_ids = self.global_ids
+        return [(int(global_ids[doc_id]), score) for doc_id, score in hits]
+
+
+def _serve(connection):
+    """
+    Worker loop: apply (method, args) calls to the shard and reply ('ok', result) or ('error', exception)
+    """
+    shard = Shard()
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        method, args = message
+        try:
+            reply = ('ok', getattr(shard, method)(*args))
+        except Exception as e:
+            reply = ('error', e)
+        connection.send(reply)
+
+
+class ShardedIndex:
+    """
+    Coordinator of the shard processes.
+
+    Every call reaches all shards: requests are sent to each shard before
+    any reply is read, so the shards work in parallel. One lock serializes
+    scatters, as each shard answers its pipe in order.
+
+    A change that fails part-way may leave the shards holding part of it:
+    they are then marked failed, refuse version-checked queries, and are
+    restarted and refilled from the corpus at the next sync.
+    """
+
+    def __init__(self, num_shards: int):
+        """
+        :param num_shards: Number of worker processes, each owning one partition
+        """
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        self.num_shards = num_shards
+        self._lock = threading.RLock()
+        self._synced = threading.Condition(self._lock)
+        self._corpus = None
+        self.rebuilds = 0
+        self._start()
+
+    def _start(self):
+        """
+        Start empty shard processes
+        """
+        self.num_docs = 0
+        # Corpus version the shards hold (see mirror), -1 before the first sync
+        self.version = -1
+        # Whether each document added to the shards is still live there, by global id
+        self._live = np.zeros(0, dtype=bool)
+        self.failed: Optional[str] = None
+        self._connections = []
+        self._processes = []
+        context = multiprocessing.get_context()
+        for shard_id in range(self.num_shards):
+            parent, child = context.Pipe()
+            process = context.Process(target=_serve, args=(child,), name=f'shard-{shard_id}', daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def _scatter(self, calls: List[Tuple[str, tuple]]) -> List[Any]:
+        """
+        Send one (method, args) call to each shard and collect the results in shard order
+        """
+        with self._lock:
+            try:
+                for connection, call in zip(self._connections, calls):
+                    connection.send(call)
+                replies = [connection.recv() for connection in self._connections]
+            except (EOFError, OSError) as e:
+                # A shard died: the pipes are out of step with the calls
+                self.failed = f"Shard process lost: {e!r}"
+                raise ShardsUnavailable(self.failed) from e
+        for status, value in replies:
+            if status == 'error':
+                raise value
+        return [value for _, value in replies]
+
+    def _check(self, version: Optional[int]):
+        """
+        Raise ShardsUnavailable unless the shards can answer a query pinned to version (None: any state)
+        """
+        if version is None:
+            return
+        if self.failed is not None:
+            raise ShardsUnavailable(f"Shards failed: {self.failed}")
+        if self.version != version:
+            raise ShardsUnavailable(f"Shards hold corpus version {self.version}, query is pinned to {version}")
+
+    def _broadcast(self, method: str, *args) -> List[Any]:
+        return self._scatter([(method, args)] * self.num_shards)
+
+    def add_documents(self, docs: Iterable[dict], doc_ids: Iterable[int] = None) -> List[int]:
+        """
+        Partition documents across the shards
+
+        :param docs: Dictionaries with 'title' and 'content' keys
+        :param doc_ids: Global ids, ascending and above every id added before; next free ids by default
+        :return: Global ids of the documents
+        """
+        docs = list(docs)
+        with self._lock:
+            doc_ids = list(doc_ids) if doc_ids is not None else list(range(self.num_docs, self.num_docs + len(docs)))
+            if doc_ids and doc_ids[0] < self.num_docs:
+                raise ValueError(f"Document id {doc_ids[0]} is already taken")
+            parts = [([], []) for _ in range(self.num_shards)]
+            for doc, doc_id in zip(docs, doc_ids):
+                shard_docs, shard_ids = parts[shard_of(doc_id, self.num_shards)]
+                shard_docs.append({'title': doc['title'], 'content': doc['content']})
+                shard_ids.append(doc_id)
+            self._scatter([('add', part) for part in parts])
+            if doc_ids:
+                self.num_docs = doc_ids[-1] + 1
+                live = np.zeros(self.num_docs, dtype=bool)
+                live[:len(self._live)] = self._live
+                live[doc_ids] = True
+                self._live = live
+        return doc_ids
+
+    def add_segment(self, segment):
+        """
+        Mirror a segment committed to a CorpusIndex, keeping its document ids (a corpus listener)
+        """
+        docs = [segment.document(local_id) for local_id in range(segment.num_docs)]
+        self.add_documents(docs, range(segment.base, segment.base + segment.num_docs))
+
+    def delete_documents(self, doc_ids: Iterable[int]) -> int:
+        """
+        Delete documents by global id from the shards owning them (also a corpus delete listener)
+
+        :return: Number of documents that were live and are now deleted
+        """
+        parts = [[] for _ in range(self.num_shards)]
+        for doc_id in doc_ids:
+            parts[shard_of(doc_id, self.num_shards)].append(doc_id)
+        with self._lock:
+            deleted = sum(self._scatter([('delete', (sorted(part),)) for part in parts]))
+            for part in parts:
+                self._live[[doc_id for doc_id in part if doc_id < len(self._live)]] = False
+        return deleted
+
+    def mirror(self, corpus):
+        """
+        Follow a CorpusIndex: copy its documents now and sync after every commit (as a listener)
+        """
+        self._corpus = corpus
+        self.sync()
+        corpus.add_listener(lambda segment: self.sync())
+        corpus.add_delete_listener(lambda doc_ids: self.sync())
+
+    def sync(self):
+        """
+        Bring the shards to the latest snapshot of the mirrored corpus
+
+        Adds the documents committed and deletes those deleted since the
+        last sync. Failed shards are restarted and refilled first; a sync
+        that fails marks them failed and re-raises.
+        """
+        with self._lock:
+            snapshot = self._corpus.latest()
+            if self.failed is not None:
+                self.close()
+                self._start()
+                self.rebuilds += 1
+            if snapshot.version <= self.version:
+                return
+            try:
+                for segment in snapshot.segments:
+                    end = segment.base + segment.num_docs
+                    if end > self.num_docs:
+                        # A merge may have joined segments the shards only partly hold
+                        start = max(self.num_docs, segment.base)
+                        docs = [segment.document(doc_id - segment.base) for doc_id in range(start, end)]
+                        self.add_documents(docs, range(start, end))
+                deleted = np.flatnonzero(self._live & ~snapshot.live_mask()[:len(self._live)])
+                if len(deleted):
+                    self.delete_documents(deleted.tolist())
+            except Exception as e:
+                self.failed = str(e)
+                self._synced.notify_all()
+                raise
+            self.version = snapshot.version
+            self._synced.notify_all()
+
+    def holds(self, version: int) -> bool:
+        """
+        Whether every shard has applied exactly this corpus version and none has failed since
+        """
+        with self._lock:
+            return self.failed is None and self.version == version
+
+    def wait_for(self, version: int, timeout: float) -> bool:
+        """
+        Wait up to timeout seconds for the shards to hold a corpus version, returning whether they do
+        """
+        with self._lock:
+            self._synced.wait_for(lambda: self.failed is not None or self.version >= version, timeout)
+            return self.holds(version)
+
+    @staticmethod
+    def _merge(shard_hits: List[List[Hit]], top_k: Optional[int]) -> List[Hit]:
+        """
+        Merge per-shard rankings, highest score first and ties in global document order
+        """
+        with stage('top_k'):
+            hits = heapq.merge(*shard_hits, key=lambda hit: (-hit[1], hit[0]))
+            return list(itertools.islice(hits, top_k)) if top_k is not None else list(hits)
+
+    def _rank(self, query: str, model: str, top_k: Optional[int], version: Optional[int]) -> List[Hit]:
+        if top_k is not None and top_k <= 0:
+            return []
+        with stage('analyze'):
+            keywords = sorted(set(DocumentRanker.preprocess_text(query)))
+        # Statistics and scoring under one lock, so no batch lands in between
+        with self._lock:
+            self._check(version)
+            with stage('index_lookup'):
+                versions, counts, lengths, dfs = zip(*self._broadcast('stats', keywords))
+            num_docs = sum(counts)
+            collection = CollectionStatistics(
+                key=versions,
+                num_docs=num_docs,
+                avg_doc_length=sum(lengths) / num_docs if num_docs else 0.0,
+                df={word: sum(df[word] for df in dfs) for word in keywords},
+            )
+            with stage('score'):
+                shard_hits = self._broadcast('rank', query, model, top_k, collection)
+        return self._merge(shard_hits, top_k)
+
+    def calculate_tf_idf(self, query: str, top_k: int = None, version: int = None) -> List[Hit]:
+        """
+        TF-IDF ranking with corpus-wide IDF, as DocumentRanker.calculate_tf_idf
+
+        :param version: Corpus version the query is pinned to; raises ShardsUnavailable when the shards differ
+        """
+        return self._rank(query, 'tfidf', top_k, version)
+
+    def bm25(self, query: str, top_k: int = 10, version: int = None) -> List[Hit]:
+        """
+        Okapi BM25 ranking with corpus-wide IDF and average length, as DocumentRanker.bm25
+        """
+        return self._rank(query, 'bm25', top_k, version)
+
+    def binary_term_matching(self, query: str, top_k: int = 10, version: int = None) -> List[Hit]:
+        """
+        Jaccard similarity search, as DocumentSearcher.binary_term_matching
+        """
+        if top_k <= 0:
+            return []
+        with self._lock:
+            self._check(version)
+            with stage('score'):
+                shard_hits = self._broadcast('bim', query, top_k)
+        return self._merge(shard_hits, top_k)
+
+    def process_query(self, query: str, version: int = None) -> List[int]:
+        """
+        Boolean query, as boolean.process_query; raises QuerySyntaxError for malformed queries
+
+        Prefix and wildcard terms are expanded by every shard over its own
+        term dictionary, so the expansion cap applies per shard.
+        """
+        with self._lock:
+            self._check(version)
+            with stage('index_lookup'):
+                shard_ids = self._broadcast('boolean', query)
+        return list(heapq.merge(*shard_ids))
+
+    def close(self):
+        """
+        Stop the shard processes
+        """
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+                connection.close()
+            for process in self._processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            self._connections, self._processes = [], []
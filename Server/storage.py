@@ -0,0 +1,107 @@
+import json
+import mmap
+import os
+from typing import Optional
+
+MANIFEST = 'manifest.json'
+INDEX_SUFFIX = '.seg'
+DOCS_SUFFIX = '.docs'
+
+
+def _fsync_directory(path: str):
+    """
+    Persist a rename on filesystems that need the directory entry flushed
+    """
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, data: bytes):
+    """
+    Write a file so readers see either the old content or the complete new one.
+
+    The data goes to a temporary file in the same directory, is fsynced and
+    then renamed over the target.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(path) or '.')
+
+
+def open_mmap(path: str) -> mmap.mmap:
+    """
+    Map a file read-only into memory
+    """
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class IndexDirectory:
+    """
+    On-disk layout of a persistent corpus index.
+
+    Every committed batch is an immutable pair of files, <name>.seg (term
+    dictionary, postings, document lengths) and <name>.docs (document store).
+    manifest.json lists the committed segments with the ids of their
+    deleted documents, and is replaced atomically
+    after the segment files are durable, so a crash mid-upload leaves at
+    most unreferenced files behind, which are removed on the next open.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def read_manifest(self) -> Optional[dict]:
+        manifest_path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_manifest(self, manifest: dict):
+        atomic_write(os.path.join(self.path, MANIFEST), json.dumps(manifest, indent=2).encode('utf-8'))
+
+    def write_segment(self, name: str, index_buffer: bytes, docs_buffer: bytes):
+        atomic_write(os.path.join(self.path, name + INDEX_SUFFIX), index_buffer)
+        atomic_write(os.path.join(self.path, name + DOCS_SUFFIX), docs_buffer)
+
+    def open_segment(self, name: str):
+        """
+        Memory-map a committed segment, returning (index buffer, document store buffer)
+        """
+        return (
+            open_mmap(os.path.join(self.path, name + INDEX_SUFFIX)),
+            open_mmap(os.path.join(self.path, name + DOCS_SUFFIX)),
+        )
+
+    def remove_segments(self, names):
+        """
+        Delete the files of segments a merge replaced, leaving any that are still in use to the next open
+        """
+        for name in names:
+            for suffix in (INDEX_SUFFIX, DOCS_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.path, name + suffix))
+                except OSError:
+                    # Windows refuses to delete memory-mapped files; remove_unreferenced retries on open
+                    pass
+
+    def remove_unreferenced(self, names):
+        """
+        Delete segment and temporary files that the manifest does not reference
+        """
+        keep = set(names)
+        for filename in os.listdir(self.path):
+            stem, ext = os.path.splitext(filename)
+            if ext == '.tmp' or (ext in (INDEX_SUFFIX, DOCS_SUFFIX) and stem not in keep):
+                os.remove(os.path.join(self.path, filename))
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import AbstractSet, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from nltk.corpus import wordnet
+
+
+def wordnet_synonyms(word: str) -> Set[str]:
+    """
+    All lemma names sharing a WordNet synset with word (the word itself included).
+    """
+    synonyms = set()
+    for syn in wordnet.synsets(word):
+        for lemma in syn.lemmas():
+            synonyms.add(lemma.name().lower())
+    return synonyms
+
+
+def base_forms(word: str) -> Set[str]:
+    """
+    The word and its WordNet base forms ("dogs" -> {"dogs", "dog"}), as wordnet.synsets resolves them.
+    """
+    forms = {word}
+    for pos in (wordnet.NOUN, wordnet.VERB, wordnet.ADJ, wordnet.ADV):
+        form = wordnet.morphy(word, pos)
+        if form is not None:
+            forms.add(form)
+    return forms
+
+
+class SynonymExpander:
+    """
+    WordNet query expansion restricted to an index vocabulary.
+
+    Two lookup paths:
+
+    * Before warm_up, synonyms are fetched from WordNet on demand and kept
+      in a bounded LRU cache whose entries expire after ttl seconds. Request
+      threads share it, so it is only touched under a lock.
+    * After warm_up, a table mapping every WordNet lemma name to the
+      indexed terms it shares a synset with is precomputed, and kept current
+      through add_vocabulary at ingest. Expansion is then a dict lookup
+      of the query word's base forms, so inflected words ("dogs") expand
+      like their lemma as they do through WordNet.
+
+    Table entries are frozensets replaced on write, never mutated, so
+    expansions can iterate them while add_vocabulary runs.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 3600.0):
+        """
+        :param max_entries: Capacity of the on-demand LRU cache
+        :param ttl: Seconds before an on-demand cache entry is looked up again
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, Tuple[float, FrozenSet[str]]]" = OrderedDict()
+        self._table: Optional[Dict[str, FrozenSet[str]]] = None
+        self._vocabulary: Set[str] = set()
+        self._write_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def warmed_up(self) -> bool:
+        return self._table is not None
+
+    def warm_up(self, vocabulary: Iterable[str] = ()):
+        """
+        Load WordNet now and precompute the synonym table for the given vocabulary
+        """
+        wordnet.get_version()  # Forces the lazy corpus loader
+        with self._write_lock:
+            self._table = {}
+            self._vocabulary = set()
+        self.add_vocabulary(vocabulary)
+
+    def add_vocabulary(self, terms: Iterable[str]):
+        """
+        Register newly indexed terms in the precomputed table (no-op before warm_up)
+        """
+        with self._write_lock:
+            table = self._table
+            if table is None:
+                return
+            additions: Dict[str, Set[str]] = {}
+            for term in terms:
+                if term in self._vocabulary:
+                    continue
+                self._vocabulary.add(term)
+                for synonym in wordnet_synonyms(term) | {term}:
+                    additions.setdefault(synonym, set()).add(term)
+            # Copy on write: readers keep iterating the sets they already hold
+            for synonym, added in additions.items():
+                table[synonym] = table.get(synonym, frozenset()).union(added)
+
+    def synonyms(self, word: str) -> AbstractSet[str]:
+        """
+        Synonyms of a word; from the precomputed table once warmed up, otherwise from the LRU cache
+        """
+        table = self._table
+        if table is not None:
+            forms = base_forms(word)
+            if len(forms) == 1:
+                return table.get(word, frozenset())
+            return frozenset().union(*(table.get(form, frozenset()) for form in forms))
+
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._cache.get(word)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.hits += 1
+                self._cache.move_to_end(word)
+                return entry[1]
+            self.misses += 1
+
+        # WordNet is read outside the lock; concurrent misses of one word store equal sets
+        synonyms = frozenset(wordnet_synonyms(word))
+        with self._cache_lock:
+            self._cache[word] = (now, synonyms)
+            self._cache.move_to_end(word)
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return synonyms
+
+    def expand(self, query_tokens: Iterable[str], field) -> List[str]:
+        """
+        Expand query tokens with their synonyms, keeping only terms present in the field's index
+
+        :param query_tokens: Tokens of the query
+        :param field: FieldIndex whose term dictionary bounds the expansion
+        :return: Sorted list of indexed terms to look up
+        """
+        expanded = set()
+        for word in query_tokens:
+            expanded.add(word)
+            expanded.update(self.synonyms(word))
+        return sorted(term for term in expanded if field.has_term(term))
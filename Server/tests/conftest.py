@@ -0,0 +1,86 @@
+import os
+import random
+import sys
+from collections import Counter
+from typing import Dict, List
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bim import DocumentSearcher, TextProcessor  # noqa: E402
+from boolean import FIELD as BOOLEAN_FIELD, tokenize_document  # noqa: E402
+from index import CorpusIndex  # noqa: E402
+from ranker import DocumentRanker  # noqa: E402
+
+
+# Analyzers that need no NLTK data: the ranker's field is split on whitespace
+ANALYZERS = {
+    DocumentRanker.FIELD: tokenize_document,
+    DocumentSearcher.FIELD: TextProcessor.tokenize,
+    BOOLEAN_FIELD: tokenize_document,
+}
+POSITIONAL = [DocumentSearcher.FIELD]
+
+VOCABULARY = [consonant + vowel + ending for consonant in 'bdfk' for vowel in 'aeiou' for ending in ('', 'x', 'ta')]
+
+
+def random_documents(rng: random.Random, count: int, max_length: int = 40) -> List[Dict[str, str]]:
+    """
+    Documents of Zipf-distributed VOCABULARY words, so frequent terms span several postings blocks
+    """
+    weights = [1.0 / (rank + 1) for rank in range(len(VOCABULARY))]
+    return [{'title': f'doc{i}.txt',
+             'content': ' '.join(rng.choices(VOCABULARY, weights, k=rng.randint(1, max_length)))}
+            for i in range(count)]
+
+
+class WhitespaceRanker(DocumentRanker):
+    """DocumentRanker analyzing queries like the test index, without NLTK data."""
+    preprocess_text = staticmethod(tokenize_document)
+
+
+def open_index(path=None) -> CorpusIndex:
+    """
+    Index with the test analyzers and no background merges
+    """
+    return CorpusIndex(ANALYZERS, positional=POSITIONAL, path=path, merge_policy=None)
+
+
+def assert_postings_match(index, docs, deleted):
+    """
+    Compare every field's postings, skip data and positions with a scan of the live documents
+    """
+    for name, analyzer in ANALYZERS.items():
+        expected = {}
+        for doc_id, doc in enumerate(docs):
+            if doc_id not in deleted:
+                for term, tf in Counter(analyzer(doc['content'])).items():
+                    expected.setdefault(term, {})[doc_id] = tf
+
+        field = index.field(name)
+        assert field.vocabulary() >= set(expected)
+        for term in set(VOCABULARY) | set(expected):
+            postings = expected.get(term, {})
+            assert dict(field.get_postings(term).items()) == postings, (name, term)
+            assert field.df(term) == len(postings)
+
+            blocks = field.get_blocks(term)
+            read = [blocks.read(block) for block in range(len(blocks))]
+            assert [doc_id for block_docs, _ in read for doc_id in block_docs.tolist()] == sorted(postings)
+            for block, (block_docs, block_tfs) in enumerate(read):
+                if len(block_docs):
+                    assert block_docs[-1] <= blocks.last[block]
+                    assert block_tfs.max() <= blocks.max_tfs[block]
+                    assert field.doc_lengths[block_docs].min() >= blocks.min_lengths[block]
+
+    field = index.field(DocumentSearcher.FIELD)
+    for doc_id in set(range(0, len(docs), 7)) - deleted:
+        tokens = ANALYZERS[DocumentSearcher.FIELD](docs[doc_id]['content'])
+        for term in set(tokens[:3]):
+            assert field.get_positions(term, doc_id) == [p for p, token in enumerate(tokens) if token == term]
+
+
+@pytest.fixture
+def rng():
+    return random.Random(1234)
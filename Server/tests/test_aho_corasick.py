@@ -0,0 +1,44 @@
+import pytest
+
+from aho_corasick import AhoCorasick
+from bim import DocumentSearcher, TextProcessor
+from conftest import VOCABULARY, open_index, random_documents
+
+
+def test_matches_every_occurrence_of_overlapping_patterns(rng):
+    patterns = ['he', 'she', 'his', 'hers', 'e', 'ushe']
+    automaton = AhoCorasick(patterns)
+    for text in ['ushers', 'hishershe', ''] + [''.join(rng.choices('ehirsu', k=40)) for _ in range(50)]:
+        expected = sorted((start + len(pattern) - 1, idx) for idx, pattern in enumerate(patterns)
+                          for start in range(len(text)) if text.startswith(pattern, start))
+        assert sorted(automaton.iter_matches(text)) == expected
+        assert automaton.distinct_matches(text) == {idx for _, idx in expected}
+        assert len(automaton.distinct_matches(text, limit=2)) == min(2, len({idx for _, idx in expected}))
+
+
+@pytest.mark.parametrize('match', ['substring', 'token'])
+def test_non_overlapping_lists_match_brute_force(rng, match):
+    index = open_index()
+    docs = random_documents(rng, 300, max_length=10)
+    index.add_documents(docs)
+    deleted = set(rng.sample(range(len(docs)), 30))
+    index.delete_documents(sorted(deleted))
+
+    def found(term, doc):
+        if match == 'substring':
+            return term in doc['content'].lower()
+        return term in TextProcessor.tokenize(doc['content'])
+
+    for _ in range(20):
+        terms = rng.sample(VOCABULARY[:30], rng.randint(1, 3)) + ['BA']
+        distinct = set(term.lower() for term in terms)
+        expected = [doc_id for doc_id, doc in enumerate(docs)
+                    if doc_id not in deleted and sum(found(term, doc) for term in distinct) == 1]
+        assert DocumentSearcher.non_overlapping_lists_search(index, terms, match=match) == expected
+
+
+def test_non_overlapping_lists_rejects_unknown_mode():
+    index = open_index()
+    with pytest.raises(ValueError):
+        DocumentSearcher.non_overlapping_lists_search(index, ['ba'], match='regex')
+    assert DocumentSearcher.non_overlapping_lists_search(index, ['', ''], match='substring') == []
@@ -0,0 +1,56 @@
+import pickle
+import sys
+
+import analysis
+from analysis import NounLemmaAnalyzer
+
+
+def test_lemma_cache_evicts_least_recently_used():
+    analyzer = NounLemmaAnalyzer(max_entries=2)
+    keys = [analyzer.content_hash(text) for text in ('first', 'second', 'third')]
+    analyzer.store(keys[0], ['dog'])
+    analyzer.store(keys[1], ['cat'])
+    assert analyzer.lookup(keys[0]) == ['dog']  # Now the most recently used
+    analyzer.store(keys[2], ['fish'])
+
+    assert analyzer.lookup(keys[1]) is None
+    assert analyzer.lookup(keys[0]) == ['dog']
+    assert analyzer.lookup(keys[2]) == ['fish']
+    assert (analyzer.hits, analyzer.misses) == (3, 1)
+
+
+def test_cached_lemmas_are_interned_copies():
+    analyzer = NounLemmaAnalyzer()
+    key = analyzer.content_hash('text')
+    analyzer.store(key, [''.join(['do', 'g'])])
+    lemmas = analyzer.lookup(key)
+    assert lemmas[0] is sys.intern('dog')
+    lemmas.append('cat')
+    assert analyzer.lookup(key) == ['dog']
+
+
+def test_call_analyzes_each_content_once(monkeypatch):
+    calls = []
+
+    def extract(content):
+        calls.append(content)
+        return content.split()
+
+    monkeypatch.setattr(analysis, 'extract_nouns_and_entities', extract)
+    analyzer = NounLemmaAnalyzer()
+    assert analyzer('dogs and cats') == ['dogs', 'and', 'cats']
+    assert analyzer('dogs and cats') == ['dogs', 'and', 'cats']
+    assert analyzer('fish') == ['fish']
+    assert calls == ['dogs and cats', 'fish']
+
+
+def test_analyzer_pickles_with_its_cache():
+    analyzer = NounLemmaAnalyzer(max_entries=5)
+    key = analyzer.content_hash('text')
+    analyzer.store(key, ['dog'])
+
+    copy = pickle.loads(pickle.dumps(analyzer))
+    assert copy.max_entries == 5
+    assert copy.lookup(key) == ['dog']
+    copy.store(copy.content_hash('other'), ['cat'])  # The copy has a working lock of its own
+    assert analyzer.lookup(copy.content_hash('other')) is None
@@ -0,0 +1,48 @@
+import pytest
+
+from analysis import NounLemmaAnalyzer
+from analysis_pool import AnalysisPool, analyze_contents
+from conftest import ANALYZERS, random_documents
+from segment import decode_tokens
+
+
+class SplitAnalyzer(NounLemmaAnalyzer):
+    """Memoizing analyzer that splits on whitespace instead of tagging."""
+
+    def __call__(self, content):
+        return content.upper().split()
+
+
+def decoded(tokens):
+    return {name: decode_tokens(field) for name, field in tokens.items()}
+
+
+@pytest.fixture
+def pool():
+    pool = AnalysisPool(dict(ANALYZERS, nouns=SplitAnalyzer()), workers=2, min_shard_size=8)
+    yield pool
+    pool.shutdown()
+
+
+def test_workers_match_in_process_analysis(rng, pool):
+    contents = [doc['content'] for doc in random_documents(rng, 100)]
+    contents += contents[:10]  # Duplicates are analyzed once and copied back
+    assert decoded(pool.analyze(contents)) == decoded(analyze_contents(pool.analyzers, contents))
+
+
+def test_memoized_analyzer_is_consulted_in_the_parent(rng, pool):
+    analyzer = pool.analyzers['nouns']
+    contents = [doc['content'] for doc in random_documents(rng, 40)]
+    analyzer.store(analyzer.content_hash(contents[0]), ['CACHED'])
+
+    nouns = decode_tokens(pool.analyze(contents)['nouns'])
+    assert nouns[0] == ['CACHED']
+    assert nouns[1:] == [content.upper().split() for content in contents[1:]]
+    # What the workers analyzed is stored back in the parent's cache
+    assert analyzer.lookup(analyzer.content_hash(contents[5])) == nouns[5]
+
+
+def test_small_batches_stay_in_process(pool):
+    tokens = pool.analyze(['ba be', 'bi'])
+    assert pool._executor is None
+    assert decode_tokens(tokens['nouns']) == [['BA', 'BE'], ['BI']]
@@ -0,0 +1,57 @@
+import pytest
+
+from batch import MODELS, BatchSearcher
+from bim import DocumentSearcher
+from conftest import VOCABULARY, WhitespaceRanker, open_index, random_documents
+from ir_helper import InformationRetrievalModels
+
+
+@pytest.fixture
+def searcher(rng):
+    index = open_index()
+    docs = random_documents(rng, 600, max_length=25)
+    for start in range(0, len(docs), 200):
+        index.add_documents(docs[start:start + 200])
+    index.delete_documents(rng.sample(range(len(docs)), 50))
+    return BatchSearcher(index, WhitespaceRanker(index), InformationRetrievalModels(index), max_chunk_pairs=500)
+
+
+def single(searcher, model, query, top_k):
+    """
+    The same query through the per-query model
+    """
+    if model == 'keyword':
+        return searcher.ranker.keyword_matching(query, top_k=top_k)
+    if model == 'tfidf':
+        return searcher.ranker.calculate_tf_idf(query, top_k=top_k)
+    if model == 'bm25':
+        return searcher.ranker.bm25(query, top_k=top_k)
+    if model == 'bim':
+        return DocumentSearcher.binary_term_matching(searcher.index, query, top_k=top_k)
+    if model == 'interference':
+        return searcher.ir_models.interference_model(query, top_k=top_k)
+    return searcher.ir_models.belief_network(query, top_k=top_k)
+
+
+def above(hits, cut):
+    return {doc_id: score for doc_id, score in hits if score > cut}
+
+
+@pytest.mark.parametrize('model', MODELS)
+def test_batch_matches_single_queries(rng, searcher, model):
+    queries = [' '.join(rng.choices(VOCABULARY[:40], k=rng.randint(1, 4))) for _ in range(40)]
+    queries += ['', 'zzz', queries[0]]
+    results = searcher.search(queries, model, top_k=20)
+    assert len(results) == len(queries)
+    for query, hits in zip(queries, results):
+        expected = single(searcher, model, query, 20)
+        assert [score for _, score in hits] == pytest.approx([score for _, score in expected]), query
+        # Documents tied (up to rounding) with the last score may differ, the ones above it may not
+        cut = hits[-1][1] + 1e-9 if hits else 0
+        assert above(hits, cut) == pytest.approx(above(expected, cut)), query
+
+
+def test_batch_rejects_unknown_models(searcher):
+    with pytest.raises(ValueError):
+        searcher.search(['ba'], 'pagerank')
+    assert searcher.search(['ba', 'be'], 'bm25', top_k=0) == [[], []]
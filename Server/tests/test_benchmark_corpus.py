@@ -0,0 +1,34 @@
+from benchmarks.corpus import SYLLABLES, ZipfCorpus
+from boolean import parse_query
+
+
+def test_words_spell_distinct_ranks():
+    words = [ZipfCorpus.word(rank) for rank in range(len(SYLLABLES) ** 2 + len(SYLLABLES) + 5)]
+    assert len(set(words)) == len(words)
+    assert words[:2] == SYLLABLES[:2]
+    assert all(word.isalpha() for word in words)
+    assert sorted(map(len, words)) == list(map(len, words))
+
+
+def test_corpus_is_deterministic_and_zipfian():
+    corpus = ZipfCorpus(vocabulary_size=2000, mean_length=50, seed=7)
+    batches = list(corpus.documents(2500, batch_size=1000))
+    assert [len(batch) for batch in batches] == [1000, 1000, 500]
+    assert batches[2][0]['title'] == 'doc0002000.txt'
+    assert batches == list(ZipfCorpus(vocabulary_size=2000, mean_length=50, seed=7).documents(2500, batch_size=1000))
+    assert batches != list(ZipfCorpus(vocabulary_size=2000, mean_length=50, seed=8).documents(2500, batch_size=1000))
+
+    counts = {}
+    for batch in batches:
+        for doc in batch:
+            for word in doc['content'].split():
+                counts[word] = counts.get(word, 0) + 1
+    vocabulary = corpus.vocabulary
+    assert counts[vocabulary[0]] > counts[vocabulary[9]] > counts.get(vocabulary[999], 0)
+
+
+def test_queries_parse():
+    corpus = ZipfCorpus(vocabulary_size=1000)
+    assert all(len(query.split()) == 3 for query in corpus.queries(20, terms=3))
+    for query in corpus.boolean_queries(20) + corpus.pattern_queries(20):
+        parse_query(query)
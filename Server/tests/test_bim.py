@@ -0,0 +1,43 @@
+import pytest
+
+from bim import DocumentSearcher, TextProcessor
+from conftest import VOCABULARY, open_index, random_documents
+
+
+@pytest.fixture
+def corpus(rng):
+    index = open_index()
+    docs = random_documents(rng, 500, max_length=20)
+    for start in range(0, len(docs), 250):
+        index.add_documents(docs[start:start + 250])
+    deleted = set(rng.sample(range(len(docs)), 60))
+    index.delete_documents(sorted(deleted))
+    return index, docs, deleted
+
+
+def jaccard(docs, deleted, query):
+    query_terms = set(TextProcessor.tokenize(query))
+    similarities = {}
+    for doc_id, doc in enumerate(docs):
+        doc_terms = set(TextProcessor.tokenize(doc['content']))
+        if doc_id not in deleted and query_terms & doc_terms:
+            similarities[doc_id] = len(query_terms & doc_terms) / len(query_terms | doc_terms)
+    return sorted(similarities.items(), key=lambda hit: (-hit[1], hit[0]))
+
+
+@pytest.mark.parametrize('top_k', [1, 10, 1000])
+def test_binary_term_matching_matches_brute_force_jaccard(rng, corpus, top_k):
+    index, docs, deleted = corpus
+    for _ in range(30):
+        query = ' '.join(rng.choices(VOCABULARY, k=rng.randint(1, 4)))
+        hits = DocumentSearcher.binary_term_matching(index, query, top_k=top_k)
+        expected = jaccard(docs, deleted, query)[:top_k]
+        assert [doc_id for doc_id, _ in hits] == [doc_id for doc_id, _ in expected]
+        assert [score for _, score in hits] == pytest.approx([score for _, score in expected])
+
+
+def test_binary_term_matching_without_matches(corpus):
+    index = corpus[0]
+    assert DocumentSearcher.binary_term_matching(index, 'zzz', top_k=10) == []
+    assert DocumentSearcher.binary_term_matching(index, '', top_k=10) == []
+    assert DocumentSearcher.binary_term_matching(index, 'ba', top_k=0) == []
@@ -0,0 +1,162 @@
+import fnmatch
+
+import pytest
+
+from boolean import (QuerySyntaxError, QueryTooBroadError, Token, parse_query, pattern_matcher, positive_terms,
+                     process_query, tokenize_document, tokenize_query)
+from conftest import open_index, random_documents
+
+
+def test_tokenize_query_needs_no_spaces_around_parentheses():
+    assert tokenize_query('Cat AND(dog OR not Fish) ') == [
+        Token('term', 'cat'), Token('and', 'and'), Token('(', '('), Token('term', 'dog'),
+        Token('or', 'or'), Token('not', 'not'), Token('term', 'fish'), Token(')', ')'),
+    ]
+
+
+@pytest.mark.parametrize('query,tree', [
+    ('cat', ('term', 'cat')),
+    ('cat dog', ('and', [('term', 'cat'), ('term', 'dog')])),
+    ('cat or dog and fish', ('or', [('term', 'cat'), ('and', [('term', 'dog'), ('term', 'fish')])])),
+    ('(cat or dog) fish', ('and', [('or', [('term', 'cat'), ('term', 'dog')]), ('term', 'fish')])),
+    ('not not cat', ('not', ('not', ('term', 'cat')))),
+    ('cat and not dog', ('and', [('term', 'cat'), ('not', ('term', 'dog'))])),
+])
+def test_parse_query(query, tree):
+    assert parse_query(query) == tree
+
+
+@pytest.mark.parametrize('query,message', [
+    ('', 'Query is empty'),
+    ('cat and', "Operator 'and' is missing an operand"),
+    ('or cat', "Operator 'or' is missing an operand at token 1"),
+    ('not', "Operator 'not' is missing an operand"),
+    ('(cat', "Unbalanced parentheses: missing ')'"),
+    ('cat)', "Unbalanced parentheses: unexpected ')' at token 2"),
+    ('cat ()', 'Empty parentheses at token 2'),
+])
+def test_parse_query_rejects_malformed_queries(query, message):
+    with pytest.raises(QuerySyntaxError) as error:
+        parse_query(query)
+    assert str(error.value) == message
+
+
+@pytest.fixture
+def corpus(rng):
+    index = open_index()
+    docs = random_documents(rng, 600, max_length=15)
+    # Punctuation only differs between the word field and the positional field
+    docs += [{'title': 'punct.txt', 'content': "bax, dex. ba-ta (kix) dex"}]
+    for start in range(0, len(docs), 200):
+        index.add_documents(docs[start:start + 200])
+    deleted = set(rng.sample(range(len(docs)), 80))
+    index.delete_documents(sorted(deleted))
+    index.merge_segments(index.latest(), 0, 2)
+    return index, docs, deleted
+
+
+def brute_force(docs, deleted, matches):
+    return [doc_id for doc_id, doc in enumerate(docs)
+            if doc_id not in deleted and matches(tokenize_document(doc['content']))]
+
+
+def adjacent(words, first, second):
+    letters = [''.join(filter(str.isalpha, word)) for word in words]
+    return any(a == first and b == second for a, b in zip(letters, letters[1:]))
+
+
+def like(pattern):
+    return lambda words: any(fnmatch.fnmatchcase(word, pattern) for word in words)
+
+
+CASES = [
+    ('ba', lambda w: 'ba' in w),
+    ('ba and be', lambda w: 'ba' in w and 'be' in w),
+    ('ba be', lambda w: 'ba' in w and 'be' in w),
+    ('ba or kix', lambda w: 'ba' in w or 'kix' in w),
+    ('not ba', lambda w: 'ba' not in w),
+    ('ba and not (be or bi)', lambda w: 'ba' in w and 'be' not in w and 'bi' not in w),
+    ('not (ba and be) or kux', lambda w: not ('ba' in w and 'be' in w) or 'kux' in w),
+    ('"ba be"', lambda w: 'ba' in w and 'be' in w and adjacent(w, 'ba', 'be')),
+    ('"dex ba" and not bi', lambda w: 'dex' in w and 'ba' in w and adjacent(w, 'dex', 'ba') and 'bi' not in w),
+    ('"dex. ba-ta"', lambda w: 'dex.' in w and 'ba-ta' in w and adjacent(w, 'dex', 'bata')),
+    ('"bax,"', lambda w: 'bax,' in w),
+    ('b*', like('b*')),
+    ('bat*', like('bat*')),
+    ('k?x', like('k?x')),
+    ('*ta and not d*', lambda w: like('*ta')(w) and not like('d*')(w)),
+    ('"ba be" or f?', lambda w: ('ba' in w and 'be' in w and adjacent(w, 'ba', 'be')) or like('f?')(w)),
+]
+
+
+@pytest.mark.parametrize('query,matches', CASES, ids=[query for query, _ in CASES])
+def test_queries_match_brute_force(corpus, query, matches):
+    index, docs, deleted = corpus
+    assert process_query(query, index) == brute_force(docs, deleted, matches)
+
+
+def test_pattern_expansion_limit(corpus):
+    index = corpus[0]
+    with pytest.raises(QueryTooBroadError):
+        process_query('*', index, max_expansions=5)
+    with pytest.raises(QuerySyntaxError):
+        process_query('ba and', index)
+
+
+def test_positive_terms_skip_negated_leaves(corpus):
+    field = corpus[0].field('words')
+    assert positive_terms('Cat and not (dog or fish) "big Bird" or not not cat') == ['cat', 'big', 'bird']
+    assert positive_terms('ba* or kix', field) == field.expand('ba') + ['kix']
+    assert positive_terms('ba* or kix') == ['kix']
+    assert positive_terms('* or kix', field, max_expansions=5) == ['kix']
+    with pytest.raises(QuerySyntaxError):
+        positive_terms('kix and')
+
+
+@pytest.mark.parametrize('query,tree', [
+    ('"Big  dog" comput*', ('and', [('phrase', (['big', 'dog'], ['big', 'dog'])), ('pattern', 'comput*')])),
+    ('"dog"', ('term', 'dog')),
+    ('"dog\'s, 42 bones!"', ('phrase', (["dog's,", '42', 'bones!'], ['dogs', '', 'bones']))),
+    ('not d?g', ('not', ('pattern', 'd?g'))),
+])
+def test_parse_phrases_and_patterns(query, tree):
+    assert parse_query(query) == tree
+
+
+@pytest.mark.parametrize('query,message', [
+    ('"big dog', 'Unterminated phrase at token 1'),
+    ('cat ""', 'Empty phrase at token 2'),
+])
+def test_parse_rejects_malformed_phrases(query, message):
+    with pytest.raises(QuerySyntaxError) as error:
+        parse_query(query)
+    assert str(error.value) == message
+
+
+@pytest.mark.parametrize('pattern,prefix,matches,misses', [
+    ('comput*', 'comput', None, None),
+    ('d?g', 'd', ['dog', 'dig'], ['dg', 'doog', 'dogs']),
+    ('*ing', '', ['ing', 'sing'], ['singer']),
+    ('a*b?', 'a', ['abc', 'axxbz'], ['ab', 'abcd']),
+    ('a.b*', 'a.b', None, None),
+])
+def test_pattern_matcher(pattern, prefix, matches, misses):
+    literal, regex = pattern_matcher(pattern)
+    assert literal == prefix
+    if matches is None:
+        assert regex is None
+        return
+    assert all(regex.fullmatch(term) for term in matches)
+    assert not any(regex.fullmatch(term) for term in misses)
+
+
+def test_expand_matches_the_term_dictionaries(corpus):
+    field = corpus[0].field('words')
+    vocabulary = sorted(field.vocabulary())
+    for pattern in ['b*', 'ba*', 'k?x', '*ta', '?a', 'z*']:
+        prefix, regex = pattern_matcher(pattern)
+        expected = [term for term in vocabulary if fnmatch.fnmatchcase(term, pattern)]
+        assert field.expand(prefix, regex) == expected, pattern
+        # Past the limit expansion stops early, returning limit + 1 of the matching terms
+        limited = field.expand(prefix, regex, limit=2)
+        assert len(limited) == min(3, len(expected)) and set(limited) <= set(expected), pattern
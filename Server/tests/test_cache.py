@@ -0,0 +1,98 @@
+from cache import ResultCache, estimate_size, normalize_query
+
+
+class Computation:
+    """Compute callable returning [value, number of calls so far]."""
+
+    def __init__(self, value='result'):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [self.value, self.calls]
+
+
+def test_hits_share_the_normalized_query():
+    cache = ResultCache()
+    compute = Computation()
+    first = cache.get_or_compute('tfidf', 'Big  Dog', (10, 0), 1, compute)
+    assert cache.get_or_compute('tfidf', ' big dog ', (10, 0), 1, compute) == first
+    assert cache.get_or_compute('tfidf', 'big dog', (10, 10), 1, compute) != first
+    assert cache.get_or_compute('bim', 'big dog', (10, 0), 1, compute) != first
+    assert compute.calls == 3
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 3
+    assert normalize_query('  A\tB  ') == 'a b'
+
+
+def test_newer_version_invalidates_every_entry():
+    cache = ResultCache()
+    compute = Computation()
+    cache.get_or_compute('tfidf', 'dog', (), 1, compute)
+    cache.get_or_compute('bim', 'cat', (), 1, compute)
+
+    assert cache.get_or_compute('tfidf', 'dog', (), 2, compute) == ['result', 3]
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['invalidations'] == 1
+    assert cache.get_or_compute('tfidf', 'dog', (), 2, compute) == ['result', 3]
+
+
+def test_older_versions_bypass_the_cache():
+    cache = ResultCache()
+    compute = Computation()
+    cache.get_or_compute('tfidf', 'dog', (), 5, compute)
+    # A request pinned to an older snapshot neither reads nor replaces the newer entry
+    assert cache.get_or_compute('tfidf', 'dog', (), 4, compute) == ['result', 2]
+    assert cache.get_or_compute('tfidf', 'dog', (), 4, compute) == ['result', 3]
+    assert cache.get_or_compute('tfidf', 'dog', (), 5, compute) == ['result', 1]
+    assert cache.stats()['invalidations'] == 0
+
+
+def test_incomplete_results_are_not_stored():
+    cache = ResultCache()
+    compute = Computation()
+    complete = [False]
+    assert cache.get_or_compute('tfidf', 'dog', (), 1, compute, complete=lambda: complete[0]) == ['result', 1]
+    assert cache.stats()['entries'] == 0
+    complete[0] = True
+    assert cache.get_or_compute('tfidf', 'dog', (), 1, compute, complete=lambda: complete[0]) == ['result', 2]
+    assert cache.get_or_compute('tfidf', 'dog', (), 1, compute, complete=lambda: complete[0]) == ['result', 2]
+
+
+def test_results_computed_across_a_version_change_are_dropped():
+    cache = ResultCache()
+
+    def compute():
+        # Another request sees a newer corpus while this one computes
+        cache.get_or_compute('bim', 'cat', (), 2, Computation())
+        return ['stale']
+
+    assert cache.get_or_compute('tfidf', 'dog', (), 1, compute) == ['stale']
+    assert cache.stats()['entries'] == 1
+    assert cache.get_or_compute('tfidf', 'dog', (), 1, Computation()) == ['result', 1]
+
+
+def test_evicts_least_recently_used_by_count_and_size():
+    cache = ResultCache(max_entries=2)
+    for query in ('a', 'b', 'a', 'c'):
+        cache.get_or_compute('tfidf', query, (), 1, Computation(query))
+    assert cache.stats()['entries'] == 2 and cache.stats()['evictions'] == 1
+    assert cache.get_or_compute('tfidf', 'a', (), 1, Computation('new')) == ['a', 1]
+    assert cache.get_or_compute('tfidf', 'b', (), 1, Computation('new')) == ['new', 1]
+
+    size = estimate_size(['x' * 100, 1])
+    cache = ResultCache(max_bytes=2 * size)
+    for query in ('a', 'b', 'c'):
+        cache.get_or_compute('tfidf', query, (), 1, Computation('x' * 100))
+    assert cache.stats()['entries'] == 2 and cache.stats()['bytes'] <= 2 * size
+    cache.get_or_compute('tfidf', 'huge', (), 1, Computation('x' * 10000))
+    assert cache.stats()['entries'] == 2
+
+
+def test_disabled_cache_always_computes():
+    cache = ResultCache(max_entries=0)
+    compute = Computation()
+    cache.get_or_compute('tfidf', 'dog', (), 1, compute)
+    cache.get_or_compute('tfidf', 'dog', (), 1, compute)
+    assert compute.calls == 2
+
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import numpy as np
+
+from conftest import ANALYZERS, assert_postings_match, open_index, random_documents
+
+
+def test_batches_are_indexed_incrementally(rng):
+    index = open_index()
+    docs = []
+    for size in (1, 50, 0, 300, 7):
+        batch = random_documents(rng, size)
+        assert index.add_documents(batch) == list(range(len(docs), len(docs) + size))
+        docs += batch
+        assert len(index) == len(docs)
+        assert_postings_match(index, docs, set())
+
+    assert len(index.segments) == 4
+    for name, analyzer in ANALYZERS.items():
+        field = index.field(name)
+        lengths = [len(analyzer(doc['content'])) for doc in docs]
+        assert field.doc_lengths.tolist() == lengths
+        assert field.doc_unique_terms.tolist() == [len(set(analyzer(doc['content']))) for doc in docs]
+        assert field.total_length == sum(lengths)
+        assert field.avg_doc_length == sum(lengths) / len(docs)
+
+    assert list(index.documents) == docs
+    assert [index.documents[doc_id] for doc_id in (0, 1, 351, 357)] == [docs[0], docs[1], docs[351], docs[357]]
+    assert index.documents.title(200) == docs[200]['title']
+    assert [doc_id for doc_id, _ in index.documents.items()] == list(range(len(docs)))
+
+
+def test_listeners_run_in_commit_order(rng):
+    index = open_index()
+    bases = []
+
+    def record(segment):
+        # Widen the window in which a later commit could overtake this one
+        time.sleep(0.001)
+        bases.append(segment.base)
+
+    index.add_listener(record)
+    batches = [random_documents(rng, 5) for _ in range(40)]
+    barrier = threading.Barrier(8)
+
+    def upload(worker):
+        barrier.wait()
+        for batch in batches[worker::8]:
+            index.add_documents(batch)
+
+    threads = [threading.Thread(target=upload, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert bases == sorted(bases)
+    assert bases == [segment.base for segment in index.segments]
+
+
+def test_failing_listener_does_not_block_others(rng):
+    index = open_index()
+    received = []
+
+    def fail(segment):
+        raise RuntimeError('mirror unavailable')
+
+    index.add_listener(fail)
+    index.add_listener(received.append)
+    index.add_documents(random_documents(rng, 3))
+    index.add_documents(random_documents(rng, 3))
+
+    assert [segment.base for segment in received] == [0, 3]
+    assert index.listener_failures == 2
+    assert 'mirror unavailable' in index.last_listener_error
+    assert np.array_equal(index.live_ids(), np.arange(6))
+
+
+def test_pinned_snapshot_ignores_later_commits(rng):
+    index = open_index()
+    index.add_documents(random_documents(rng, 50))
+    field = index.field('words')
+    with index.pinned() as snapshot:
+        before = {term: field.get_postings(term).doc_ids.tolist() for term in ('ba', 'be')}
+        lengths = field.doc_lengths.copy()
+
+        index.add_documents(random_documents(rng, 50))
+        index.delete_documents(range(0, 50, 2))
+        assert index.snapshot() is snapshot
+        assert (len(index), index.num_live, index.version) == (50, 50, 1)
+        assert {term: field.get_postings(term).doc_ids.tolist() for term in ('ba', 'be')} == before
+        assert np.array_equal(field.doc_lengths, lengths)
+        with index.pinned() as inner:
+            assert inner is snapshot
+
+        # Other threads read the latest version unless they pin their own
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append((len(index), index.num_live)))
+        thread.start()
+        thread.join()
+        assert seen == [(100, 75)]
+
+    assert index.version == 3 and index.num_live == 75
+    assert all(doc_id % 2 or doc_id >= 50 for doc_id in field.get_postings('ba').doc_ids.tolist())
+
+
+def test_readers_see_whole_commits(rng):
+    index = open_index()
+    batches = [random_documents(rng, 20) for _ in range(30)]
+    errors = []
+    done = threading.Event()
+
+    field = index.field('words')
+
+    def read():
+        while not done.is_set():
+            with index.pinned() as snapshot:
+                # Postings, statistics and size all come from one commit
+                postings = sum(len(field.get_postings(term)) for term in field.vocabulary())
+                if snapshot.num_docs % 20 or len(field.doc_lengths) != snapshot.num_docs \
+                        or postings != field.doc_unique_terms.sum():
+                    errors.append(snapshot.version)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    for batch in batches:
+        index.add_documents(batch)
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert errors == []
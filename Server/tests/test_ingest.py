@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from conftest import open_index, random_documents
+from ingest import COMPLETED, FAILED, INDEXED, REJECTED, IngestQueue, parse_document, parse_ndjson
+
+
+def test_parse_ndjson_reports_rejects_by_line():
+    lines = [
+        b'{"filename": "a.txt", "content": "first"}\n',
+        b'\n',
+        b'{"filename": "b.txt", "content": \n',
+        b'["a.txt", "x"]\n',
+        b'{"filename": "c.txt"}\n',
+        b'{"filename": "d.txt", "content": 42}\n',
+        b'{"filename": "e.txt", "content": ""}\n',
+        b'\xff\xfe\n',
+        b'   \n',
+        b'{"filename": "f.txt", "content": "last", "extra": 1}',
+    ]
+    parsed = list(parse_ndjson(lines))
+
+    assert [line for line, _, _ in parsed] == [1, 3, 4, 5, 6, 7, 8, 10]
+    assert [doc for _, doc, _ in parsed if doc] == [{'title': 'a.txt', 'content': 'first'},
+                                                   {'title': 'f.txt', 'content': 'last'}]
+    errors = {line: error for line, doc, error in parsed if doc is None}
+    assert sorted(errors) == [3, 4, 5, 6, 7, 8]
+    assert errors[4] == "Expected a JSON object"
+    assert errors[5] == errors[7] == "Missing filename or content"
+    assert errors[6] == "filename and content must be strings"
+    assert all(error for error in errors.values())
+
+
+def test_parse_document_rejects_non_string_filenames():
+    with pytest.raises(ValueError):
+        parse_document({'filename': ['a.txt'], 'content': 'text'})
+
+
+def test_queue_indexes_valid_lines_in_batches(rng):
+    index = open_index()
+    queue = IngestQueue(index, batch_size=4, max_pending=2)
+    docs = random_documents(rng, 10)
+    lines = [json.dumps({'filename': doc['title'], 'content': doc['content']}).encode() for doc in docs]
+    lines.insert(3, b'not json')
+
+    job = queue.create_job()
+    queue.ingest(job, parse_ndjson(lines))
+    assert job.wait(timeout=10)
+
+    status = job.to_dict()
+    assert status['state'] == COMPLETED
+    assert status['counts'] == {INDEXED: 10, REJECTED: 1}
+    assert [entry['id'] for entry in status['documents'] if entry['status'] == INDEXED] == list(range(10))
+    assert status['documents'][3]['line'] == 4 and status['documents'][3]['status'] == REJECTED
+    assert len(index.segments) == 3
+    assert list(index.documents) == docs
+    assert queue.get_job(job.id) is job
+
+
+def test_queue_marks_failed_batches():
+    class FailingCorpus:
+        def add_documents(self, docs):
+            raise RuntimeError('disk full')
+
+    queue = IngestQueue(FailingCorpus(), batch_size=2)
+    job = queue.create_job()
+    queue.ingest(job, parse_ndjson([b'{"filename": "a.txt", "content": "x"}']))
+    assert job.wait(timeout=10)
+    entry = job.to_dict()['documents'][0]
+    assert entry['status'] == FAILED and 'disk full' in entry['error']
+
+
+def test_queue_forgets_oldest_jobs():
+    queue = IngestQueue(open_index(), max_jobs=2)
+    jobs = [queue.create_job() for _ in range(3)]
+    assert queue.get_job(jobs[0].id) is None
+    assert [queue.get_job(job.id) for job in jobs[1:]] == jobs[1:]
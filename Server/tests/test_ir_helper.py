@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+import pytest
+
+import ir_helper
+from boolean import tokenize_document
+from conftest import VOCABULARY, open_index, random_documents
+from ir_helper import InformationRetrievalModels, combine
+
+DB = InformationRetrievalModels.DEFAULT_BELIEF
+
+
+@pytest.fixture
+def corpus(rng):
+    index = open_index()
+    docs = random_documents(rng, 400, max_length=20)
+    for start in range(0, len(docs), 200):
+        index.add_documents(docs[start:start + 200])
+    deleted = set(rng.sample(range(len(docs)), 40))
+    index.delete_documents(sorted(deleted))
+    return InformationRetrievalModels(index), docs, deleted
+
+
+def beliefs(docs, deleted, query):
+    """
+    InQuery term beliefs by scanning the live documents: {term: {doc_id: belief}}, plus nidf per term
+    """
+    live = {doc_id: tokenize_document(doc['content']) for doc_id, doc in enumerate(docs) if doc_id not in deleted}
+    avg_length = sum(map(len, live.values())) / len(live)
+    term_beliefs, nidfs = {}, {}
+    for term in dict.fromkeys(tokenize_document(query)):
+        holders = {doc_id: tokens.count(term) for doc_id, tokens in live.items() if term in tokens}
+        nidfs[term] = math.log((len(live) + 0.5) / len(holders)) / math.log(len(live) + 1) if holders else 0.0
+        term_beliefs[term] = {
+            doc_id: DB + (1 - DB) * tf / (tf + 0.5 + 1.5 * len(live[doc_id]) / avg_length) * nidfs[term]
+            for doc_id, tf in holders.items()
+        }
+    return live, term_beliefs, nidfs
+
+
+def test_combine_operators():
+    matrix = np.array([[0.5, 1.0], [0.4, 0.0]])
+    assert combine('and', matrix).tolist() == pytest.approx([0.2, 0.0])
+    assert combine('or', matrix).tolist() == pytest.approx([0.7, 1.0])
+    assert combine('not', matrix).tolist() == pytest.approx([0.5, 0.0])
+    assert combine('sum', matrix).tolist() == pytest.approx([0.45, 0.5])
+    assert combine('wsum', matrix, [3, 1]).tolist() == pytest.approx([0.475, 0.75])
+    assert combine('max', matrix).tolist() == pytest.approx([0.5, 1.0])
+    with pytest.raises(ValueError):
+        combine('xor', matrix)
+
+
+@pytest.mark.parametrize('operator', ['sum', 'and', 'or', 'max'])
+def test_inference_network_matches_brute_force(rng, corpus, operator):
+    models, docs, deleted = corpus
+    for _ in range(10):
+        query = ' '.join(rng.choices(VOCABULARY[:30], k=rng.randint(1, 4)))
+        _, term_beliefs, _ = beliefs(docs, deleted, query)
+        candidates = sorted(set().union(*term_beliefs.values()))
+        expected = {
+            doc_id: combine(operator, np.array([[per_doc.get(doc_id, DB)] for per_doc in term_beliefs.values()]))[0]
+            for doc_id in candidates
+        }
+        ranked = models.interference_model(query, operator=operator)
+        assert dict(ranked) == pytest.approx(expected)
+        assert ranked == sorted(ranked, key=lambda hit: (-hit[1], hit[0]))
+        assert models.interference_model(query, top_k=3, operator=operator) == ranked[:3]
+
+
+def test_not_covers_every_live_document(corpus):
+    models, docs, deleted = corpus
+    ranked = dict(models.interference_model('ba', operator='not'))
+    assert sorted(ranked) == [doc_id for doc_id in range(len(docs)) if doc_id not in deleted]
+    without = [doc_id for doc_id in ranked if 'ba' not in tokenize_document(docs[doc_id]['content'])]
+    assert without and [ranked[doc_id] for doc_id in without] == pytest.approx([1 - DB] * len(without))
+
+
+def test_belief_network_weights_rare_terms_and_longer_documents(rng, corpus):
+    models, docs, deleted = corpus
+    for _ in range(10):
+        query = ' '.join(rng.choices(VOCABULARY[:30], k=rng.randint(1, 4)))
+        live, term_beliefs, nidfs = beliefs(docs, deleted, query)
+        counts = {term: tokenize_document(query).count(term) for term in term_beliefs}
+        weights = {term: counts[term] * nidfs[term] for term in term_beliefs}
+        if not sum(weights.values()):
+            weights = counts
+        avg_length = sum(map(len, live.values())) / len(live)
+        expected = {}
+        for doc_id in set().union(*term_beliefs.values()):
+            evidence = sum(weights[term] * per_doc.get(doc_id, DB) for term, per_doc in term_beliefs.items())
+            prior = 0.5 + 0.5 * len(live[doc_id]) / (len(live[doc_id]) + avg_length)
+            expected[doc_id] = evidence / sum(weights.values()) * prior
+        assert dict(models.belief_network(query)) == pytest.approx(expected)
+
+
+def test_term_belief_cache_is_bounded(monkeypatch, corpus):
+    monkeypatch.setattr(ir_helper, 'BELIEF_CACHE_POSTINGS', 100)
+    models = InformationRetrievalModels(corpus[0].index)
+    for term in VOCABULARY:
+        first = models.term_beliefs(term)
+        assert models.term_beliefs(term)[0].tolist() == first[0].tolist()
+    cache = models._stats().beliefs
+    assert 0 < len(cache) < len(VOCABULARY)
+    assert cache.weight <= 100
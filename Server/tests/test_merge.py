@@ -0,0 +1,103 @@
+from conftest import ANALYZERS, POSITIONAL, assert_postings_match, open_index, random_documents
+from index import CorpusIndex
+from merge import MergePolicy
+
+
+def test_postings_after_delete_merge_and_reopen(rng, tmp_path):
+    path = str(tmp_path / 'index')
+    index = open_index(path)
+    docs = random_documents(rng, 900)
+    for start in range(0, len(docs), 300):
+        index.add_documents(docs[start:start + 300])
+    deleted = set(rng.sample(range(len(docs)), 250))
+    index.delete_documents(sorted(deleted))
+    assert_postings_match(index, docs, deleted)
+
+    index.merge_segments(index.latest(), 0, 2)
+    assert len(index.segments) == 2
+    assert_postings_match(index, docs, deleted)
+
+    more = random_documents(rng, 200)
+    index.add_documents(more)
+    docs += more
+    deleted |= {3, 950, 1000}
+    index.delete_documents([3, 950, 1000])
+    index.merge_segments(index.latest(), 0, len(index.segments))
+    assert_postings_match(index, docs, deleted)
+
+    reopened = open_index(path)
+    assert reopened.num_live == len(docs) - len(deleted)
+    assert_postings_match(reopened, docs, deleted)
+
+
+
+
+def test_deletes_are_tombstones_until_merged(rng):
+    index = open_index()
+    docs = random_documents(rng, 40)
+    index.add_documents(docs)
+    version = index.version
+    assert index.delete_documents([3, 3, 7, 99, -1]) == [3, 7]
+    assert index.delete_documents([3]) == []
+    assert index.version == version + 1
+    assert [index.is_live(doc_id) for doc_id in (2, 3, 7)] == [True, False, False]
+    assert index.documents[3] == docs[3]  # Still stored until a merge drops it
+
+    assert index.merge_segments(index.latest(), 0, 1) == 2
+    assert index.version == version + 1
+    assert index.documents[3] == {'title': '', 'content': ''}
+    assert index.documents[4] == docs[4]
+    assert [doc_id for doc_id, _ in index.documents.items()] == [i for i in range(40) if i not in (3, 7)]
+    assert_postings_match(index, docs, {3, 7})
+
+
+def test_update_replaces_documents_in_one_commit(rng):
+    index = open_index()
+    docs = random_documents(rng, 10)
+    index.add_documents(docs)
+    seen = []
+    index.add_listener(lambda segment: seen.append(('add', index.latest().version)))
+    index.add_delete_listener(lambda doc_ids: seen.append(('delete', doc_ids)))
+
+    updated = random_documents(rng, 2)
+    assert index.add_documents(updated, replace=[4, 8, 30]) == [10, 11]
+    assert index.version == 2
+    assert seen == [('add', 2), ('delete', [4, 8])]
+    assert_postings_match(index, docs + updated, {4, 8})
+
+
+def test_policy_merges_equal_levels_and_segments_with_many_deletes(rng):
+    index = open_index()
+    for _ in range(7):
+        index.add_documents(random_documents(rng, 10))
+    index.add_documents(random_documents(rng, 200))
+    policy = MergePolicy(merge_factor=3, deletes_ratio=0.3, min_level_docs=100)
+    assert policy.level(10) == policy.level(100) == 0 and policy.level(300) == 1
+    assert policy.plan(index.latest()) == [(0, 3), (3, 6)]
+
+    index.delete_documents(range(60, 64))
+    index.delete_documents(range(70, 130))
+    assert policy.plan(index.latest()) == [(0, 3), (3, 6), (6, 7), (7, 8)]
+
+    index.merge_segments(index.latest(), 7, 8)
+    assert policy.plan(index.latest()) == [(0, 3), (3, 6), (6, 7)]
+
+
+def test_background_merges_keep_every_document(rng):
+    policy = MergePolicy(merge_factor=2, deletes_ratio=0.2, min_level_docs=20)
+    index = CorpusIndex(ANALYZERS, positional=POSITIONAL, merge_policy=policy)
+    docs = []
+    for _ in range(16):
+        batch = random_documents(rng, 10)
+        index.add_documents(batch)
+        docs += batch
+    deleted = set(rng.sample(range(len(docs)), 50))
+    index.delete_documents(sorted(deleted))
+    index.merger.merge()
+
+    assert not policy.plan(index.latest())
+    assert len(index.segments) < 16
+    stats = index.merger.stats()
+    assert stats.merges > 0 and stats.failures == 0
+    assert 0 < sum(segment.dropped for segment in index.segments) <= len(deleted)
+    assert_postings_match(index, docs, deleted)
@@ -0,0 +1,48 @@
+import threading
+
+from metrics import BUCKETS, Registry, count, end_trace, stage, start_trace
+
+
+def test_stages_and_counters_belong_to_the_current_trace():
+    with stage('score'):
+        count('postings_touched', 5)  # Outside a trace: no-op
+
+    trace = start_trace('tfidf')
+    with stage('analyze'):
+        pass
+    with stage('score'):
+        count('postings_touched', 3)
+    with stage('score'):
+        count('postings_touched', 4)
+    # Other threads have no trace of their own
+    thread = threading.Thread(target=count, args=('documents_scored',))
+    thread.start()
+    thread.join()
+    assert end_trace() is trace
+
+    assert list(trace.to_dict()['stages_ms']) == ['analyze', 'score']
+    assert trace.counters == {'postings_touched': 7}
+    assert end_trace() is None
+
+
+def test_render_prometheus_text():
+    registry = Registry(prefix='ir')
+    trace = start_trace('bm25')
+    with stage('score'):
+        count('documents_scored', 12)
+    end_trace()
+    registry.record(trace, 200)
+    registry.inc('cache_hits', 'Cache "hits"', endpoint='bm25')
+    registry.register_callback('documents', 'gauge', 'Indexed documents', lambda: 42)
+
+    lines = registry.render().splitlines()
+    assert 'ir_requests_total{endpoint="bm25",status="200"} 1' in lines
+    assert 'ir_documents_scored_total{endpoint="bm25"} 12' in lines
+    assert 'ir_cache_hits{endpoint="bm25"} 1' in lines
+    assert '# TYPE ir_request_seconds histogram' in lines
+    assert 'ir_request_seconds_count{endpoint="bm25"} 1' in lines
+    assert 'ir_stage_seconds_bucket{endpoint="bm25",stage="score",le="+Inf"} 1' in lines
+    buckets = [line for line in lines if line.startswith('ir_request_seconds_bucket')]
+    assert len(buckets) == len(BUCKETS) + 1
+    assert [int(line.rsplit(' ', 1)[1]) for line in buckets] == sorted(int(line.rsplit(' ', 1)[1]) for line in buckets)
+    assert lines[-3:] == ['# HELP ir_documents Indexed documents', '# TYPE ir_documents gauge', 'ir_documents 42']
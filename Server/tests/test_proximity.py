@@ -0,0 +1,63 @@
+import itertools
+
+import pytest
+
+from bim import DocumentSearcher, TextProcessor
+from conftest import VOCABULARY, open_index, random_documents
+
+
+def closest(tokens, entities):
+    """
+    Smallest span between the first and last of a set of one occurrence per entity, None if one is missing
+    """
+    positions = [[p for p, token in enumerate(tokens) if token == entity] for entity in entities]
+    if not all(positions):
+        return None
+    return min(max(combination) - min(combination) for combination in itertools.product(*positions))
+
+
+@pytest.mark.parametrize('num_entities', [2, 3])
+def test_closest_windows_match_brute_force(rng, num_entities):
+    index = open_index()
+    docs = random_documents(rng, 300, max_length=30)
+    index.add_documents(docs)
+    tokens = [TextProcessor.tokenize(doc['content']) for doc in docs]
+    for _ in range(20):
+        entities = rng.sample(VOCABULARY[:20], num_entities)
+        window_size = rng.choice((2, 5, 10))
+        results = DocumentSearcher.proximal_node_search(index, entities, window_size=window_size, top_k=10000)
+
+        best = {}
+        for result in results:
+            assert result['entities_found'] == entities
+            best[result['id']] = min(best.get(result['id'], window_size + 1), result['distance'])
+        expected = {doc_id: distance for doc_id, distance in
+                    ((doc_id, closest(doc_tokens, entities)) for doc_id, doc_tokens in enumerate(tokens))
+                    if distance is not None and distance <= window_size}
+        assert best == expected
+        keys = [(result['distance'], result['id'], result['position']) for result in results]
+        assert keys == sorted(keys)
+
+
+def test_phrase_entities_keep_word_offsets():
+    index = open_index()
+    index.add_documents([
+        {'title': 'a.txt', 'content': 'The big dog barked at a small cat'},
+        {'title': 'b.txt', 'content': 'A big, 42 dog and a cat'},
+        {'title': 'c.txt', 'content': 'big cat then a dog'},
+    ])
+
+    results = DocumentSearcher.proximal_node_search(index, ['big dog', 'cat'], window_size=10)
+    assert [(result['id'], result['distance'], result['position']) for result in results] == [(0, 6, 1)]
+    assert DocumentSearcher.proximal_node_search(index, ['big dog', 'cat'], window_size=5) == []
+
+    results = DocumentSearcher.proximal_node_search(index, ['big 7 dog', 'cat'], window_size=10)
+    assert [(result['id'], result['distance']) for result in results] == [(1, 5)]
+    assert results[0]['entities_found'] == ['big 7 dog', 'cat']
+
+
+def test_needs_two_distinct_entities():
+    index = open_index()
+    index.add_documents([{'title': 'a.txt', 'content': 'dog dog cat'}])
+    assert DocumentSearcher.proximal_node_search(index, ['dog', 'Dog', '42']) == []
+    assert DocumentSearcher.proximal_node_search(index, ['dog', 'cat'], top_k=0) == []
@@ -0,0 +1,117 @@
+import math
+from collections import Counter
+
+import pytest
+
+from boolean import tokenize_document
+from conftest import VOCABULARY, WhitespaceRanker, open_index, random_documents
+from metrics import end_trace, start_trace
+
+
+@pytest.fixture
+def corpus(rng):
+    """
+    Ranker over four segments, two of them merged, with deleted documents; plus the documents and deleted ids
+    """
+    index = open_index()
+    docs = random_documents(rng, 1600)
+    for start in range(0, len(docs), 400):
+        index.add_documents(docs[start:start + 400])
+    deleted = set(rng.sample(range(len(docs)), 300))
+    index.delete_documents(sorted(deleted))
+    index.merge_segments(index.latest(), 2, 4)
+    return WhitespaceRanker(index), docs, deleted
+
+
+def queries(rng, count):
+    # Frequent terms first, so queries mix long and short postings and repeat terms
+    return [' '.join(rng.choices(VOCABULARY[:30], k=rng.randint(1, 5))) for _ in range(count)]
+
+
+@pytest.mark.parametrize('model', ['bm25', 'calculate_tf_idf'])
+@pytest.mark.parametrize('top_k', [1, 10, 50])
+def test_maxscore_top_k_matches_exhaustive_ranking(rng, corpus, model, top_k):
+    ranker = corpus[0]
+    for query in queries(rng, 60):
+        exhaustive = getattr(ranker, model)(query, top_k=None)
+        pruned = getattr(ranker, model)(query, top_k=top_k)
+        scores = dict(exhaustive)
+
+        assert len(pruned) == min(top_k, len(exhaustive))
+        # Documents may only differ among equal scores at the cut
+        assert [score for _, score in pruned] == pytest.approx([score for _, score in exhaustive[:top_k]])
+        for doc_id, score in pruned:
+            assert scores[doc_id] == pytest.approx(score)
+
+
+@pytest.mark.parametrize('model', ['bm25', 'calculate_tf_idf'])
+def test_exhaustive_scores_match_brute_force(rng, corpus, model):
+    ranker, docs, deleted = corpus
+    live = [tokenize_document(doc['content']) for doc_id, doc in enumerate(docs) if doc_id not in deleted]
+    live_ids = [doc_id for doc_id in range(len(docs)) if doc_id not in deleted]
+    avg_length = sum(map(len, live)) / len(live)
+    for query in queries(rng, 20):
+        expected = {}
+        for keyword, weight in Counter(tokenize_document(query)).items():
+            df = sum(keyword in tokens for tokens in live)
+            for doc_id, tokens in zip(live_ids, live):
+                tf = tokens.count(keyword)
+                if not tf:
+                    continue
+                if model == 'bm25':
+                    idf = math.log(1 + (len(live) - df + 0.5) / (df + 0.5))
+                    norm = ranker.K1 * (1 - ranker.B + ranker.B * len(tokens) / avg_length)
+                    score = idf * tf * (ranker.K1 + 1) / (tf + norm)
+                else:
+                    score = tf / len(tokens) * math.log(len(live) / df)
+                expected[doc_id] = expected.get(doc_id, 0.0) + weight * score
+        ranked = getattr(ranker, model)(query, top_k=None)
+        assert dict(ranked) == pytest.approx({doc_id: score for doc_id, score in expected.items() if score > 0})
+        assert ranked == sorted(ranked, key=lambda hit: (-hit[1], hit[0]))
+
+
+def test_keyword_matching_counts_occurrences(rng, corpus):
+    ranker, docs, deleted = corpus
+    for query in queries(rng, 20):
+        keywords = tokenize_document(query)
+        counts = {doc_id: sum(tokenize_document(doc['content']).count(keyword) for keyword in keywords)
+                  for doc_id, doc in enumerate(docs) if doc_id not in deleted}
+        expected = sorted(((doc_id, n) for doc_id, n in counts.items() if n), key=lambda hit: (-hit[1], hit[0]))
+        assert ranker.keyword_matching(query) == expected
+        assert ranker.keyword_matching(query, top_k=5) == expected[:5]
+
+
+@pytest.mark.parametrize('model', ['bm25', 'calculate_tf_idf'])
+def test_statistics_follow_new_batches(rng, model):
+    docs = random_documents(rng, 600)
+    index = open_index()
+    ranker = WhitespaceRanker(index)
+    index.add_documents(docs[:300])
+    getattr(ranker, model)('ba be', top_k=None)  # Precompute statistics of the first version
+    index.add_documents(docs[300:])
+
+    whole = open_index()
+    whole.add_documents(docs)
+    for query in queries(rng, 20):
+        expected = dict(getattr(WhitespaceRanker(whole), model)(query, top_k=None))
+        assert dict(getattr(ranker, model)(query, top_k=None)) == pytest.approx(expected)
+
+
+def test_maxscore_skips_postings_blocks(rng):
+    # A term in every document and a rare one in the first documents only: once the
+    # rare term's matches fill the top k, the common term's later blocks are never decoded
+    docs = [{'title': f'doc{i}.txt',
+             'content': 'ba ' * rng.randint(1, 3) + ('kux' if i < 1000 and i % 50 == 0 else 'be')}
+            for i in range(5000)]
+    index = open_index()
+    index.add_documents(docs)
+    ranker = WhitespaceRanker(index)
+
+    touched = {}
+    for top_k in (None, 10):
+        trace = start_trace('bm25')
+        ranker.bm25('ba kux', top_k=top_k)
+        end_trace()
+        touched[top_k] = trace.counters['postings_touched']
+    assert touched[None] == 5000 + 20
+    assert touched[10] < touched[None] / 3
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+
+import nltk
+import pytest
+
+import resources
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(nltk.data, 'path', [str(tmp_path)])
+    return tmp_path
+
+
+def test_missing_resources_are_reported_not_downloaded(data_path, monkeypatch):
+    def download(*args, **kwargs):
+        raise AssertionError("Resources must never be downloaded implicitly")
+
+    monkeypatch.setattr(nltk, 'download', download)
+    assert resources.check() == dict.fromkeys(resources.REQUIRED)
+    report = resources.warm_up()
+    assert [entry['resource'] for entry in report] == list(resources.LOADERS)
+    assert {entry['status'] for entry in report} == {'missing'}
+
+
+def test_locate_accepts_either_layout(data_path):
+    (data_path / 'taggers' / 'averaged_perceptron_tagger').mkdir(parents=True)
+    assert resources.locate('tagger') == str(data_path / 'taggers' / 'averaged_perceptron_tagger')
+    (data_path / 'taggers' / 'averaged_perceptron_tagger_eng').mkdir()
+    assert resources.locate('tagger').rstrip('/') == str(data_path / 'taggers' / 'averaged_perceptron_tagger_eng')
+
+
+def test_server_imports_without_downloads(tmp_path):
+    script = (
+        "import nltk\n"
+        "def download(*args, **kwargs):\n"
+        "    raise SystemExit('download attempted')\n"
+        "nltk.download = download\n"
+        "import server\n"
+    )
+    env = dict(os.environ, NLTK_DATA=str(tmp_path / 'nltk_data'), INDEX_DIR=str(tmp_path / 'index'))
+    completed = subprocess.run([sys.executable, '-c', script], cwd=SERVER_DIR, env=env,
+                               capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
@@ -0,0 +1,79 @@
+import pytest
+
+from conftest import open_index
+from results import DEFAULT_K, MAX_K, format_hits, get_page, make_snippet, select_page, select_top
+
+
+@pytest.mark.parametrize('data,page', [
+    ({}, (DEFAULT_K, 0)),
+    ({'k': 5, 'offset': 20}, (5, 20)),
+    ({'k': '7', 'offset': '3'}, (7, 3)),
+    ({'k': 0}, (0, 0)),
+    ({'k': MAX_K + 1}, (MAX_K, 0)),
+])
+def test_get_page(data, page):
+    assert get_page(data) == page
+
+
+@pytest.mark.parametrize('data', [
+    {'k': 'ten'},
+    {'offset': None},
+    {'k': [10]},
+    {'k': '1.5'},
+    {'k': -1},
+    {'offset': -10},
+])
+def test_get_page_rejects_invalid_values(data):
+    with pytest.raises(ValueError):
+        get_page(data)
+
+
+def test_select_top_orders_by_score_then_document(rng):
+    scored = [(doc_id, float(rng.randint(0, 5))) for doc_id in rng.sample(range(500), 200)]
+    ranked = sorted(scored, key=lambda hit: (-hit[1], hit[0]))
+    for k, offset in [(10, 0), (10, 15), (0, 0), (300, 0), (5, 198)]:
+        assert select_top(iter(scored), k, offset) == ranked[offset:offset + k]
+
+
+def test_select_page_stops_at_the_page():
+    consumed = []
+
+    def doc_ids():
+        for doc_id in range(100):
+            consumed.append(doc_id)
+            yield doc_id
+
+    assert select_page(doc_ids(), 3, 4) == [(4, None), (5, None), (6, None)]
+    assert len(consumed) <= 8
+    assert select_page([1, 2], 10, 5) == []
+
+
+@pytest.fixture
+def index():
+    index = open_index()
+    filler = ' '.join(f'w{i}' for i in range(100))
+    index.add_documents([
+        {'title': 'long.txt', 'content': f'{filler} Needle, in a haystack! needle {filler}'},
+        {'title': 'short.txt', 'content': 'a short needle text'},
+        {'title': 'miss.txt', 'content': ' '.join(f'w{i}' for i in range(50))},
+    ])
+    return index
+
+
+def test_snippet_centres_on_the_query_terms(index):
+    snippet = make_snippet(index, 'terms', 0, 'needle haystack', words=10)
+    assert snippet.startswith('... ') and snippet.endswith(' ...')
+    words = snippet.split()[1:-1]
+    assert len(words) == 10
+    assert 'Needle,' in words and 'haystack!' in words and 'needle' in words
+
+    assert make_snippet(index, 'terms', 1, 'needle', words=10) == 'a short needle text'
+    assert make_snippet(index, 'terms', 2, 'needle', words=4) == 'w0 w1 w2 w3 ...'
+
+
+def test_format_hits_omits_content(index):
+    hits = format_hits(index, [(1, 2.5), (2, None)], 'needle')
+    assert hits == [
+        {'id': 1, 'title': 'short.txt', 'snippet': 'a short needle text', 'score': 2.5},
+        {'id': 2, 'title': 'miss.txt', 'snippet': make_snippet(index, 'terms', 2, 'needle')},
+    ]
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from segment import (POSTINGS_BLOCK, FieldSegment, build_field, compact, decode_tokens, encode_tokens,
+                     merge_token_arrays, pack_arrays, select_tokens, unpack_arrays)
+
+
+def single_term_segment(rng, df, num_docs=1000):
+    """
+    Segment where 'x' occurs in df random documents with widely varying frequencies
+    """
+    docs = sorted(rng.sample(range(num_docs), df))
+    tfs = [rng.choice((1, 2, 3, 70, 300)) for _ in docs]
+    token_lists = [['pad'] * rng.randint(0, 5) for _ in range(num_docs)]
+    for doc, tf in zip(docs, tfs):
+        token_lists[doc] += ['x'] * tf
+    return build_field(encode_tokens(token_lists), positional=True), docs, tfs, token_lists
+
+
+@pytest.mark.parametrize('df', [1, POSTINGS_BLOCK - 1, POSTINGS_BLOCK, POSTINGS_BLOCK + 1,
+                                2 * POSTINGS_BLOCK, 2 * POSTINGS_BLOCK + 1, 700])
+def test_postings_round_trip_across_block_boundaries(rng, df):
+    arrays, docs, tfs, token_lists = single_term_segment(rng, df)
+    segment = FieldSegment(0, arrays)
+    term_id = segment.term_id('x')
+
+    decoded_docs, decoded_tfs = segment.postings(term_id)
+    assert decoded_docs.tolist() == docs
+    assert decoded_tfs.tolist() == tfs
+    assert segment.doc_ids(term_id).tolist() == docs
+
+    blocks = [segment.block_postings(term_id, rank) for rank in range(-(-df // POSTINGS_BLOCK))]
+    assert np.concatenate([block_docs for block_docs, _ in blocks]).tolist() == docs
+    assert np.concatenate([block_tfs for _, block_tfs in blocks]).tolist() == tfs
+
+    start = int(segment.postings_ptr[term_id])
+    rank = {doc: start + i for i, doc in enumerate(docs)}
+    assert segment.lookup(term_id, np.arange(1000)).tolist() == [rank.get(i, -1) for i in range(1000)]
+
+    sample = docs[::max(1, df // 10)]
+    for doc in sample:
+        assert segment.get_positions(term_id, doc) == [p for p, token in enumerate(token_lists[doc]) if token == 'x']
+
+
+@pytest.mark.parametrize('df', [1, POSTINGS_BLOCK, POSTINGS_BLOCK + 1, 700])
+def test_block_bounds_cover_every_block(rng, df):
+    arrays, docs, tfs, token_lists = single_term_segment(rng, df)
+    segment = FieldSegment(0, arrays)
+    last, max_tfs, min_lengths = segment.block_bounds(segment.term_id('x'))
+
+    starts = range(0, df, POSTINGS_BLOCK)
+    assert last.tolist() == [docs[min(start + POSTINGS_BLOCK, df) - 1] for start in starts]
+    assert max_tfs.tolist() == [max(tfs[start:start + POSTINGS_BLOCK]) for start in starts]
+    assert min_lengths.tolist() == [min(len(token_lists[doc]) for doc in docs[start:start + POSTINGS_BLOCK])
+                                    for start in starts]
+
+    # Segments written before blocks carried bounds derive the same values
+    older = {name: values for name, values in arrays.items() if name not in ('block_max_tf', 'block_min_length')}
+    derived = FieldSegment(0, older).block_bounds(segment.term_id('x'))
+    for stored, computed in zip((last, max_tfs, min_lengths), derived):
+        assert stored.tolist() == computed.tolist()
+
+
+def test_legacy_segments_read_uncompressed_postings(rng):
+    arrays, docs, tfs, _ = single_term_segment(rng, 2 * POSTINGS_BLOCK + 5)
+    compressed = FieldSegment(0, arrays)
+    legacy_docs, legacy_tfs = compressed.all_postings()
+    legacy = {name: values for name, values in arrays.items()
+              if name not in ('block_ptr', 'block_last', 'block_max_tf', 'block_min_length', 'block_offsets',
+                              'doc_widths', 'tf_widths', 'postings_bytes')}
+    legacy.update(postings_docs=legacy_docs, postings_tfs=legacy_tfs)
+    segment = FieldSegment(0, legacy)
+    assert not segment.compressed
+
+    term_id = segment.term_id('x')
+    assert segment.postings(term_id)[0].tolist() == docs
+    assert np.concatenate([segment.block_postings(term_id, rank)[1] for rank in range(3)]).tolist() == tfs
+    assert segment.block_bounds(term_id)[1].tolist() == compressed.block_bounds(term_id)[1].tolist()
+
+
+@pytest.mark.parametrize('maximum,dtype', [(0, np.uint8), (255, np.uint8), (256, np.uint16),
+                                           (65536, np.uint32), (1 << 32, np.int64)])
+def test_compact_picks_the_smallest_dtype(maximum, dtype):
+    values = compact(np.array([0, maximum], dtype=np.int64))
+    assert values.dtype == dtype
+    assert values.tolist() == [0, maximum]
+    assert compact(np.zeros(0, dtype=np.int64)).dtype == np.uint8
+
+
+def test_packed_arrays_are_viewed_in_place():
+    arrays = {'small': compact(np.arange(5)), 'wide': np.arange(3, dtype=np.int64), 'empty': np.zeros(0, np.uint16)}
+    buffer = pack_arrays(arrays, {'num_docs': 5})
+    meta, unpacked = unpack_arrays(buffer)
+    assert meta == {'num_docs': 5}
+    for name, values in arrays.items():
+        assert unpacked[name].dtype == values.dtype and unpacked[name].tolist() == values.tolist()
+        assert not unpacked[name].flags.owndata
+
+
+def test_token_arrays_round_trip():
+    batches = [[['ba', 'be', ''], ['be']], [[], ['bi', 'ba', 'ba']]]
+    encoded = [encode_tokens(batch) for batch in batches]
+    assert encoded[0].vocabulary == ['ba', 'be']
+    merged = merge_token_arrays(encoded)
+    assert decode_tokens(merged) == batches[0] + batches[1]
+    assert decode_tokens(select_tokens(merged, [3, 0, 3])) == [['bi', 'ba', 'ba'], ['ba', 'be', ''], ['bi', 'ba', 'ba']]
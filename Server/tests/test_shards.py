@@ -0,0 +1,123 @@
+import pytest
+
+import shards
+from bim import DocumentSearcher
+from boolean import process_query, tokenize_document
+from conftest import VOCABULARY, WhitespaceRanker, open_index, random_documents
+from ranker import DocumentRanker
+from shards import ShardedIndex, ShardsUnavailable, shard_of
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    """
+    Start ShardedIndex instances whose workers analyze like the test index; closed after the test
+    """
+    # Shard processes are forked from here, so they inherit the patched analyzers
+    monkeypatch.setitem(shards.SHARD_ANALYZERS, DocumentRanker.FIELD, tokenize_document)
+    monkeypatch.setattr(DocumentRanker, 'preprocess_text', staticmethod(tokenize_document))
+    started = []
+
+    def start(num_shards):
+        started.append(ShardedIndex(num_shards))
+        return started[-1]
+    yield start
+    for index in started:
+        index.close()
+
+
+@pytest.fixture
+def corpus(rng):
+    index = open_index()
+    docs = random_documents(rng, 600, max_length=25)
+    for start in range(0, 400, 200):
+        index.add_documents(docs[start:start + 200])
+    return index, docs
+
+
+def queries(rng, count):
+    return [' '.join(rng.choices(VOCABULARY[:40], k=rng.randint(1, 4))) for _ in range(count)]
+
+
+def assert_same_results(rng, sharded_index, index):
+    ranker = WhitespaceRanker(index)
+    version = index.version
+    for query in queries(rng, 15):
+        for model in ('bm25', 'calculate_tf_idf'):
+            expected = getattr(ranker, model)(query, top_k=None)
+            hits = getattr(sharded_index, model)(query, top_k=None, version=version)
+            assert dict(hits) == pytest.approx(dict(expected)), (model, query)
+            assert [doc_id for doc_id, _ in hits[:10]] == [doc_id for doc_id, _ in expected[:10]]
+        assert sharded_index.binary_term_matching(query, top_k=10, version=version) == \
+            pytest.approx(DocumentSearcher.binary_term_matching(index, query, top_k=10))
+    for query in ['ba and not be', '(bi or bo) and ka', 'b*', '"ba be"', 'not du']:
+        assert sharded_index.process_query(query, version=version) == process_query(query, index)
+
+
+def test_shard_of_spreads_consecutive_ids():
+    counts = [0] * 4
+    for doc_id in range(4000):
+        counts[shard_of(doc_id, 4)] += 1
+    assert min(counts) > 900
+    assert {shard_of(doc_id, 1) for doc_id in range(100)} == {0}
+
+
+def test_mirror_matches_unsharded_models(rng, sharded, corpus):
+    index, docs = corpus
+    sharded_index = sharded(3)
+    sharded_index.mirror(index)
+    assert sharded_index.holds(index.version)
+    assert_same_results(rng, sharded_index, index)
+
+    # Later commits, deletes and merges reach the shards through the listeners
+    index.add_documents(docs[400:], replace=[5, 6])
+    index.delete_documents(rng.sample(range(600), 80))
+    index.merge_segments(index.latest(), 0, 2)
+    assert sharded_index.holds(index.version)
+    assert len(sharded_index) == len(index)
+    assert_same_results(rng, sharded_index, index)
+
+
+def test_queries_pinned_to_another_version_are_refused(rng, sharded, corpus):
+    index = corpus[0]
+    sharded_index = sharded(2)
+    sharded_index.mirror(index)
+    with index.pinned():
+        old = index.version
+        index.add_documents(random_documents(rng, 5))
+        with pytest.raises(ShardsUnavailable):
+            sharded_index.bm25('ba', version=old)
+        with pytest.raises(ShardsUnavailable):
+            sharded_index.process_query('ba', version=old)
+    assert sharded_index.wait_for(index.version, timeout=1)
+    assert not sharded_index.wait_for(index.version + 1, timeout=0.01)
+    assert sharded_index.bm25('ba', version=index.version)
+
+
+def test_lost_shard_is_rebuilt_at_the_next_commit(rng, sharded, corpus):
+    index, docs = corpus
+    sharded_index = sharded(2)
+    sharded_index.mirror(index)
+    process = sharded_index._processes[1]
+    process.kill()
+    process.join()
+
+    with pytest.raises(ShardsUnavailable):
+        sharded_index.bm25('ba', version=index.version)
+    assert not sharded_index.holds(index.version)
+    with pytest.raises(ShardsUnavailable):
+        sharded_index.bm25('ba', version=index.version)
+
+    index.add_documents(docs[400:])
+    assert sharded_index.rebuilds == 1
+    assert sharded_index.holds(index.version)
+    assert_same_results(rng, sharded_index, index)
+
+
+def test_add_documents_rejects_taken_ids(sharded):
+    sharded_index = sharded(2)
+    assert sharded_index.add_documents([{'title': 'a', 'content': 'ba'}] * 3) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        sharded_index.add_documents([{'title': 'b', 'content': 'be'}], [1])
+    assert sharded_index.delete_documents([1, 7]) == 1
+    assert sharded_index.process_query('ba') == [0, 2]
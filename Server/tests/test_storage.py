@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from conftest import ANALYZERS, POSITIONAL, assert_postings_match, open_index, random_documents
+from index import CorpusIndex
+from storage import MANIFEST
+
+
+def refuse(content):
+    raise AssertionError("A reopened index must not analyze documents again")
+
+
+def test_reopened_index_reads_segments_without_analyzing(rng, tmp_path):
+    path = str(tmp_path / 'index')
+    index = open_index(path)
+    docs = random_documents(rng, 400)
+    for start in range(0, len(docs), 100):
+        index.add_documents(docs[start:start + 100])
+
+    reopened = CorpusIndex(dict.fromkeys(ANALYZERS, refuse), positional=POSITIONAL, path=path, merge_policy=None)
+    assert reopened.version == index.version
+    assert [segment.name for segment in reopened.segments] == [segment.name for segment in index.segments]
+    assert list(reopened.documents) == docs
+    assert_postings_match(reopened, docs, set())
+
+    # Writing continues after the stored segments
+    more = random_documents(rng, 10)
+    appended = open_index(path)
+    assert appended.add_documents(more) == list(range(400, 410))
+    assert_postings_match(open_index(path), docs + more, set())
+
+
+def test_open_removes_files_the_manifest_does_not_reference(rng, tmp_path):
+    path = str(tmp_path / 'index')
+    index = open_index(path)
+    index.add_documents(random_documents(rng, 20))
+    for filename in ('seg_000099.seg', 'seg_000099.docs', MANIFEST + '.tmp'):
+        with open(os.path.join(path, filename), 'wb') as f:
+            f.write(b'partial')
+
+    reopened = open_index(path)
+    assert sorted(os.listdir(path)) == ['manifest.json', 'seg_000000.docs', 'seg_000000.seg']
+    assert len(reopened) == 20
+
+
+def test_open_rejects_an_index_with_other_fields(rng, tmp_path):
+    path = str(tmp_path / 'index')
+    open_index(path).add_documents(random_documents(rng, 5))
+    with pytest.raises(ValueError):
+        CorpusIndex(ANALYZERS, positional=[], path=path, merge_policy=None)
@@ -0,0 +1,51 @@
+import pytest
+from nltk.corpus import wordnet
+
+from boolean import FIELD as WORD_FIELD
+from conftest import open_index
+from synonyms import SynonymExpander
+
+try:
+    wordnet.ensure_loaded()
+except LookupError:
+    pytest.skip("WordNet data is not installed", allow_module_level=True)
+
+WORDS = ['car', 'automobile', 'auto', 'dog', 'domestic_dog', 'cat', 'banana']
+
+
+@pytest.fixture
+def field():
+    index = open_index()
+    index.add_documents([{'title': f'{word}.txt', 'content': word} for word in WORDS])
+    return index.field(WORD_FIELD)
+
+
+def test_expansion_is_restricted_to_indexed_terms(field):
+    expander = SynonymExpander()
+    assert expander.expand(['car'], field) == ['auto', 'automobile', 'car']
+    assert expander.expand(['banana', 'zebra'], field) == ['banana']
+
+
+def test_precomputed_table_expands_like_wordnet(field):
+    on_demand = SynonymExpander()
+    warmed_up = SynonymExpander()
+    warmed_up.warm_up(field.vocabulary())
+    assert warmed_up.warmed_up
+    for word in WORDS + ['cars', 'dogs', 'zebra']:
+        assert warmed_up.expand([word], field) == on_demand.expand([word], field), word
+
+
+def test_table_follows_added_vocabulary(field):
+    expander = SynonymExpander()
+    expander.warm_up(['car'])
+    assert expander.synonyms('automobile') == {'car'}
+    expander.add_vocabulary(['automobile', 'car'])
+    assert expander.synonyms('automobile') == {'car', 'automobile'}
+
+
+def test_on_demand_cache_is_bounded():
+    expander = SynonymExpander(max_entries=2)
+    for word in ('car', 'dog', 'cat', 'dog'):
+        expander.synonyms(word)
+    assert len(expander._cache) == 2
+    assert (expander.hits, expander.misses) == (1, 3)
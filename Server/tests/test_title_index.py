@@ -0,0 +1,82 @@
+import pytest
+
+from conftest import open_index
+from title_index import MODES, TitleIndex
+
+
+def is_word_start(title, start):
+    return title[start].isalnum() and (start == 0 or not title[start - 1].isalnum())
+
+
+CHECKS = {
+    'substring': lambda title, query: query in title,
+    'prefix': lambda title, query: title.startswith(query),
+    'word': lambda title, query: any(title.startswith(query, start) and is_word_start(title, start)
+                                     for start in range(len(title))),
+}
+
+
+def random_title(rng):
+    words = [''.join(rng.choices('abc', k=rng.randint(1, 4))) for _ in range(rng.randint(1, 3))]
+    title = rng.choice((' ', '-', '_', '.')).join(words)
+    return title.upper() if rng.random() < 0.2 else title
+
+
+@pytest.fixture
+def corpus(rng):
+    """
+    Title index following a corpus with deletes and a merge, plus the titles and deleted ids
+    """
+    index = open_index()
+    titles_index = TitleIndex(index)
+    index.add_listener(titles_index.add_segment)
+    index.add_merge_listener(titles_index.replace_segments)
+    titles = [random_title(rng) for _ in range(600)] + ['xa a a', 'Résumé.pdf', 'a']
+    for start in range(0, len(titles), 150):
+        index.add_documents([{'title': title, 'content': 'ba'} for title in titles[start:start + 150]])
+    deleted = set(rng.sample(range(len(titles)), 100))
+    index.delete_documents(sorted(deleted))
+    index.merge_segments(index.latest(), 1, 3)
+    return titles_index, titles, deleted
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_modes_match_brute_force(rng, corpus, mode):
+    titles_index, titles, deleted = corpus
+    queries = ['', 'a', 'b-', 'A B', 'a a', 'sumé', 'é', 'abc.c'] + [random_title(rng)[:rng.randint(1, 6)]
+                                                                        for _ in range(60)]
+    for query in queries:
+        expected = [doc_id for doc_id, title in enumerate(titles)
+                    if doc_id not in deleted and CHECKS[mode](title.lower(), query.lower())]
+        assert titles_index.search(query, mode, k=len(titles)) == expected, query
+        assert titles_index.search(query, mode, k=5, offset=3) == expected[3:8], query
+
+
+def test_unknown_mode(corpus):
+    with pytest.raises(ValueError):
+        corpus[0].search('a', mode='regex')
+
+
+def test_find_is_exact_and_case_sensitive(corpus):
+    titles_index, titles, deleted = corpus
+    for title in ['a', 'xa a a', 'Résumé.pdf', 'RÉSUMÉ.PDF', titles[10]]:
+        assert titles_index.find(title) == [doc_id for doc_id, other in enumerate(titles)
+                                            if other == title and doc_id not in deleted]
+
+
+def test_autocomplete_ranks_prefix_then_word_then_substring(corpus):
+    titles_index, titles, deleted = corpus
+    suggestions = titles_index.autocomplete('ab', limit=1000)
+    keys = [title.lower() for _, title in suggestions]
+    assert len(keys) == len(set(keys))
+
+    def tier(title):
+        title = title.lower()
+        return 0 if title.startswith('ab') else 1 if CHECKS['word'](title, 'ab') else 2
+    ranked = [(tier(title), len(title), doc_id) for doc_id, title in suggestions]
+    assert ranked == sorted(ranked)
+    assert all(doc_id not in deleted and 'ab' in title.lower() for doc_id, title in suggestions)
+    expected = {title.lower() for doc_id, title in enumerate(titles) if doc_id not in deleted and 'ab' in title.lower()}
+    assert set(keys) == expected
+    assert titles_index.autocomplete('ab', limit=3) == suggestions[:3]
+    assert titles_index.autocomplete('  ', limit=3) == []
@@ -0,0 +1,296 @@
+"""
+Character n-gram index over document titles, for substring, prefix and autocomplete title search.
+
+Every lowercased title is indexed by its 1-, 2- and 3-grams, plus the
+first one and two characters of the title and of each word behind a
+start marker. A gram of up to three code points is packed into one
+int64 (21 bits per code point), so each segment's index is a sorted key
+array with CSR postings. Queries of up to three characters (marker
+included) are answered by one exact postings lookup; longer ones
+intersect the postings of their trigrams and verify the candidates
+against the titles.
+"""
+import threading
+from bisect import bisect_right
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import count, stage
+from segment import compact
+
+MAX_GRAM = 3
+
+# Marker code points, prepended to grams at the start of a title / of a word
+TITLE_START = 1
+WORD_START = 2
+
+MODES = ('substring', 'prefix', 'word')
+
+
+def _pack(codepoints: List[int]) -> int:
+    key = 0
+    for shift, codepoint in zip((42, 21, 0), codepoints):
+        key |= codepoint << shift
+    return key
+
+
+def query_keys(text: str) -> Tuple[List[int], bool]:
+    """
+    Gram keys to look up for a (marker-prefixed) query
+
+    :return: (keys, exact) where exact means the postings need no verification
+    """
+    codepoints = [ord(char) for char in text]
+    if len(codepoints) <= MAX_GRAM:
+        return [_pack(codepoints)], True
+    return sorted({_pack(codepoints[i:i + MAX_GRAM]) for i in range(len(codepoints) - MAX_GRAM + 1)}), False
+
+
+def starts_word(title: str, query: str) -> bool:
+    """
+    Whether some word of a lowercased title starts with query
+    """
+    # Every occurrence, overlapping ones included: in "xa a a" the match of "a a" at a word starts second
+    start = title.find(query)
+    while start >= 0:
+        if title[start].isalnum() and (start == 0 or not title[start - 1].isalnum()):
+            return True
+        start = title.find(query, start + 1)
+    return False
+
+
+def build_title_grams(titles: List[str]) -> dict:
+    """
+    Build the gram arrays of a batch of titles (local doc ids 0 .. len(titles) - 1)
+    """
+    lowered = [title.lower() for title in titles]
+    lengths = np.array([len(title) for title in lowered], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    chars = np.frombuffer(''.join(lowered).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    doc_of = np.repeat(np.arange(len(titles), dtype=np.int64), lengths)
+    pos = np.arange(len(chars), dtype=np.int64) - offsets[:-1][doc_of]
+    remaining = lengths[doc_of] - pos  # Characters left in the title from each position
+
+    key_parts, doc_parts = [], []
+    for n in range(1, MAX_GRAM + 1):
+        starts = np.flatnonzero(remaining >= n)
+        keys = chars[starts] << 42
+        if n >= 2:
+            keys |= chars[starts + 1] << 21
+        if n == 3:
+            keys |= chars[starts + 2]
+        key_parts.append(keys)
+        doc_parts.append(doc_of[starts])
+
+    # Word starts: an alphanumeric character at the start of the title or behind a non-alphanumeric one
+    distinct, inverse = np.unique(chars, return_inverse=True)
+    alnum = np.array([chr(codepoint).isalnum() for codepoint in distinct.tolist()], dtype=bool)[inverse]
+    previous_alnum = np.concatenate(([False], alnum[:-1])) & (pos > 0)
+    for marker, mask in ((TITLE_START, pos == 0), (WORD_START, alnum & ~previous_alnum)):
+        starts = np.flatnonzero(mask)
+        key_parts.append((marker << 42) | (chars[starts] << 21))
+        doc_parts.append(doc_of[starts])
+        starts = starts[remaining[starts] >= 2]
+        key_parts.append((marker << 42) | (chars[starts] << 21) | chars[starts + 1])
+        doc_parts.append(doc_of[starts])
+
+    keys = np.concatenate(key_parts) if key_parts else np.zeros(0, dtype=np.int64)
+    docs = np.concatenate(doc_parts) if doc_parts else np.zeros(0, dtype=np.int64)
+    # One posting per distinct (gram, document), grouped by gram in document order
+    order = np.lexsort((docs, keys))
+    keys, docs = keys[order], docs[order]
+    distinct_pair = np.ones(len(keys), dtype=bool)
+    distinct_pair[1:] = (keys[1:] != keys[:-1]) | (docs[1:] != docs[:-1])
+    keys, docs = keys[distinct_pair], docs[distinct_pair]
+    gram_keys, starts = np.unique(keys, return_index=True)
+    return {
+        'keys': gram_keys,
+        'ptr': compact(np.append(starts, len(keys))),
+        'docs': compact(docs),
+        'lengths': compact(lengths),
+    }
+
+
+class TitleSegment:
+    """Title grams of one corpus segment."""
+
+    __slots__ = ('base', 'keys', 'ptr', 'docs', 'lengths')
+
+    def __init__(self, base: int, arrays: dict):
+        self.base = base
+        self.keys = arrays['keys']
+        self.ptr = arrays['ptr']
+        self.docs = arrays['docs']
+        self.lengths = arrays['lengths']
+
+    def postings(self, key: int) -> np.ndarray:
+        """
+        Sorted segment-local ids of the titles containing a gram
+        """
+        i = int(np.searchsorted(self.keys, key))
+        if i == len(self.keys) or self.keys[i] != key:
+            return self.docs[:0]
+        return self.docs[self.ptr[i]:self.ptr[i + 1]]
+
+    def candidates(self, keys: List[int]) -> np.ndarray:
+        """
+        Local ids of the titles containing every gram, rarest gram first
+        """
+        postings = sorted((self.postings(key) for key in keys), key=len)
+        result = postings[0]
+        for docs in postings[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, docs, assume_unique=True)
+        return result
+
+
+class TitleIndex:
+    """
+    N-gram title index kept in step with a CorpusIndex.
+
+    Register add_segment as a corpus listener and replace_segments as a
+    merge listener; segments committed before are indexed on construction.
+    Deleted documents are filtered with the live bitmap of the snapshot
+    being read.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._segments: List[TitleSegment] = []
+        self._lock = threading.Lock()
+        for segment in index.segments:
+            self.add_segment(segment)
+
+    def add_segment(self, segment):
+        self._install(segment, merged=False)
+
+    def replace_segments(self, sources, merged):
+        """
+        Index a merged segment in place of its sources, dropping the grams of its deleted titles
+        """
+        self._install(merged, merged=True)
+
+    def _install(self, segment, merged: bool):
+        titles = [segment.title(local_id) for local_id in range(segment.num_docs)]
+        title_segment = TitleSegment(segment.base, build_title_grams(titles))
+        end = segment.base + segment.num_docs
+        with self._lock:
+            # Copy on write: searches keep iterating the list they started with
+            segments = list(self._segments)
+            position = bisect_right([existing.base for existing in segments], segment.base)
+            if not merged and position and segments[position - 1].base + len(segments[position - 1].lengths) >= end:
+                return  # A merge covering this segment was indexed before its own listener ran
+            first = position - 1 if position and segments[position - 1].base == segment.base else position
+            last = first
+            while last < len(segments) and segments[last].base < end:
+                last += 1
+            segments[first:last] = [title_segment]
+            self._segments = segments
+
+    def _pattern(self, query: str, mode: str) -> Tuple[str, Callable[[str], bool]]:
+        """
+        Marker-prefixed lookup text and the check a candidate title must pass
+        """
+        if mode == 'substring':
+            return query, lambda title: query in title
+        if mode == 'prefix':
+            return chr(TITLE_START) + query, lambda title: title.startswith(query)
+        if mode == 'word':
+            return chr(WORD_START) + query, lambda title: starts_word(title, query)
+        raise ValueError(f"Unknown title search mode: {mode}. Expected one of {', '.join(MODES)}")
+
+    def _matches(self, query: str, mode: str) -> Tuple[np.ndarray, np.ndarray, Optional[Callable[[str], bool]]]:
+        """
+        Candidate doc ids in ascending order with their title lengths
+
+        :return: (doc ids, title lengths, check) where check is None when every candidate matches
+        """
+        text, check = self._pattern(query, mode)
+        keys, exact = query_keys(text)
+        num_docs = len(self.index)
+        id_parts, length_parts = [], []
+        for segment in self._segments:
+            if segment.base >= num_docs:
+                break  # Committed after this request's snapshot
+            local_ids = segment.candidates(keys)
+            id_parts.append(local_ids.astype(np.int64) + segment.base)
+            length_parts.append(segment.lengths[local_ids])
+        if not id_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), None
+        doc_ids, lengths = np.concatenate(id_parts), np.concatenate(length_parts).astype(np.int64)
+        visible = doc_ids < num_docs
+        snapshot = self.index.snapshot()
+        if snapshot.num_live < snapshot.num_docs:
+            visible[visible] = snapshot.live_mask()[doc_ids[visible]]
+        return doc_ids[visible], lengths[visible], None if exact else check
+
+    def search(self, query: str, mode: str = 'substring', k: int = 10, offset: int = 0) -> List[int]:
+        """
+        Ids of the documents whose title matches, in document order
+
+        :param query: Text to find, matched case-insensitively
+        :param mode: 'substring', 'prefix' (title starts with query) or 'word' (a word starts with query)
+        :param k: Number of matches to return
+        :param offset: Number of matches to skip
+        """
+        query = query.lower()
+        if not query:
+            return self.index.live_ids()[offset:offset + k].tolist()
+        with stage('index_lookup'):
+            doc_ids, _, check = self._matches(query, mode)
+        count('postings_touched', len(doc_ids))
+        if check is None:
+            return doc_ids[offset:offset + k].tolist()
+
+        # Verify candidates in document order until the page is full
+        matches = []
+        with stage('score'):
+            for doc_id in doc_ids.tolist():
+                if check(self.index.documents.title(doc_id).lower()):
+                    matches.append(doc_id)
+                    if len(matches) == offset + k:
+                        break
+        return matches[offset:]
+
+    def find(self, title: str) -> List[int]:
+        """
+        Ids of the live documents whose title is exactly title, in document order
+        """
+        if not title:
+            return []
+        doc_ids, _, _ = self._matches(title.lower(), 'prefix')
+        return [doc_id for doc_id in doc_ids.tolist() if self.index.documents.title(doc_id) == title]
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> List[Tuple[int, str]]:
+        """
+        Ranked title suggestions for a partially typed query
+
+        Titles starting with the prefix come first, then titles with a word
+        starting with it, then titles containing it anywhere; within each
+        tier shorter titles rank first, then document order. Titles that
+        differ only in case are suggested once.
+
+        :return: (doc_id, title) pairs, best first
+        """
+        prefix = prefix.lower().strip()
+        if not prefix or limit <= 0:
+            return []
+        suggestions, seen = [], set()
+        for mode in ('prefix', 'word', 'substring'):
+            with stage('index_lookup'):
+                doc_ids, lengths, check = self._matches(prefix, mode)
+            count('postings_touched', len(doc_ids))
+            with stage('top_k'):
+                ranked = doc_ids[np.lexsort((doc_ids, lengths))].tolist()
+            for doc_id in ranked:
+                title = self.index.documents.title(doc_id)
+                key = title.lower()
+                if key in seen or (check is not None and not check(key)):
+                    continue
+                seen.add(key)
+                suggestions.append((doc_id, title))
+                if len(suggestions) == limit:
+                    return suggestions
+        return suggestions